@@ -1,3 +1,4 @@
+import sys
 from pathlib import Path
 from picture_db import PictureDb
 from picture_patches import PictureDbPatches
@@ -10,21 +11,45 @@ BASE_FOLDER = Path("d:/pictures/pictures")
 
 
 def run_delete_tables():
+    picdb.delete_table("selections")
+    picdb.delete_table("picture_days")
+    picdb.delete_table("ingest_failures")
+    picdb.delete_table("ingest_runs")
+    picdb.delete_table("exif_makernotes")
+    picdb.delete_table("signatures")
+    picdb.delete_table("picture_payloads")
+    picdb.delete_table("thumbnails")
     picdb.delete_table("reviews")
     picdb.delete_table("locations")
     picdb.delete_table("files")
+    picdb.delete_table("folders")
     picdb.delete_table("pictures")
 
 
 def run_create_tables():
     picdb.create_pictures_table()
+    picdb.create_thumbnails_table()
+    picdb.create_payloads_table()
+    picdb.create_folders_table()
     picdb.create_files_table()
+    picdb.create_files_indexes()
     picdb.create_locations_table()
     picdb.create_reviews_table()
+    picdb.create_makernotes_table()
+    picdb.create_signatures_table()
+    picdb.create_ingest_runs_table()
+    picdb.create_ingest_failures_table()
+    picdb.create_selections_table()
+    picdb.create_picture_days_table()
 
 
-def run_fill_pic_base():
-    picdb.store_pictures_base_folder(BASE_FOLDER)
+def run_create_ingest_tables():
+    picdb.create_ingest_runs_table()
+    picdb.create_ingest_failures_table()
+
+
+def run_fill_pic_base(resume=False):
+    picdb.store_pictures_base_folder(BASE_FOLDER, resume=resume)
 
 
 def run_merge_pictures():
@@ -33,11 +58,12 @@ def run_merge_pictures():
     picdb.select_pics_for_merge(source_folder, destination_folder)
 
 
-def run_update_picbase():
-    picdb.check_and_add_files(BASE_FOLDER)
+def run_update_picbase(resume=False):
+    picdb.check_and_add_files(BASE_FOLDER, resume=resume)
     # WARNING: below method should be run carefully. Check the database
     # which pictures will be deleted by runnning sql:
-    # select picture_id, file_path, file_name from files where not file_checked;
+    # select f.picture_id, fo.path, f.file_name from files f
+    # join folders fo on fo.id = f.folder_id where not f.file_checked;
     # picdb.check_and_remove_non_existing_files()
 
 
@@ -56,16 +82,74 @@ def run_remove_pics(method="md5", start_id=None, end_id=None):
         picdb.remove_duplicate_pics(deleted_folder, method=method)
 
 
-def run_pic_gis(json_file):
+def run_save_selection(name, condition):
+    """store the pictures meeting the sql condition as a named selection, that can
+    be shown with: python pyqt_picture.py [db_filter] name
+    """
+    count = picdb.save_selection_where(name, condition)
+    print(f"selection {name}: {count} pictures")
+
+
+def run_pic_gis(json_file=None, selection=None):
     if json_file:
         picdb.populate_locations_table(json_filename=json_file)
 
+    elif selection:
+        picdb.populate_locations_table(selection=selection)
+
     else:
         picdb.populate_locations_table()
 
 
-def run_update_rotate_checked(json_file):
-    picdb_patches.update_rotate_checked(json_file)
+def run_update_rotate_checked(selection):
+    picdb_patches.update_rotate_checked(selection=selection)
+
+
+def run_add_exif_raw_column():
+    picdb_patches.add_exif_raw_column()
+
+
+def run_compress_exif():
+    # once for an existing database: picdb_patches.add_exif_codec_column()
+    picdb_patches.compress_exif()
+
+
+def run_resign_pictures(version):
+    # once for an existing database: picdb_patches.add_signature_version()
+    picdb_patches.resign_pictures(version)
+    # when complete: picdb_patches.promote_signatures(version)
+
+
+def run_reencode_thumbnails():
+    # once for an existing database: picdb_patches.add_thumbnail_codec_column()
+    picdb_patches.reencode_thumbnails()
+
+
+def run_split_payloads():
+    # once for an existing database: picdb.create_thumbnails_table() and
+    # picdb.create_payloads_table()
+    picdb_patches.split_payloads()
+
+
+def run_dedup_thumbnails():
+    # once for a payloads table with thumbnails: picdb_patches.add_thumbnail_hash_column()
+    picdb_patches.dedup_thumbnails()
+
+
+def run_normalize_thumbnails():
+    # once for an existing database: picdb_patches.add_thumbnail_normalized_column()
+    picdb_patches.normalize_thumbnails()
+
+
+def run_normalize_folders():
+    # once for an existing database: picdb.create_folders_table() and
+    # picdb_patches.add_folder_id_column()
+    picdb_patches.normalize_folders()
+
+
+def run_rebuild_picture_days():
+    # once for an existing database: picdb.create_picture_days_table()
+    picdb.rebuild_picture_days()
 
 
 def run_replace_picture():
@@ -122,17 +206,22 @@ def run_replace_picture_md5():
 
 if __name__ == "__main__":
     # TODO note there is a bug in file create date, sets to 1980-01-01
+    # python picbase.py --resume continues an interrupted run from its checkpoint
+    resume = "--resume" in sys.argv[1:]
 
     # regular functions
     # run_merge_pictures()
-    run_update_picbase()
+    run_update_picbase(resume=resume)
 
     # special tools and patches
     # run_delete_tables()
     # run_create_tables()
     # run_delete_reviews_table()
-    # run_fill_pic_base()
+    # run_fill_pic_base(resume=resume)
     # run_remove_pics(method='md5')  # method='md4' or 'date'
     # run_replace_picture()
-    # run_pic_gis('') # 'id_with_location_013.json')
-    # run_update_rotate_checked('ids.json')
+    # run_save_selection(
+    #     "to_check", "gps_latitude ->> 'ref' in ('N', 'S') and not rotate_checked"
+    # )
+    # run_pic_gis(selection='to_check')
+    # run_update_rotate_checked('to_check')
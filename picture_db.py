@@ -1,18 +1,27 @@
 from enum import Enum
+from collections import OrderedDict
+from contextlib import contextmanager
+import copy
 import shutil
 import datetime
-import io
+import inspect
+import itertools
 import json
 import os
 import re
+import threading
 import psutil
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from decouple import config
 from functools import wraps
 from shapely.geometry import Point
 import psycopg2
+from psycopg2.extras import execute_values
 from geopy.geocoders import Nominatim
-from picture_exif import Exif
+from picture_exif import Exif, THUMBNAIL_SETTINGS, file_signature
+from picture_scanner import FolderScanner
+from picture_pipeline import IngestPipeline
+from picture_decoder import DecodePool
 from Utils.plogger import Logger
 
 logformat = "%(asctime)s:%(levelname)s:%(message)s"
@@ -30,6 +39,7 @@ class DbFilter(Enum):
 geolocator = Nominatim(user_agent="picture_db")
 EPSG_WGS84 = 4326
 exif = Exif()
+scanner = FolderScanner(max_workers=config("SCAN_WORKERS", default=8, cast=int))
 
 
 @dataclass
@@ -47,6 +57,44 @@ class PicturesTable:
     exif: dict
     rotate: int
     rotate_checked: bool
+    exif_raw: bytes
+    exif_codec: str
+    signature_version: int
+    thumbnail_codec: str
+    # names of the fields changed since loading, set last so the fields set by
+    # __init__ are not tracked
+    dirty: set = field(default_factory=set, repr=False, compare=False)
+
+    def __setattr__(self, name, value):
+        if (
+            name != "dirty"
+            and "dirty" in self.__dict__
+            and self.__dict__.get(name) != value
+        ):
+            self.dirty.add(name)
+
+        super().__setattr__(name, value)
+
+    def __copy__(self):
+        pic_meta = PicturesTable.__new__(PicturesTable)
+        pic_meta.__dict__.update(self.__dict__)
+        pic_meta.__dict__["dirty"] = set(self.dirty)
+        return pic_meta
+
+    @property
+    def exif_tags(self):
+        """full exif tag dict, pictures stored with the raw exif block have their
+        dict materialised on request
+        """
+        if self.exif:
+            return self.exif
+
+        if self.exif_raw:
+            return exif.exif_raw_to_dict(
+                exif.unpack_exif(self.exif_raw, self.exif_codec)
+            )
+
+        return {}
 
 
 @dataclass
@@ -70,6 +118,145 @@ class InfoTable:
     road: str
 
 
+class LruCache:
+    """thread safe cache of a maximum number of values, the least recently used
+    value is removed first. Values are copied with copy_value when they are
+    stored and returned, so callers can change what they get.
+    """
+
+    def __init__(self, maxsize, copy_value=copy.copy):
+        self.maxsize = maxsize
+        self.copy_value = copy_value
+        self.hits = 0
+        self.misses = 0
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._values[key]
+
+            except KeyError:
+                self.misses += 1
+                return None
+
+            self._values.move_to_end(key)
+            self.hits += 1
+
+        return self.copy_value(value)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._values
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+
+        value = self.copy_value(value)
+        with self._lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            while len(self._values) > self.maxsize:
+                self._values.popitem(last=False)
+
+    def invalidate(self, keys=None):
+        """remove the values of keys, all values if keys is None"""
+        with self._lock:
+            if keys is None:
+                self._values.clear()
+                return
+
+            for key in keys:
+                self._values.pop(key, None)
+
+
+def copy_picture_meta(picture_meta):
+    """copy of the result of load_picture_meta, the image and the tables can be
+    changed without affecting the cache
+    """
+    im, pic_meta, file_meta, info_meta, lat_lon_str, lat_lon_val = picture_meta
+    return (
+        im.copy() if im else None,
+        copy.copy(pic_meta),
+        copy.copy(file_meta),
+        copy.copy(info_meta),
+        lat_lon_str,
+        lat_lon_val,
+    )
+
+
+picture_cache = LruCache(
+    config("PICTURE_CACHE_SIZE", default=256, cast=int), copy_value=copy_picture_meta
+)
+
+
+@dataclass
+class FolderNode:
+    id: int
+    parent_id: int
+    name: str
+    path: str
+    pictures: int = 0
+    unchecked: int = 0
+    children: list = field(default_factory=list, repr=False)
+
+    def totals(self):
+        """number of pictures and of pictures with rotation not checked in the
+        folder and its subfolders
+        """
+        pictures, unchecked = self.pictures, self.unchecked
+        for child in self.children:
+            child_pictures, child_unchecked = child.totals()
+            pictures += child_pictures
+            unchecked += child_unchecked
+
+        return pictures, unchecked
+
+    def folder_ids(self):
+        """ids of the folder and its subfolders"""
+        folder_ids = [self.id]
+        for child in self.children:
+            folder_ids += child.folder_ids()
+
+        return folder_ids
+
+
+class FolderTree:
+    """thread safe in memory tree of the folders with their picture counts, as
+    stored in the folders table
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.roots = []
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    def update(self, rows):
+        """replace the folders by rows (id, parent_id, name, path, pictures,
+        unchecked) ordered so parents come before their subfolders
+        """
+        nodes, roots = {}, []
+        for folder_id, parent_id, name, path, pictures, unchecked in rows:
+            node = FolderNode(folder_id, parent_id, name, path, pictures, unchecked)
+            nodes[folder_id] = node
+            siblings = nodes[parent_id].children if parent_id in nodes else roots
+            siblings.append(node)
+
+        roots.sort(key=lambda node: node.name.lower())
+        for node in nodes.values():
+            node.children.sort(key=lambda child: child.name.lower())
+
+        with self._lock:
+            self.nodes, self.roots = nodes, roots
+            self.loaded = True
+
+
+folder_tree = FolderTree()
+
+
 def progress_message_generator(message):
     loop_dash = ["\u2014", "\\", "|", "/"]
     i = 1
@@ -88,9 +275,66 @@ class DbUtils:
     db_user = config("DB_USERNAME")
     db_user_pw = config("DB_PASSWORD")
     database = config("DATABASE")
+    # number of rows a server side cursor fetches at a time
+    itersize = config("DB_ITERSIZE", default=2000, cast=int)
+    local = threading.local()
+
+    @classmethod
+    @contextmanager
+    def raise_errors(cls):
+        """database errors of connect in this thread are raised to the caller
+        instead of only printed
+        """
+        previous = getattr(cls.local, "raise_errors", False)
+        cls.local.raise_errors = True
+        try:
+            yield
+
+        finally:
+            cls.local.raise_errors = previous
+
+    @classmethod
+    @contextmanager
+    def server_cursor(cls, cursor, name, itersize=None):
+        """named cursor on the connection of cursor, the result stays on the
+        server and iterating over the cursor fetches itersize rows at a time.
+        It is only valid until the transaction of cursor is committed.
+        """
+        named_cursor = cursor.connection.cursor(name=name)
+        named_cursor.itersize = itersize or cls.itersize
+        try:
+            yield named_cursor
+
+        finally:
+            named_cursor.close()
+
+    @classmethod
+    def after_commit(cls, func):
+        """call func once the transaction of the current connect in this thread
+        is committed, so caches are not refilled with uncommitted data. Outside
+        connect func is called immediately.
+        """
+        callbacks = getattr(cls.local, "after_commit", None)
+        if callbacks is None:
+            func()
+
+        else:
+            callbacks.append(func)
+
+    @classmethod
+    def run_after_commit(cls):
+        """call the functions registered with after_commit, for methods that
+        commit the connection of connect themselves
+        """
+        callbacks = getattr(cls.local, "after_commit", None) or []
+        while callbacks:
+            callbacks.pop(0)()
 
     @classmethod
     def connect(cls, func):
+        if inspect.isgeneratorfunction(func):
+            return cls.connect_generator(func)
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             connect_string = (
@@ -98,6 +342,9 @@ class DbUtils:
                 f"user='{cls.db_user}' password='{cls.db_user_pw}'"
             )
             result = None
+            connection = None
+            previous_callbacks = getattr(cls.local, "after_commit", None)
+            cls.local.after_commit = []
             try:
                 # add ggsencmode='disable' to resolve unsupported frontend protocol
                 # 1234.5679: server supports 2.0 to 3.0
@@ -106,11 +353,15 @@ class DbUtils:
                 cursor = connection.cursor()
                 result = func(*args, cursor, **kwargs)
                 connection.commit()
+                cls.run_after_commit()
 
             except psycopg2.Error as error:
                 print(f"error while connect to PostgreSQL {cls.database}: " f"{error}")
+                if getattr(cls.local, "raise_errors", False):
+                    raise
 
             finally:
+                cls.local.after_commit = previous_callbacks
                 if connection:
                     cursor.close()
                     connection.close()
@@ -119,6 +370,37 @@ class DbUtils:
 
         return wrapper
 
+    @classmethod
+    def connect_generator(cls, func):
+        """connect for generator functions, the connection stays open until the
+        generator is exhausted or closed
+        """
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            connect_string = (
+                f"host='{cls.host}' dbname='{cls.database}'"
+                f"user='{cls.db_user}' password='{cls.db_user_pw}'"
+            )
+            connection = None
+            try:
+                connection = psycopg2.connect(connect_string, gssencmode="disable")
+                cursor = connection.cursor()
+                yield from func(*args, cursor, **kwargs)
+                connection.commit()
+
+            except psycopg2.Error as error:
+                print(f"error while connect to PostgreSQL {cls.database}: " f"{error}")
+                if getattr(cls.local, "raise_errors", False):
+                    raise
+
+            finally:
+                if connection:
+                    cursor.close()
+                    connection.close()
+
+        return wrapper
+
     @staticmethod
     def get_answer(choices):
         """arguments:
@@ -168,11 +450,208 @@ class DbUtils:
                 proc.kill()
 
 
+class IngestCheckpoint:
+    """commits an ingest run in batches and records the last file committed in
+    the ingest_runs table, so an interrupted run can be resumed from there.
+    Every file is processed within a savepoint, a file that fails is rolled back
+    and logged in the ingest_failures table without aborting the run.
+    :arguments:
+        cursor: cursor of the ingest method
+        run_name: name of the ingest method: string
+        base_folder: folder that is ingested
+        resume: continue from the last checkpoint of an unfinished run: boolean
+        batch_size: number of files between commits: integer
+    """
+
+    batch_size = config("INGEST_BATCH_SIZE", default=500, cast=int)
+
+    def __init__(self, cursor, run_name, base_folder, resume=False, batch_size=None):
+        self.cursor = cursor
+        self.run_name = run_name
+        self.base_folder = str(base_folder)
+        if batch_size:
+            self.batch_size = batch_size
+
+        self.run_id = None
+        self.last_file = None
+        self.files_done = 0
+        self.files_failed = 0
+        self.resumed = False
+        self.start_run(resume)
+
+    def start_run(self, resume):
+        if resume:
+            sql_string = (
+                f"SELECT id, last_file, files_done, files_failed "
+                f"FROM {PictureDb.table_ingest_runs} "
+                f"WHERE run_name=%s AND base_folder=%s AND NOT finished "
+                f"ORDER BY id DESC LIMIT 1;"
+            )
+            self.cursor.execute(sql_string, (self.run_name, self.base_folder))
+            if run := self.cursor.fetchone():
+                (
+                    self.run_id,
+                    self.last_file,
+                    self.files_done,
+                    self.files_failed,
+                ) = run
+                self.resumed = True
+                print(
+                    f"resume {self.run_name} for {self.base_folder} after "
+                    f"{self.files_done} files, last file: {self.last_file}"
+                )
+                return
+
+            print(f"no checkpoint found for {self.run_name}, start a new run")
+
+        sql_string = (
+            f"INSERT INTO {PictureDb.table_ingest_runs} ("
+            f"run_name, base_folder, files_done, files_failed, started, updated, "
+            f"finished) VALUES (%s, %s, 0, 0, %s, %s, FALSE) RETURNING id;"
+        )
+        c_time = datetime.datetime.now()
+        self.cursor.execute(
+            sql_string, (self.run_name, self.base_folder, c_time, c_time)
+        )
+        self.run_id = self.cursor.fetchone()[0]
+        self.cursor.connection.commit()
+
+    @contextmanager
+    def savepoint(self, filename):
+        """process a single file within a savepoint"""
+        self.cursor.execute("SAVEPOINT ingest_file;")
+        try:
+            yield
+            self.cursor.execute("RELEASE SAVEPOINT ingest_file;")
+
+        except Exception as error:  # pylint: disable=broad-except
+            self.cursor.execute("ROLLBACK TO SAVEPOINT ingest_file;")
+            self.add_failure(filename, error)
+
+    def processed(self, filename, count=1):
+        """mark the files up to and including filename as done and commit when
+        a batch is complete
+        """
+        files_done = self.files_done
+        self.last_file = str(filename)
+        self.files_done += count
+        if self.files_done // self.batch_size > files_done // self.batch_size:
+            self.commit()
+
+    def write_items(self, items, write):
+        """write ingest items from the pipeline with write(cursor, items) in a
+        single savepoint. If this fails the items are written one by one, so only
+        the failing items are rejected.
+        """
+        if not items:
+            return
+
+        valid_items = []
+        for item in items:
+            if item.error:
+                self.add_failure(item.entry.path, item.error)
+
+            else:
+                valid_items.append(item)
+
+        if valid_items:
+            self.cursor.execute("SAVEPOINT ingest_batch;")
+            try:
+                write(self.cursor, valid_items)
+                self.cursor.execute("RELEASE SAVEPOINT ingest_batch;")
+
+            except Exception:  # pylint: disable=broad-except
+                self.cursor.execute("ROLLBACK TO SAVEPOINT ingest_batch;")
+                for item in valid_items:
+                    with self.savepoint(item.entry.path):
+                        write(self.cursor, [item])
+
+        self.processed(items[-1].entry.path, count=len(items))
+
+    def add_failure(self, filename, error):
+        sql_string = (
+            f"INSERT INTO {PictureDb.table_ingest_failures} ("
+            f"run_id, file_name, error, failed_at) VALUES (%s, %s, %s, %s);"
+        )
+        self.cursor.execute(
+            sql_string,
+            (self.run_id, str(filename), repr(error), datetime.datetime.now()),
+        )
+        self.files_failed += 1
+        logger.info(f"ingest {self.run_name} failed for file {filename}: {error}")
+        print(f"\nfile {filename} failed: {error}")
+
+    def commit(self, finished=False):
+        sql_string = (
+            f"UPDATE {PictureDb.table_ingest_runs} "
+            f"SET last_file=%s, files_done=%s, files_failed=%s, updated=%s, "
+            f"finished=%s WHERE id=%s;"
+        )
+        self.cursor.execute(
+            sql_string,
+            (
+                self.last_file,
+                self.files_done,
+                self.files_failed,
+                datetime.datetime.now(),
+                finished,
+                self.run_id,
+            ),
+        )
+        self.cursor.connection.commit()
+        DbUtils.run_after_commit()
+
+    def finish(self):
+        self.commit(finished=True)
+        print(
+            f"\n{self.run_name} finished: {self.files_done} files processed, "
+            f"{self.files_failed} failed"
+        )
+
+
 class PictureDb:
     table_pictures = "pictures"
     table_files = "files"
+    table_folders = "folders"
+    table_picture_days = "picture_days"
     table_reviews = "reviews"
     table_locations = "locations"
+    table_payloads = "picture_payloads"
+    table_thumbnails = "thumbnails"
+    table_makernotes = "exif_makernotes"
+    table_signatures = "signatures"
+    table_ingest_runs = "ingest_runs"
+    table_ingest_failures = "ingest_failures"
+    table_selections = "selections"
+    decode_workers = config("DECODE_WORKERS", default=4, cast=int)
+    geocode_workers = config("GEOCODE_WORKERS", default=1, cast=int)
+    insert_batch_size = config("INSERT_BATCH_SIZE", default=100, cast=int)
+    # decode 'heic', 'all' or 'none' of the files in isolated worker processes
+    decode_processes = config("DECODE_PROCESSES", default="heic").lower()
+    decode_timeout = config("DECODE_TIMEOUT", default=120, cast=int)
+    decode_max_tasks = config("DECODE_MAX_TASKS", default=200, cast=int)
+    decode_memory_limit = config("DECODE_MEMORY_LIMIT", default=4096, cast=int)
+    load_chunk_size = config("LOAD_CHUNK_SIZE", default=500, cast=int)
+    # sort orders of select_ids, pictures with equal values are sorted by id
+    sort_orders = {
+        "id": "p.id",
+        "date": "p.date_picture",
+        "day": "d.day, p.date_picture",
+        "created": "f.file_created",
+        "name": "fo.path, f.file_name",
+        "selection": "s.position",
+    }
+    # fields of PicturesTable that can be edited and their column
+    attribute_columns = {
+        "date_picture": "date_picture",
+        "camera_make": "camera_make",
+        "camera_model": "camera_model",
+        "gps_latitude": "gps_latitude",
+        "gps_longitude": "gps_longitude",
+        "gps_altitude": "gps_altitude",
+        "gps_img_direction": "gps_img_dir",
+        "rotate": "rotate",
+    }
 
     @classmethod
     @DbUtils.connect
@@ -195,15 +674,53 @@ class PictureDb:
             f"gps_longitude JSON, "
             f"gps_altitude JSON, "
             f"gps_img_dir JSON, "
-            f"thumbnail JSON, "
-            f"exif JSON, "
             f"rotate INTEGER DEFAULT 0, "
-            f"rotate_checked BOOLEAN DEFAULT FALSE"
+            f"rotate_checked BOOLEAN DEFAULT FALSE, "
+            f"signature_version INTEGER DEFAULT 1"
             f");"
         )
         print(f"create table {cls.table_pictures}")
         cursor.execute(sql_string)
 
+    @classmethod
+    @DbUtils.connect
+    def create_thumbnails_table(cls, cursor):
+        """thumbnails stored once per content hash, shared by the pictures that
+        have an identical thumbnail
+        """
+        sql_string = (
+            f"CREATE TABLE {cls.table_thumbnails} ("
+            f"content_hash VARCHAR(32) PRIMARY KEY, "
+            f"thumbnail JSON, "
+            f"thumbnail_codec VARCHAR(20)"
+            f");"
+        )
+        print(f"create table {cls.table_thumbnails}")
+        cursor.execute(sql_string)
+
+    @classmethod
+    @DbUtils.connect
+    def create_payloads_table(cls, cursor):
+        """thumbnail and exif of the pictures, kept out of the pictures table so
+        queries on the meta data do not read them
+        """
+        sql_string = (
+            f"CREATE TABLE {cls.table_payloads} ("
+            f"picture_id INTEGER PRIMARY KEY REFERENCES {cls.table_pictures}(id) ON DELETE CASCADE, "
+            f"thumbnail_hash VARCHAR(32) REFERENCES {cls.table_thumbnails}(content_hash), "
+            f"exif JSON, "
+            f"exif_raw BYTEA, "
+            f"exif_codec VARCHAR(10)"
+            f");"
+        )
+        print(f"create table {cls.table_payloads}")
+        cursor.execute(sql_string)
+        sql_string = (
+            f"CREATE INDEX {cls.table_payloads}_thumbnail_hash_idx "
+            f"ON {cls.table_payloads} (thumbnail_hash);"
+        )
+        cursor.execute(sql_string)
+
     @classmethod
     @DbUtils.connect
     def create_files_table(cls, cursor):
@@ -211,7 +728,7 @@ class PictureDb:
             f"CREATE TABLE {cls.table_files} ("
             f"id SERIAL PRIMARY KEY, "
             f"picture_id INTEGER REFERENCES {cls.table_pictures}(id) ON DELETE CASCADE UNIQUE NOT NULL, "
-            f"file_path VARCHAR(250), "
+            f"folder_id INTEGER REFERENCES {cls.table_folders}(id), "
             f"file_name VARCHAR(250), "
             f"file_modified TIMESTAMP, "
             f"file_created TIMESTAMP, "
@@ -222,6 +739,59 @@ class PictureDb:
         print(f"create table {cls.table_files}")
         cursor.execute(sql_string)
 
+    @classmethod
+    @DbUtils.connect
+    def create_folders_table(cls, cursor):
+        """folders of the files, path is the full path ending with a separator.
+        pictures and unchecked are the number of pictures and of pictures with
+        rotation not checked in the folder, kept up to date by the methods that
+        add, delete or check pictures.
+        """
+        sql_string = (
+            f"CREATE TABLE {cls.table_folders} ("
+            f"id SERIAL PRIMARY KEY, "
+            f"parent_id INTEGER REFERENCES {cls.table_folders}(id), "
+            f"path VARCHAR(250) UNIQUE NOT NULL, "
+            f"name VARCHAR(250) NOT NULL, "
+            f"pictures INTEGER NOT NULL DEFAULT 0, "
+            f"unchecked INTEGER NOT NULL DEFAULT 0"
+            f");"
+            f"CREATE INDEX {cls.table_folders}_parent_id_idx "
+            f"ON {cls.table_folders} (parent_id);"
+        )
+        print(f"create table {cls.table_folders}")
+        cursor.execute(sql_string)
+
+    @classmethod
+    @DbUtils.connect
+    def create_picture_days_table(cls, cursor):
+        """day of every picture, the date of the picture or if unknown the file
+        modified date, indexed for range queries by day
+        """
+        sql_string = (
+            f"CREATE TABLE {cls.table_picture_days} ("
+            f"picture_id INTEGER PRIMARY KEY REFERENCES {cls.table_pictures}(id) ON DELETE CASCADE, "
+            f"day DATE NOT NULL"
+            f");"
+            f"CREATE INDEX {cls.table_picture_days}_day_idx "
+            f"ON {cls.table_picture_days} (day, picture_id);"
+        )
+        print(f"create table {cls.table_picture_days}")
+        cursor.execute(sql_string)
+
+    @classmethod
+    @DbUtils.connect
+    def create_files_indexes(cls, cursor):
+        """indexes for selecting pictures by folder and by file created date"""
+        sql_string = (
+            f"CREATE INDEX IF NOT EXISTS {cls.table_files}_folder_id_idx "
+            f"ON {cls.table_files} (folder_id);"
+            f"CREATE INDEX IF NOT EXISTS {cls.table_files}_file_created_idx "
+            f"ON {cls.table_files} (file_created);"
+        )
+        print(f"create indexes on {cls.table_files}")
+        cursor.execute(sql_string)
+
     @classmethod
     @DbUtils.connect
     def create_reviews_table(cls, cursor):
@@ -255,251 +825,599 @@ class PictureDb:
 
     @classmethod
     @DbUtils.connect
-    def store_pictures_base_folder(cls, base_folder, cursor):
-        """re-initialises the database all previous data will be lost"""
-        progress_message = progress_message_generator(
-            f"loading picture meta data from {base_folder}"
+    def create_makernotes_table(cls, cursor):
+        sql_string = (
+            f"CREATE TABLE {cls.table_makernotes} ("
+            f"picture_id INTEGER PRIMARY KEY REFERENCES {cls.table_pictures}(id) ON DELETE CASCADE, "
+            f"makernote BYTEA, "
+            f"codec VARCHAR(10)"
+            f");"
         )
+        print(f"create table {cls.table_makernotes}")
+        cursor.execute(sql_string)
 
-        sql_pictures = (
-            f"INSERT INTO {cls.table_pictures} ("
-            f"date_picture, md5_signature, camera_make, camera_model, "
-            f"gps_latitude, gps_longitude, gps_altitude, gps_img_dir, "
-            f"thumbnail, exif, rotate, rotate_checked) "
-            f"VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) "
-            f"RETURNING id;"
+    @classmethod
+    @DbUtils.connect
+    def create_signatures_table(cls, cursor):
+        """signatures of other versions than the signature_version in the
+        pictures table, these remain valid for matching
+        """
+        sql_string = (
+            f"CREATE TABLE {cls.table_signatures} ("
+            f"picture_id INTEGER REFERENCES {cls.table_pictures}(id) ON DELETE CASCADE NOT NULL, "
+            f"signature_version INTEGER NOT NULL, "
+            f"signature VARCHAR(32), "
+            f"PRIMARY KEY (picture_id, signature_version)"
+            f");"
         )
-
-        sql_files = (
-            f"INSERT INTO {cls.table_files} ("
-            f"picture_id, file_path, file_name, file_modified, file_created, "
-            f"file_size, file_checked)"
-            f"VALUES (%s, %s, %s, %s, %s, %s, %s);"
+        print(f"create table {cls.table_signatures}")
+        cursor.execute(sql_string)
+        sql_string = (
+            f"CREATE INDEX {cls.table_signatures}_signature_idx "
+            f"ON {cls.table_signatures} (signature_version, signature);"
         )
-
-        for foldername, _, filenames in os.walk(base_folder):
-            for filename in filenames:
-                pic_meta, file_meta = exif.distill_serialized_picfile_meta_data(
-                    os.path.join(foldername, filename)
-                )
-                if not file_meta.file_name:
-                    continue
-
-                cursor.execute(
-                    sql_pictures,
-                    (
-                        pic_meta.date_picture,
-                        pic_meta.md5_signature,
-                        pic_meta.camera_make,
-                        pic_meta.camera_model,
-                        pic_meta.gps_latitude,
-                        pic_meta.gps_longitude,
-                        pic_meta.gps_altitude,
-                        pic_meta.gps_img_direction,
-                        pic_meta.thumbnail,
-                        pic_meta.exif,
-                        0,
-                        False,
-                    ),
-                )
-                picture_id = cursor.fetchone()[0]
-
-                cursor.execute(
-                    sql_files,
-                    (
-                        picture_id,
-                        file_meta.file_path,
-                        file_meta.file_name,
-                        file_meta.file_modified,
-                        file_meta.file_created,
-                        file_meta.file_size,
-                        True,
-                    ),
-                )
-                lat_lon_str, lat_lon_val = exif.convert_gps(
-                    pic_meta.gps_latitude, pic_meta.gps_longitude, pic_meta.gps_altitude
-                )
-                if lat_lon_str:
-                    cls.add_to_locations_table(
-                        picture_id, pic_meta.date_picture, lat_lon_val
-                    )
-
-                next(progress_message)
-        print()
+        cursor.execute(sql_string)
 
     @classmethod
     @DbUtils.connect
-    def check_and_add_files(cls, base_folder, cursor):
-        """check if files are in database, if they are not then add"""
-        progress_message = progress_message_generator(
-            f"update picture meta data from {base_folder}"
+    def create_ingest_runs_table(cls, cursor):
+        sql_string = (
+            f"CREATE TABLE {cls.table_ingest_runs} ("
+            f"id SERIAL PRIMARY KEY, "
+            f"run_name VARCHAR(50), "
+            f"base_folder VARCHAR(250), "
+            f"last_file VARCHAR(500), "
+            f"files_done INTEGER, "
+            f"files_failed INTEGER, "
+            f"started TIMESTAMP, "
+            f"updated TIMESTAMP, "
+            f"finished BOOLEAN DEFAULT FALSE"
+            f");"
         )
-        sql_string = f"UPDATE {cls.table_files} SET file_checked = FALSE;"
+        print(f"create table {cls.table_ingest_runs}")
         cursor.execute(sql_string)
 
-        sql_pictures = (
-            f"INSERT INTO {cls.table_pictures} ("
-            f"date_picture, md5_signature, camera_make, camera_model, "
-            f"gps_latitude, gps_longitude, gps_altitude, gps_img_dir, "
-            f"thumbnail, exif, rotate, rotate_checked) "
-            f"VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) "
-            f"RETURNING id;"
+    @classmethod
+    @DbUtils.connect
+    def create_ingest_failures_table(cls, cursor):
+        sql_string = (
+            f"CREATE TABLE {cls.table_ingest_failures} ("
+            f"id SERIAL PRIMARY KEY, "
+            f"run_id INTEGER REFERENCES {cls.table_ingest_runs}(id) ON DELETE CASCADE NOT NULL, "
+            f"file_name VARCHAR(500), "
+            f"error TEXT, "
+            f"failed_at TIMESTAMP"
+            f");"
         )
+        print(f"create table {cls.table_ingest_failures}")
+        cursor.execute(sql_string)
 
-        sql_files = (
-            f"INSERT INTO {cls.table_files} ("
-            f"picture_id, file_path, file_name, file_modified, file_created, "
-            f"file_size, file_checked) "
-            f"VALUES (%s, %s, %s, %s, %s, %s, %s);"
+    @classmethod
+    @DbUtils.connect
+    def create_selections_table(cls, cursor):
+        sql_string = (
+            f"CREATE TABLE {cls.table_selections} ("
+            f"name VARCHAR(100) NOT NULL, "
+            f"position INTEGER NOT NULL, "
+            f"picture_id INTEGER REFERENCES {cls.table_pictures}(id) ON DELETE CASCADE NOT NULL, "
+            f"PRIMARY KEY (name, picture_id)"
+            f");"
         )
+        print(f"create table {cls.table_selections}")
+        cursor.execute(sql_string)
 
-        for foldername, _, filenames in os.walk(base_folder):
-            for filename in filenames:
-                valid_name = filename[-4:].lower() in [".jpg", ".png"] or filename[
-                    -5:
-                ].lower() in [".jpeg", ".heic"]
-                if valid_name:
-                    sql_filename = filename.replace("'", "''")
-                    sql_parent_folder = os.path.basename(
-                        os.path.dirname("/".join([foldername, sql_filename]))
-                    )
-                    sql_parent_folder = sql_parent_folder.replace("'", "''")
-
-                    sql_string = (
-                        f"SELECT picture_id FROM {cls.table_files} WHERE "
-                        f"file_path like '%{sql_parent_folder}%' AND "
-                        f"file_name='{sql_filename}';"
-                    )
-                    cursor.execute(sql_string)
-                    try:
-                        picture_id = cursor.fetchone()[0]
-
-                    except TypeError:
-                        picture_id = None
-
-                    # file exists but not in DB -> add to DB
-                    if not picture_id:
-                        pic_meta, file_meta = exif.distill_serialized_picfile_meta_data(
-                            os.path.join(foldername, filename)
-                        )
-                        if not file_meta.file_name:
-                            continue
-
-                        cursor.execute(
-                            sql_pictures,
-                            (
-                                pic_meta.date_picture,
-                                pic_meta.md5_signature,
-                                pic_meta.camera_make,
-                                pic_meta.camera_model,
-                                pic_meta.gps_latitude,
-                                pic_meta.gps_longitude,
-                                pic_meta.gps_altitude,
-                                pic_meta.gps_img_direction,
-                                pic_meta.thumbnail,
-                                pic_meta.exif,
-                                0,
-                                False,
-                            ),
-                        )
-                        picture_id = cursor.fetchone()[0]
-
-                        cursor.execute(
-                            sql_files,
-                            (
-                                picture_id,
-                                file_meta.file_path,
-                                file_meta.file_name,
-                                file_meta.file_modified,
-                                file_meta.file_created,
-                                file_meta.file_size,
-                                True,
-                            ),
-                        )
-                        lat_lon_str, lat_lon_val = exif.convert_gps(
-                            pic_meta.gps_latitude,
-                            pic_meta.gps_longitude,
-                            pic_meta.gps_altitude,
-                        )
-                        if lat_lon_str:
-                            cls.add_to_locations_table(
-                                picture_id, pic_meta.date_picture, lat_lon_val
-                            )
-                    else:
-                        sql_string = (
-                            f"UPDATE {cls.table_files} "
-                            f"SET file_checked = TRUE "
-                            f"WHERE picture_id={picture_id};"
-                        )
-                        cursor.execute(sql_string)
-
-                    next(progress_message)
+    @staticmethod
+    def split_folder(path):
+        """split the path of a folder, ending with a separator, in the path of
+        its parent folder and its name, the parent of a root folder is None
+        """
+        separator = path[-1]
+        parent_path, found, name = path[:-1].rpartition(separator)
+        if not found or not name:
+            return None, path
 
-        print()
+        return parent_path + separator, name
 
     @classmethod
-    @DbUtils.connect
-    def load_picture_meta(cls, _id: int, cursor):
-        """load picture meta data from the database
-        :arguments:
-            _id: picture id number in database: integer
+    def add_folder(cls, cursor, path):
+        """add the folder and the parent folders that are not yet in the folders
+        table, using the cursor of the calling method
         :returns:
-            im: PIL image
-            pic_meta: PicturesTable
-            file_meta: FilesTable
-            info_meta: InfoTable
-            lat_lon_str: string
-            lat_lon_val: tuple(float, float, float)
+            folder_id: integer
         """
-        empty_return = None, None, None, None, None, (None, None, None)
-        sql_string = f"SELECT * FROM {cls.table_pictures} WHERE id=%s;"
-        cursor.execute(sql_string, (_id,))
-        data_from_table_pictures = cursor.fetchone()
-
-        if not data_from_table_pictures:
-            return empty_return
+        parent_path, name = cls.split_folder(path)
+        parent_id = None
+        if parent_path:
+            sql_string = f"SELECT id FROM {cls.table_folders} WHERE path = %s;"
+            cursor.execute(sql_string, (parent_path,))
+            if row := cursor.fetchone():
+                parent_id = row[0]
 
-        sql_string = f"SELECT * FROM {cls.table_files} WHERE picture_id=%s;"
-        cursor.execute(sql_string, (_id,))
-        data_from_table_files = cursor.fetchone()
-        if not data_from_table_files:
-            return empty_return
+            else:
+                parent_id = cls.add_folder(cursor, parent_path)
 
-        pic_meta = PicturesTable(
-            id=data_from_table_pictures[0],
-            date_picture=data_from_table_pictures[1],
-            md5_signature=data_from_table_pictures[2],
-            camera_make=data_from_table_pictures[3],
-            camera_model=data_from_table_pictures[4],
-            gps_latitude=data_from_table_pictures[5],
-            gps_longitude=data_from_table_pictures[6],
-            gps_altitude=data_from_table_pictures[7],
-            gps_img_direction=data_from_table_pictures[8],
-            thumbnail=data_from_table_pictures[9],
-            exif=data_from_table_pictures[10],
-            rotate=data_from_table_pictures[11],
-            rotate_checked=data_from_table_pictures[12],
-        )
-        file_meta = FilesTable(
-            id=data_from_table_files[0],
-            picture_id=data_from_table_files[1],
-            file_path=data_from_table_files[2],
-            file_name=data_from_table_files[3],
-            file_modified=data_from_table_files[4],
-            file_created=data_from_table_files[5],
-            file_size=data_from_table_files[6],
-            file_checked=data_from_table_files[7],
+        sql_string = (
+            f"INSERT INTO {cls.table_folders} (parent_id, path, name) "
+            f"VALUES (%s, %s, %s) "
+            f"ON CONFLICT (path) DO UPDATE SET parent_id = EXCLUDED.parent_id "
+            f"RETURNING id;"
         )
-        assert (
-            pic_meta.id == file_meta.picture_id
-        ), "load_picture_meta: database integrity error"
+        cursor.execute(sql_string, (parent_id, path, name))
+        return cursor.fetchone()[0]
+
+    @classmethod
+    def get_folder_ids(cls, cursor, paths):
+        """get the ids of the folder paths, folders that are not yet in the
+        folders table are added, using the cursor of the calling method
+        :returns:
+            dict {path: folder_id}
+        """
+        paths = {path for path in paths if path}
+        sql_string = f"SELECT path, id FROM {cls.table_folders} WHERE path = ANY(%s);"
+        cursor.execute(sql_string, (list(paths),))
+        folder_ids = dict(cursor.fetchall())
+        for path in paths - folder_ids.keys():
+            folder_ids[path] = cls.add_folder(cursor, path)
+
+        return folder_ids
 
+    @classmethod
+    def insert_pictures(cls, cursor, items):
+        """insert the picture, payload, file and location records for a batch of ingest
+        items with a single statement per table, using the cursor of the calling
+        method. The picture ids are taken from the sequence beforehand so the
+        files and locations can refer to them.
+        """
         sql_string = (
-            f"SELECT geolocation_info FROM {cls.table_locations} WHERE picture_id=%s"
+            f"SELECT nextval(pg_get_serial_sequence('{cls.table_pictures}', 'id')) "
+            f"FROM generate_series(1, %s);"
         )
-        cursor.execute(sql_string, (_id,))
-        if geolocation_info := cursor.fetchone():
-            geolocation_info = geolocation_info[0]
+        cursor.execute(sql_string, (len(items),))
+        picture_ids = [val[0] for val in cursor.fetchall()]
+
+        sql_pictures = (
+            f"INSERT INTO {cls.table_pictures} ("
+            f"id, date_picture, md5_signature, camera_make, camera_model, "
+            f"gps_latitude, gps_longitude, gps_altitude, gps_img_dir, "
+            f"rotate, rotate_checked, signature_version) "
+            f"VALUES %s;"
+        )
+        execute_values(
+            cursor,
+            sql_pictures,
+            [
+                (
+                    picture_id,
+                    item.pic_meta.date_picture,
+                    item.pic_meta.md5_signature,
+                    item.pic_meta.camera_make,
+                    item.pic_meta.camera_model,
+                    item.pic_meta.gps_latitude,
+                    item.pic_meta.gps_longitude,
+                    item.pic_meta.gps_altitude,
+                    item.pic_meta.gps_img_direction,
+                    0,
+                    False,
+                    item.pic_meta.signature_version,
+                )
+                for item, picture_id in zip(items, picture_ids)
+            ],
+            page_size=len(items),
+        )
+
+        thumbnail_hashes = [
+            exif.thumbnail_hash(item.pic_meta.thumbnail)
+            if item.pic_meta.thumbnail
+            else None
+            for item in items
+        ]
+        thumbnails = {
+            thumbnail_hash: (
+                thumbnail_hash,
+                item.pic_meta.thumbnail,
+                item.pic_meta.thumbnail_codec,
+            )
+            for item, thumbnail_hash in zip(items, thumbnail_hashes)
+            if thumbnail_hash
+        }
+        if thumbnails:
+            cls.insert_thumbnails(cursor, list(thumbnails.values()))
+
+        sql_payloads = (
+            f"INSERT INTO {cls.table_payloads} ("
+            f"picture_id, thumbnail_hash, exif, exif_raw, exif_codec) "
+            f"VALUES %s;"
+        )
+        execute_values(
+            cursor,
+            sql_payloads,
+            [
+                (
+                    picture_id,
+                    thumbnail_hash,
+                    item.pic_meta.exif,
+                    item.pic_meta.exif_raw,
+                    item.pic_meta.exif_codec,
+                )
+                for item, picture_id, thumbnail_hash in zip(
+                    items, picture_ids, thumbnail_hashes
+                )
+            ],
+            page_size=len(items),
+        )
+
+        folder_ids = cls.get_folder_ids(
+            cursor, [item.file_meta.file_path for item in items]
+        )
+        sql_files = (
+            f"INSERT INTO {cls.table_files} ("
+            f"picture_id, folder_id, file_name, file_modified, file_created, "
+            f"file_size, file_checked) "
+            f"VALUES %s;"
+        )
+        execute_values(
+            cursor,
+            sql_files,
+            [
+                (
+                    picture_id,
+                    folder_ids.get(item.file_meta.file_path),
+                    item.file_meta.file_name,
+                    item.file_meta.file_modified,
+                    item.file_meta.file_created,
+                    item.file_meta.file_size,
+                    True,
+                )
+                for item, picture_id in zip(items, picture_ids)
+            ],
+            page_size=len(items),
+        )
+
+        makernotes = [
+            (picture_id, item.pic_meta.makernote, item.pic_meta.exif_codec)
+            for item, picture_id in zip(items, picture_ids)
+            if item.pic_meta.makernote
+        ]
+        if makernotes:
+            sql_makernotes = (
+                f"INSERT INTO {cls.table_makernotes} "
+                f"(picture_id, makernote, codec) VALUES %s;"
+            )
+            execute_values(
+                cursor, sql_makernotes, makernotes, page_size=len(makernotes)
+            )
+
+        # Point has format (Longitude, Latitude) like (x, y)
+        # TODO fix patch elevation is Null
+        locations = [
+            (
+                picture_id,
+                item.location[0],
+                item.location[1],
+                0.0 if item.location[2] is None else item.location[2],
+                item.geolocation_info,
+                Point(item.location[1], item.location[0]).wkb_hex,
+                EPSG_WGS84,
+            )
+            for item, picture_id in zip(items, picture_ids)
+            if item.location
+        ]
+        if locations:
+            sql_locations = (
+                f"INSERT INTO {cls.table_locations} "
+                f"(picture_id, latitude, longitude, altitude, geolocation_info, geom) "
+                f"VALUES %s;"
+            )
+            execute_values(
+                cursor,
+                sql_locations,
+                locations,
+                template="(%s, %s, %s, %s, %s, ST_SetSRID(%s::geometry, %s))",
+                page_size=len(locations),
+            )
+
+        cls.update_picture_days(cursor, picture_ids)
+        cls.update_folder_counts(cursor, folder_ids.values())
+
+    @classmethod
+    def update_picture_days(cls, cursor, picture_ids=None):
+        """set the day of the pictures in picture_days, of all pictures if
+        picture_ids is None, using the cursor of the calling method
+        """
+        days_condition, pictures_condition, params = "TRUE", "TRUE", ()
+        if picture_ids is not None:
+            days_condition, params = cls.ids_condition("picture_id", picture_ids)
+            pictures_condition, params = cls.ids_condition("p.id", picture_ids)
+
+        sql_string = f"DELETE FROM {cls.table_picture_days} WHERE {days_condition};"
+        cursor.execute(sql_string, params)
+        sql_string = (
+            f"INSERT INTO {cls.table_picture_days} (picture_id, day) "
+            f"SELECT p.id, coalesce(p.date_picture, f.file_modified)::date "
+            f"FROM {cls.table_pictures} p "
+            f"LEFT JOIN {cls.table_files} f ON f.picture_id = p.id "
+            f"WHERE {pictures_condition} "
+            f"AND coalesce(p.date_picture, f.file_modified) IS NOT NULL;"
+        )
+        cursor.execute(sql_string, params)
+
+    @classmethod
+    @DbUtils.connect
+    def rebuild_picture_days(cls, cursor):
+        cls.update_picture_days(cursor)
+        print(f"set the day of {cursor.rowcount:,} pictures")
+
+    @classmethod
+    def insert_thumbnails(cls, cursor, thumbnails):
+        """insert thumbnails [(content_hash, thumbnail, thumbnail_codec), ...]
+        that are not yet in the database
+        """
+        sql_string = (
+            f"INSERT INTO {cls.table_thumbnails} "
+            f"(content_hash, thumbnail, thumbnail_codec) VALUES %s "
+            f"ON CONFLICT (content_hash) DO NOTHING;"
+        )
+        execute_values(cursor, sql_string, thumbnails, page_size=len(thumbnails))
+
+    @classmethod
+    def remove_unused_thumbnails(cls, cursor, thumbnail_hashes=None):
+        """delete thumbnails that are no longer referenced by a picture, only
+        those of thumbnail_hashes if given
+        """
+        sql_string = (
+            f"DELETE FROM {cls.table_thumbnails} t WHERE NOT EXISTS ("
+            f"SELECT 1 FROM {cls.table_payloads} pl "
+            f"WHERE pl.thumbnail_hash = t.content_hash)"
+        )
+        if thumbnail_hashes is None:
+            cursor.execute(sql_string + ";")
+
+        else:
+            cursor.execute(
+                sql_string + " AND t.content_hash = ANY(%s);", (list(thumbnail_hashes),)
+            )
+
+        return cursor.rowcount
+
+    @classmethod
+    def decode_item(cls, item, decode_pool=None):
+        """decode stage of the ingest pipeline, HEIC files (or all files) are
+        decoded in a worker process of decode_pool if given
+        """
+        if decode_pool and (
+            cls.decode_processes == "all"
+            or item.entry.name.lower().endswith(".heic")
+        ):
+            item.pic_meta, item.file_meta = decode_pool.decode(
+                item.entry.path, item.entry.stat
+            )
+
+        else:
+            item.pic_meta, item.file_meta = exif.distill_serialized_picfile_meta_data(
+                item.entry.path, item.entry.stat
+            )
+
+        lat_lon_str, lat_lon_val = exif.convert_gps(
+            item.pic_meta.gps_latitude,
+            item.pic_meta.gps_longitude,
+            item.pic_meta.gps_altitude,
+        )
+        if lat_lon_str:
+            item.location = lat_lon_val
+
+    @classmethod
+    def geocode_item(cls, item):
+        """geocode stage of the ingest pipeline"""
+        if item.location:
+            item.geolocation_info = cls.get_geolocation_info(
+                item.location[1], item.location[0]
+            )
+
+    @classmethod
+    def write_items(cls, cursor, items):
+        """writer stage of the ingest pipeline, items with a picture_id are
+        already in the database and only marked as checked
+        """
+        if checked_ids := [item.picture_id for item in items if item.picture_id]:
+            sql_string = (
+                f"UPDATE {cls.table_files} SET file_checked = TRUE "
+                f"WHERE picture_id = ANY(%s);"
+            )
+            cursor.execute(sql_string, (checked_ids,))
+
+        if new_items := [
+            item
+            for item in items
+            if not item.picture_id and item.file_meta.file_name
+        ]:
+            cls.insert_pictures(cursor, new_items)
+
+    @classmethod
+    def run_ingest(cls, cursor, checkpoint, entries, known_files=None):
+        """run the entries through the ingest pipeline and write them in batches
+        :arguments:
+            cursor: cursor of the ingest method
+            checkpoint: IngestCheckpoint
+            entries: iterator of ScanEntry
+            known_files: dict {(folder name, file name): picture_id} of files
+                         already in the database, these are not decoded
+        """
+
+        def decode(item):
+            if known_files and (
+                picture_id := known_files.get(
+                    (os.path.basename(item.entry.folder), item.entry.name)
+                )
+            ):
+                item.picture_id = picture_id
+                return
+
+            cls.decode_item(item, decode_pool=decode_pool)
+
+        decode_pool = None
+        if cls.decode_processes in ["heic", "all"]:
+            decode_pool = DecodePool(
+                workers=cls.decode_workers,
+                timeout=cls.decode_timeout,
+                max_tasks=cls.decode_max_tasks,
+                memory_limit=cls.decode_memory_limit,
+            )
+
+        pipeline = IngestPipeline(
+            decode,
+            cls.geocode_item,
+            decode_workers=cls.decode_workers,
+            geocode_workers=cls.geocode_workers,
+        )
+        items = []
+        try:
+            for item in pipeline.run(entries):
+                items.append(item)
+                if len(items) >= cls.insert_batch_size:
+                    checkpoint.write_items(items, cls.write_items)
+                    items = []
+                    print(f"\r{pipeline.report()}", end="")
+
+        finally:
+            if decode_pool:
+                decode_pool.close()
+
+        checkpoint.write_items(items, cls.write_items)
+        print(f"\r{pipeline.report()}", end="")
+        logger.info(f"ingest {checkpoint.run_name}: {pipeline.report()}")
+
+    @classmethod
+    @DbUtils.connect
+    def store_pictures_base_folder(cls, base_folder, cursor, resume=False):
+        """re-initialises the database all previous data will be lost
+        the run is committed in batches, with resume=True it continues after
+        the last file committed by an interrupted run
+        """
+        print(f"loading picture meta data from {base_folder}")
+        checkpoint = IngestCheckpoint(
+            cursor, "store_pictures_base_folder", base_folder, resume=resume
+        )
+        cls.run_ingest(
+            cursor,
+            checkpoint,
+            scanner.scan(base_folder, start_after=checkpoint.last_file),
+        )
+        checkpoint.finish()
+
+    @classmethod
+    @DbUtils.connect
+    def check_and_add_files(cls, base_folder, cursor, resume=False):
+        """check if files are in database, if they are not then add
+        the run is committed in batches, with resume=True it continues after
+        the last file committed by an interrupted run
+        """
+        print(f"update picture meta data from {base_folder}")
+        checkpoint = IngestCheckpoint(
+            cursor, "check_and_add_files", base_folder, resume=resume
+        )
+        if not checkpoint.resumed:
+            sql_string = f"UPDATE {cls.table_files} SET file_checked = FALSE;"
+            cursor.execute(sql_string)
+
+        # until normalize_folders has finished, files without folder_id are
+        # known by the name of their file_path
+        sql_string = (
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_name = %s AND column_name = 'file_path';"
+        )
+        cursor.execute(sql_string, (cls.table_files,))
+        file_path = "f.file_path" if cursor.fetchone() else "NULL"
+        sql_string = (
+            f"SELECT f.picture_id, fo.name, {file_path}, f.file_name "
+            f"FROM {cls.table_files} f "
+            f"LEFT JOIN {cls.table_folders} fo ON fo.id = f.folder_id;"
+        )
+        cursor.execute(sql_string)
+        known_files = {
+            (
+                folder_name or os.path.basename(os.path.normpath(file_path or "")),
+                file_name,
+            ): picture_id
+            for picture_id, folder_name, file_path, file_name in cursor.fetchall()
+        }
+
+        def valid_entries():
+            for entry in scanner.scan(base_folder, start_after=checkpoint.last_file):
+                filename = entry.name
+                valid_name = filename[-4:].lower() in [".jpg", ".png"] or filename[
+                    -5:
+                ].lower() in [".jpeg", ".heic"]
+                if valid_name:
+                    yield entry
+
+        cls.run_ingest(cursor, checkpoint, valid_entries(), known_files=known_files)
+        checkpoint.finish()
+
+    @classmethod
+    def picture_meta_sql(cls, thumbnail=True):
+        """select of the picture, payload, file and location of pictures in a
+        single query, the columns are in the order of build_picture_meta
+        """
+        thumbnail_columns = (
+            "t.thumbnail, t.thumbnail_codec" if thumbnail else "NULL, NULL"
+        )
+        thumbnail_join = (
+            f"LEFT JOIN {cls.table_thumbnails} t ON t.content_hash = pl.thumbnail_hash "
+            if thumbnail
+            else ""
+        )
+        return (
+            f"SELECT p.id, p.date_picture, p.md5_signature, p.camera_make, "
+            f"p.camera_model, p.gps_latitude, p.gps_longitude, p.gps_altitude, "
+            f"p.gps_img_dir, p.rotate, p.rotate_checked, p.signature_version, "
+            f"pl.exif, pl.exif_raw, pl.exif_codec, {thumbnail_columns}, "
+            f"f.id, f.picture_id, fo.path, f.file_name, f.file_modified, "
+            f"f.file_created, f.file_size, f.file_checked, l.geolocation_info "
+            f"FROM {cls.table_pictures} p "
+            f"JOIN {cls.table_files} f ON f.picture_id = p.id "
+            f"LEFT JOIN {cls.table_folders} fo ON fo.id = f.folder_id "
+            f"LEFT JOIN {cls.table_payloads} pl ON pl.picture_id = p.id "
+            f"{thumbnail_join}"
+            f"LEFT JOIN {cls.table_locations} l ON l.picture_id = p.id "
+        )
+
+    @staticmethod
+    def build_picture_meta(row):
+        """build the result of load_picture_meta from a row of picture_meta_sql"""
+        pic_meta = PicturesTable(
+            id=row[0],
+            date_picture=row[1],
+            md5_signature=row[2],
+            camera_make=row[3],
+            camera_model=row[4],
+            gps_latitude=row[5],
+            gps_longitude=row[6],
+            gps_altitude=row[7],
+            gps_img_direction=row[8],
+            thumbnail=row[15],
+            exif=row[12],
+            rotate=row[9],
+            rotate_checked=row[10],
+            exif_raw=row[13],
+            exif_codec=row[14],
+            signature_version=row[11],
+            thumbnail_codec=row[16],
+        )
+        file_meta = FilesTable(
+            id=row[17],
+            picture_id=row[18],
+            file_path=row[19],
+            file_name=row[20],
+            file_modified=row[21],
+            file_created=row[22],
+            file_size=row[23],
+            file_checked=row[24],
+        )
+        assert (
+            pic_meta.id == file_meta.picture_id
+        ), "load_picture_meta: database integrity error"
+
+        if geolocation_info := row[25]:
             info_meta = InfoTable(
                 country=geolocation_info.get("country", ""),
                 state=", ".join(
@@ -525,14 +1443,69 @@ class PictureDb:
 
         im = None
         if pic_meta.thumbnail:
-            img_bytes = io.BytesIO(pic_meta.thumbnail.encode(exif.codec))
-            im = exif.get_pil_image(img_bytes)
+            im = exif.get_thumbnail_image(pic_meta.thumbnail)
 
         lat_lon_str, lat_lon_val = exif.convert_gps(
             pic_meta.gps_latitude, pic_meta.gps_longitude, pic_meta.gps_altitude
         )
         return im, pic_meta, file_meta, info_meta, lat_lon_str, lat_lon_val
 
+    @classmethod
+    def load_picture_meta(cls, _id: int):
+        """load picture meta data from the cache or else from the database
+        :arguments:
+            _id: picture id number in database: integer
+        :returns:
+            im: PIL image
+            pic_meta: PicturesTable
+            file_meta: FilesTable
+            info_meta: InfoTable
+            lat_lon_str: string
+            lat_lon_val: tuple(float, float, float)
+        """
+        if picture_meta := picture_cache.get(_id):
+            return picture_meta
+
+        picture_meta = cls.fetch_picture_meta(_id)
+        if picture_meta and picture_meta[1]:
+            picture_cache.put(_id, picture_meta)
+
+        return picture_meta
+
+    @classmethod
+    @DbUtils.connect
+    def fetch_picture_meta(cls, _id: int, cursor):
+        """load picture meta data from the database in a single query"""
+        empty_return = None, None, None, None, None, (None, None, None)
+        cursor.execute(cls.picture_meta_sql() + "WHERE p.id=%s;", (_id,))
+        if not (row := cursor.fetchone()):
+            return empty_return
+
+        return cls.build_picture_meta(row)
+
+    @classmethod
+    @DbUtils.connect
+    def load_pictures_meta(cls, ids, cursor, thumbnails=True, chunk_size=None):
+        """generator yielding the picture meta data of many pictures, with one
+        query per chunk of ids
+        :arguments:
+            ids: list or iterator of picture ids
+            thumbnails: include the thumbnail image: boolean
+            chunk_size: number of pictures per query: integer
+        :yields:
+            im, pic_meta, file_meta, info_meta, lat_lon_str, lat_lon_val as
+            returned by load_picture_meta, in the order of ids. Ids that are not
+            in the database are skipped, im is None without thumbnails.
+        """
+        sql_string = cls.picture_meta_sql(thumbnail=thumbnails) + "WHERE p.id = ANY(%s);"
+        ids = iter(ids)
+        while chunk := list(itertools.islice(ids, chunk_size or cls.load_chunk_size)):
+            cursor.execute(sql_string, (chunk,))
+            rows = {row[0]: row for row in cursor.fetchall()}
+            for _id in chunk:
+                if row := rows.get(_id):
+                    yield cls.build_picture_meta(row)
+
     @classmethod
     @DbUtils.connect
     def select_pics_for_merge(cls, source_folder, destination_folder, cursor):
@@ -547,66 +1520,69 @@ class PictureDb:
             c_time = datetime.datetime.now()
             f.write(f"===> Select pictures to merge: {c_time}\n")
 
+        signature_versions = cls.get_signature_versions(cursor)
         log_lines = []
-        for foldername, _, filenames in os.walk(source_folder):
-            for filename in filenames:
-                full_file_name = os.path.join(foldername, filename)
-                pic_meta, file_meta = exif.distill_serialized_picfile_meta_data(full_file_name)
-                if not file_meta.file_name:
-                    continue
+        for entry in scanner.scan(source_folder):
+            full_file_name = entry.path
+            pic_meta, file_meta = exif.distill_serialized_picfile_meta_data(
+                full_file_name, entry.stat
+            )
+            if not file_meta.file_name:
+                continue
+
+            next(progress_message)
+
+            # check on md5_signature, for each signature version in use
+            signatures = {pic_meta.signature_version: pic_meta.md5_signature}
+            for version in signature_versions:
+                if version not in signatures:
+                    signatures[version] = file_signature(full_file_name, version)
 
-                next(progress_message)
+            if cls.find_by_signature(cursor, signatures):
+                log_lines.append(
+                    f"{full_file_name} already in database: "
+                    f"match md5_signature, {pic_meta.md5_signature}"
+                )
+                continue
 
-                # check on md5_signature
+            # check on picture dates
+            if pic_meta.date_picture:
                 sql_string = (
                     f"SELECT id FROM {cls.table_pictures} WHERE "
-                    f"md5_signature = '{pic_meta.md5_signature}';"
+                    f"date_picture = %s;"
                 )
-                cursor.execute(sql_string)
+                cursor.execute(sql_string, (pic_meta.date_picture,))
                 if cursor.fetchone():
                     log_lines.append(
-                        f"{full_file_name} already in database: "
-                        f"match md5_signature, {pic_meta.md5_signature}"
+                        f"{full_file_name} seems already in database: "
+                        f"match date_picture {pic_meta.date_picture}..."
                     )
                     continue
 
-                # check on picture dates
-                if pic_meta.date_picture:
-                    sql_string = (
-                        f"SELECT id FROM {cls.table_pictures} WHERE "
-                        f"date_picture = '{pic_meta.date_picture}';"
-                    )
-                    cursor.execute(sql_string)
-                    if cursor.fetchone():
-                        log_lines.append(
-                            f"{full_file_name} seems already in database: "
-                            f"match date_picture {pic_meta.date_picture}..."
-                        )
-                        continue
-
-                else:
-                    sql_string = (
-                        f"SELECT id FROM {cls.table_files} WHERE "
-                        f"file_modified = '{file_meta.file_modified}' AND "
-                        f"file_name = '{file_meta.file_name}';"
-                    )
-                    cursor.execute(sql_string)
-                    if cursor.fetchone():
-                        log_lines.append(
-                            f"{full_file_name} seems already in database: "
-                            f"match file modified {file_meta.file_modified} and "
-                            f"{file_meta.file_name}..."
-                        )
-                        continue
-
-                log_lines.append(
-                    f"{full_file_name} not found in database "
-                    f"and moved to {destination_folder}"
+            else:
+                sql_string = (
+                    f"SELECT id FROM {cls.table_files} WHERE "
+                    f"file_modified = %s AND file_name = %s;"
                 )
-                shutil.move(
-                    os.path.join(foldername, filename),
-                    os.path.join(destination_folder, filename),
+                cursor.execute(
+                    sql_string, (file_meta.file_modified, file_meta.file_name)
                 )
+                if cursor.fetchone():
+                    log_lines.append(
+                        f"{full_file_name} seems already in database: "
+                        f"match file modified {file_meta.file_modified} and "
+                        f"{file_meta.file_name}..."
+                    )
+                    continue
+
+            log_lines.append(
+                f"{full_file_name} not found in database "
+                f"and moved to {destination_folder}"
+            )
+            shutil.move(
+                full_file_name,
+                os.path.join(destination_folder, entry.name),
+            )
 
         with open(log_file, "at") as f:
             for line in log_lines:
@@ -614,6 +1590,40 @@ class PictureDb:
 
         print()
 
+    @classmethod
+    def get_signature_versions(cls, cursor):
+        """signature versions in use in the pictures and signatures tables"""
+        sql_string = (
+            f"SELECT DISTINCT signature_version FROM {cls.table_pictures} "
+            f"UNION SELECT DISTINCT signature_version FROM {cls.table_signatures};"
+        )
+        cursor.execute(sql_string)
+        return sorted(val[0] for val in cursor.fetchall())
+
+    @classmethod
+    def find_by_signature(cls, cursor, signatures):
+        """find a picture that matches any of the signatures
+        :arguments:
+            signatures: dict {signature_version: signature}
+        :returns:
+            picture_id or None
+        """
+        for version, signature in signatures.items():
+            if not signature:
+                continue
+
+            sql_string = (
+                f"SELECT id FROM {cls.table_pictures} "
+                f"WHERE md5_signature = %s AND signature_version = %s "
+                f"UNION ALL SELECT picture_id FROM {cls.table_signatures} "
+                f"WHERE signature = %s AND signature_version = %s LIMIT 1;"
+            )
+            cursor.execute(sql_string, (signature, version, signature, version))
+            if result := cursor.fetchone():
+                return result[0]
+
+        return None
+
     @staticmethod
     def get_geolocation_info(longitude: float, latitude: float) -> dict | None:
         lat_lon = ", ".join([str(latitude), str(longitude)])
@@ -637,21 +1647,38 @@ class PictureDb:
             True: if record is added
             False: if record already in database
         """
+        return cls.insert_location(cursor, picture_id, location)
+
+    @classmethod
+    def insert_location(cls, cursor, picture_id, location, geolocation_info=None):
+        """add record to locations map using the cursor of the calling method.
+        The geolocation info is looked up if it is not given.
+        :arguments:
+            picture_id: integer
+            location: tuple(latitude, longitude, altitude)
+            geolocation_info: json string
+        :return:
+            True: if record is added
+            False: if record already in database
+        """
         sql_string = (
             f"select picture_id from {cls.table_locations} "
-            f"where picture_id = {picture_id} "
+            f"where picture_id = %s "
         )
-        cursor.execute(sql_string)
+        cursor.execute(sql_string, (picture_id,))
         if cursor.fetchone():
             return False
 
         # Point and get_geolocation_info have format (Longitude, Latitude) like (x, y)
         point = Point(location[1], location[0])
-        geolocation_info = cls.get_geolocation_info(location[1], location[0])
+        if geolocation_info is None:
+            geolocation_info = cls.get_geolocation_info(location[1], location[0])
+
+        DbUtils.after_commit(lambda: picture_cache.invalidate([picture_id]))
         sql_string_locations = (
             f"INSERT INTO {cls.table_locations} "
             f"(picture_id, latitude, longitude, altitude, geolocation_info, geom) "
-            f"VALUES (%s, %s, %s, %s, %, ST_SetSRID(%s::geometry, %s)) "
+            f"VALUES (%s, %s, %s, %s, %s, ST_SetSRID(%s::geometry, %s)) "
         )
 
         # TODO fix patch elevation is Null
@@ -672,171 +1699,607 @@ class PictureDb:
 
     @classmethod
     @DbUtils.connect
-    def populate_locations_table(cls, cursor, json_filename=None, picture_ids=None):
+    def remove_from_locations_table(cls, cursor, picture_ids=None, selection=None):
+        if not picture_ids and selection is None:
+            return
+
+        condition, params = cls.ids_condition("picture_id", picture_ids, selection)
+        sql_remove_locations = (
+            f"DELETE FROM {cls.table_locations} WHERE {condition} RETURNING picture_id"
+        )
+        cursor.execute(sql_remove_locations, params)
+        picture_ids = [val[0] for val in cursor.fetchall()]
+        DbUtils.after_commit(lambda: picture_cache.invalidate(picture_ids))
+
+    @classmethod
+    @DbUtils.connect
+    def populate_locations_table(
+        cls, cursor, json_filename=None, picture_ids=None, selection=None
+    ):
         if json_filename is not None:
             with open(json_filename) as json_file:
                 # ensure the tuple has always 2 values
                 picture_ids = json.load(json_file)
 
-            sql_string_pictures = (
-                f"select id, gps_latitude, gps_longitude, gps_altitude "
-                f"from {cls.table_pictures} where id=any(array{picture_ids})"
-            )
-        elif picture_ids:
-            sql_string_pictures = (
-                f"select id, gps_latitude, gps_longitude, gps_altitude "
-                f"from {cls.table_pictures} where id=any(array{picture_ids})"
-            )
+        if selection is not None or picture_ids:
+            condition, params = cls.ids_condition("id", picture_ids, selection)
+
         else:
-            sql_string_pictures = (
-                f"select id, gps_latitude, gps_longitude, gps_altitude "
-                f"from {cls.table_pictures} where not rotate_checked"
-            )
-        cursor.execute(sql_string_pictures)
+            condition, params = "not rotate_checked", ()
 
+        sql_string_pictures = (
+            f"select id, gps_latitude, gps_longitude, gps_altitude "
+            f"from {cls.table_pictures} where {condition}"
+        )
         counter = 0
-        for i, pic in enumerate(cursor.fetchall()):
-            lat_lon_str, lat_lon_val = exif.convert_gps(pic[1], pic[2], pic[3])
-            if lat_lon_str:
-                if cls.add_to_locations_table(pic[0], lat_lon_val):
-                    counter += 1
-                    print(f"{i:5}: {counter:4} pic id: {pic[0]}, {lat_lon_str}")
-
+        with DbUtils.server_cursor(cursor, "populate_locations") as pictures:
+            pictures.execute(sql_string_pictures, params)
+            for i, pic in enumerate(pictures):
+                lat_lon_str, lat_lon_val = exif.convert_gps(pic[1], pic[2], pic[3])
+                if lat_lon_str:
+                    if cls.insert_location(cursor, pic[0], lat_lon_val):
+                        counter += 1
+                        print(f"{i:5}: {counter:4} pic id: {pic[0]}, {lat_lon_str}")
 
     @classmethod
     @DbUtils.connect
-    def update_image(cls, picture_id, image, rotate, cursor):
-        """Assumes thumbnail is changed by a rotation. This method replaces
-        the thumbnail and rotation in the database.
+    def update_image(cls, picture_id, image, cursor, rotate=None):
+        """This method replaces the thumbnail and, if given, the rotation in
+        the database. The thumbnail is stored at rotation 0, the rotation is
+        applied when it is displayed.
         Note the original md5 signature based on the original thumbnail
         at rotation 0 remains unchanged.
         """
-        img_bytes = io.BytesIO()
-        image.save(img_bytes, format="JPEG")
-        picture_bytes = img_bytes.getvalue()
-
+        picture_bytes = exif.get_image_bytes(image)
         thumbnail = json.dumps(picture_bytes.decode(exif.codec))
 
+        cls.update_thumbnail(cursor, picture_id, thumbnail)
+        if rotate is not None:
+            sql_str = f"UPDATE {cls.table_pictures} SET rotate = (%s) WHERE id= (%s) "
+            cursor.execute(sql_str, (rotate, picture_id))
+
+    @classmethod
+    @DbUtils.connect
+    def rotate_pictures(cls, picture_ids, degrees, cursor):
+        """rotate the pictures by degrees clockwise, only the rotate column is
+        changed
+        """
+        DbUtils.after_commit(lambda: picture_cache.invalidate(picture_ids))
+        sql_str = (
+            f"UPDATE {cls.table_pictures} SET rotate = (rotate + %s) %% 360 "
+            f"WHERE id = ANY(%s);"
+        )
+        cursor.execute(sql_str, (degrees % 360, list(picture_ids)))
+
+    @classmethod
+    def update_thumbnail(cls, cursor, picture_id, thumbnail):
+        """replace the thumbnail of a picture using the cursor of the calling
+        method, the previous thumbnail is removed if no other picture uses it
+        """
+        DbUtils.after_commit(lambda: picture_cache.invalidate([picture_id]))
+        thumbnail_hash = exif.thumbnail_hash(thumbnail)
+        cls.insert_thumbnails(
+            cursor, [(thumbnail_hash, thumbnail, THUMBNAIL_SETTINGS.name)]
+        )
         sql_str = (
-            f"UPDATE {cls.table_pictures} "
-            f"SET thumbnail = (%s), "
-            f"rotate = (%s) "
-            f"WHERE id= (%s) "
+            f"SELECT thumbnail_hash FROM {cls.table_payloads} WHERE picture_id= (%s);"
         )
-        cursor.execute(sql_str, (thumbnail, rotate, picture_id))
+        cursor.execute(sql_str, (picture_id,))
+        previous_hash = cursor.fetchone()
+
+        sql_str = (
+            f"UPDATE {cls.table_payloads} SET thumbnail_hash = (%s) "
+            f"WHERE picture_id= (%s) "
+        )
+        cursor.execute(sql_str, (thumbnail_hash, picture_id))
+        if previous_hash and previous_hash[0] not in (None, thumbnail_hash):
+            cls.remove_unused_thumbnails(cursor, [previous_hash[0]])
 
     @classmethod
     @DbUtils.connect
-    def store_attributes(cls, picture_id, image, pic_meta, cursor):
-        img_bytes = io.BytesIO()
-        image.save(img_bytes, format="JPEG")
-        picture_bytes = img_bytes.getvalue()
+    def store_attributes(cls, picture_id, pic_meta, cursor):
+        """store the attributes edited in the viewer, only the fields in
+        pic_meta.dirty are updated. The rotation is stored in the rotate column
+        and the thumbnail is not changed.
+        :returns:
+            names of the columns updated: list
+        """
+        if not (dirty := pic_meta.dirty & set(cls.attribute_columns)):
+            return []
 
-        thumbnail = json.dumps(picture_bytes.decode(exif.codec))
+        DbUtils.after_commit(lambda: picture_cache.invalidate([picture_id]))
         pic_meta = exif.serialize_gps_data_fields(pic_meta)
-
+        fields = [name for name in cls.attribute_columns if name in dirty]
+        columns = [cls.attribute_columns[name] for name in fields]
         sql_str = (
-            f"UPDATE {cls.table_pictures} "
-            f"SET thumbnail = (%s), "
-            f"date_picture = (%s), "
-            f"camera_make = (%s), "
-            f"camera_model = (%s), "
-            f"gps_latitude = (%s), "
-            f"gps_longitude = (%s), "
-            f"gps_altitude = (%s), "
-            f"gps_img_dir = (%s), "
-            f"rotate = (%s) "
-            f"WHERE id= (%s) "
+            f"UPDATE {cls.table_pictures} SET "
+            + ", ".join(f"{column} = (%s)" for column in columns)
+            + " WHERE id= (%s) "
         )
         cursor.execute(
             sql_str,
-            (
-                thumbnail,
-                pic_meta.date_picture,
-                pic_meta.camera_make,
-                pic_meta.camera_model,
-                pic_meta.gps_latitude,
-                pic_meta.gps_longitude,
-                pic_meta.gps_altitude,
-                pic_meta.gps_img_direction,
-                pic_meta.rotate,
-                picture_id,
-            ),
+            [getattr(pic_meta, name) for name in fields] + [picture_id],
         )
+        if "date_picture" in fields:
+            cls.update_picture_days(cursor, [picture_id])
+
+        # serialize_gps_data_fields only changes the representation
+        pic_meta.dirty.difference_update(cls.attribute_columns)
+        return columns
 
     @classmethod
     @DbUtils.connect
-    def get_file_paths(cls, cursor):
+    def bulk_update_attributes(
+        cls,
+        picture_ids,
+        cursor,
+        location=None,
+        camera_make=None,
+        camera_model=None,
+        date_offset=None,
+    ):
+        """set attributes of many pictures in a single transaction, attributes
+        that are None are not changed
+        :arguments:
+            picture_ids: list of picture ids
+            location: 'latitude, longitude[, altitude]' string or tuple, the
+                      locations table is updated as well. An empty string
+                      removes the location.
+            :raises:
+                ValueError if location is not empty and can not be parsed
+            camera_make: string
+            camera_model: string
+            date_offset: datetime.timedelta added to date_picture
+        :returns:
+            number of pictures updated: integer
+        """
+        picture_ids = list(picture_ids)
+        if not picture_ids:
+            return 0
+
+        DbUtils.after_commit(lambda: picture_cache.invalidate(picture_ids))
+        columns, values = [], []
+        if camera_make is not None:
+            columns.append("camera_make = %s")
+            values.append(camera_make)
+
+        if camera_model is not None:
+            columns.append("camera_model = %s")
+            values.append(camera_model)
+
+        if date_offset is not None:
+            columns.append("date_picture = date_picture + %s")
+            values.append(date_offset)
+
+        lat_lon_val = None
+        if location is not None:
+            gps = exif.serialize_decimalgps(location)
+            lat_lon_str, lat_lon_val = exif.convert_gps(
+                *[json.loads(val) for val in gps[:3]]
+            )
+            if not lat_lon_str:
+                # only an explicit empty location removes the location
+                if location != "":
+                    raise ValueError(f"invalid location: {location}")
+
+                lat_lon_val = None
+
+            columns += [
+                "gps_latitude = %s",
+                "gps_longitude = %s",
+                "gps_altitude = %s",
+                "gps_img_dir = %s",
+            ]
+            values += list(gps)
+
+        if not columns:
+            return 0
+
+        sql_string = (
+            f"UPDATE {cls.table_pictures} SET {', '.join(columns)} "
+            f"WHERE id = ANY(%s);"
+        )
+        cursor.execute(sql_string, values + [picture_ids])
+        updated = cursor.rowcount
+        if date_offset is not None:
+            cls.update_picture_days(cursor, picture_ids)
+
+        if location is not None and lat_lon_val:
+            # Point and get_geolocation_info have format (Longitude, Latitude)
+            latitude, longitude, altitude = lat_lon_val
+            geolocation_info = cls.get_geolocation_info(longitude, latitude)
+            sql_string = (
+                f"INSERT INTO {cls.table_locations} "
+                f"(picture_id, latitude, longitude, altitude, geolocation_info, geom) "
+                f"SELECT picture_id, %s, %s, %s, %s, ST_SetSRID(%s::geometry, %s) "
+                f"FROM unnest(%s) AS picture_id "
+                f"ON CONFLICT (picture_id) DO UPDATE SET "
+                f"latitude = EXCLUDED.latitude, longitude = EXCLUDED.longitude, "
+                f"altitude = EXCLUDED.altitude, "
+                f"geolocation_info = EXCLUDED.geolocation_info, geom = EXCLUDED.geom;"
+            )
+            cursor.execute(
+                sql_string,
+                (
+                    latitude,
+                    longitude,
+                    0.0 if altitude is None else altitude,
+                    geolocation_info,
+                    Point(longitude, latitude).wkb_hex,
+                    EPSG_WGS84,
+                    picture_ids,
+                ),
+            )
+
+        elif location is not None:
+            sql_string = f"DELETE FROM {cls.table_locations} WHERE picture_id = ANY(%s);"
+            cursor.execute(sql_string, (picture_ids,))
+
+        return updated
+
+    @classmethod
+    def get_file_paths(cls):
         """get a sorted list of unique file_paths with base folder removed"""
+        return list(cls.get_folders())
+
+    @classmethod
+    @DbUtils.connect
+    def get_folders(cls, cursor):
+        """get the folders with base folder removed, like get_file_paths, and the
+        ids of the folders each of them stands for
+        :returns:
+            dict {folder: [folder_id, ...]} sorted by folder
+        """
         pattern = r"^[a-zA-Z]:\\(?:pictures\\){1,2}(.*)\\$"
         sql_str = (
-            f"SELECT DISTINCT lower(file_path) fp from {cls.table_files} ORDER BY fp"
+            f"SELECT fo.id, fo.path FROM {cls.table_folders} fo WHERE EXISTS ("
+            f"SELECT 1 FROM {cls.table_files} f WHERE f.folder_id = fo.id);"
         )
         cursor.execute(sql_str)
-        return sorted(
-            list(set(re.search(pattern, val[0]).group(1) for val in cursor.fetchall()))
-        )
+        folders = {}
+        for folder_id, path in cursor.fetchall():
+            if match := re.search(pattern, path.lower()):
+                folders.setdefault(match.group(1), []).append(folder_id)
+
+        return dict(sorted(folders.items()))
+
+    @classmethod
+    def get_folder_tree(cls):
+        """get the folder tree with the number of pictures and of pictures with
+        rotation not checked per folder. The counts are stored in the folders
+        table, so the tree is read again without counting the files and shows
+        pictures added or changed by other processes.
+        :returns:
+            FolderTree
+        """
+        folder_tree.update(cls.load_folder_counts())
+        return folder_tree
 
     @classmethod
     @DbUtils.connect
-    def get_ids_by_folder(cls, folder, cursor):
-        """get the ids of pictures where folder matches."""
-        folder = folder.replace("'", "''")
+    def load_folder_counts(cls, cursor):
+        """rows (id, parent_id, name, path, pictures, unchecked) of all folders,
+        parents come before their subfolders
+        """
         sql_str = (
-            f"SELECT p.id from {cls.table_pictures} as p "
-            f"JOIN {cls.table_files} as f on f.picture_id = p.id "
-            f"WHERE lower(f.file_path) LIKE '%{folder}\\\\'"
+            f"SELECT id, parent_id, name, path, pictures, unchecked "
+            f"FROM {cls.table_folders} ORDER BY length(path);"
         )
         cursor.execute(sql_str)
-        return [val[0] for val in cursor.fetchall()]
+        return cursor.fetchall()
 
     @classmethod
-    @DbUtils.connect
-    def get_ids_by_date(cls, date_select, cursor):
-        """get the ids of pictures where the file created date is greater
-        than date_select
+    def get_picture_folder_ids(cls, cursor, picture_ids=None, selection=None):
+        """ids of the folders of the pictures, using the cursor of the calling
+        method
         """
+        condition, params = cls.ids_condition("picture_id", picture_ids, selection)
+        sql_str = f"SELECT DISTINCT folder_id FROM {cls.table_files} WHERE {condition};"
+        cursor.execute(sql_str, params)
+        return [val[0] for val in cursor.fetchall() if val[0] is not None]
+
+    @classmethod
+    def update_folder_counts(cls, cursor, folder_ids=None):
+        """count the pictures and the pictures with rotation not checked of the
+        folders again, of all folders if folder_ids is None, using the cursor of
+        the calling method
+        """
+        condition, params = "TRUE", ()
+        if folder_ids is not None:
+            if not (folder_ids := list(folder_ids)):
+                return
+
+            condition, params = cls.ids_condition("fo.id", folder_ids)
+
         sql_str = (
-            f"SELECT p.id from {cls.table_pictures} as p "
-            f"JOIN {cls.table_files} as f on f.picture_id = p.id "
-            f'WHERE f.file_created > \'{date_select.strftime("%Y-%m-%d")}\' '
+            f"UPDATE {cls.table_folders} fo SET pictures = c.pictures, "
+            f"unchecked = c.unchecked FROM ("
+            f"SELECT fo.id, count(f.id) AS pictures, "
+            f"count(f.id) FILTER (WHERE NOT p.rotate_checked) AS unchecked "
+            f"FROM {cls.table_folders} fo "
+            f"LEFT JOIN {cls.table_files} f ON f.folder_id = fo.id "
+            f"LEFT JOIN {cls.table_pictures} p ON p.id = f.picture_id "
+            f"WHERE {condition} GROUP BY fo.id) AS c WHERE fo.id = c.id;"
         )
-        cursor.execute(sql_str)
-        return [val[0] for val in cursor.fetchall()]
+        cursor.execute(sql_str, params)
+
+    @staticmethod
+    def day_range(year, month=None, day=None):
+        """first day and the day after the last day of a year, month or day
+        :returns:
+            day_from, day_to: datetime.date
+        """
+        if day is not None:
+            day_from = datetime.date(year, month, day)
+            return day_from, day_from + datetime.timedelta(days=1)
+
+        if month is not None:
+            day_from = datetime.date(year, month, 1)
+            next_month = day_from + datetime.timedelta(days=31)
+            return day_from, next_month.replace(day=1)
+
+        return datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1)
 
     @classmethod
     @DbUtils.connect
-    def filter_ids(cls, ids, cursor, db_filter=DbFilter.ALL):
-        """filter ids on value of db_filter."""
+    def get_day_counts(cls, day_from, day_to, cursor):
+        """number of pictures per day from day_from up to day_to
+        :returns:
+            dict {day: number of pictures} of the days that have pictures
+        """
+        sql_str = (
+            f"SELECT day, count(*) FROM {cls.table_picture_days} "
+            f"WHERE day >= %s AND day < %s GROUP BY day ORDER BY day;"
+        )
+        cursor.execute(sql_str, (day_from, day_to))
+        return dict(cursor.fetchall())
+
+    @staticmethod
+    def db_filter_condition(db_filter, table=""):
+        """sql condition of db_filter on the pictures table, or its alias table"""
+        prefix = f"{table}." if table else ""
         match db_filter:
             case DbFilter.NOGPS:
-                sql_str = (
-                    f"SELECT id from {cls.table_pictures} "
-                    f"WHERE id=any(array{ids}) AND length(gps_latitude::text) < 3"
-                )
+                return f"length({prefix}gps_latitude::text) < 3"
             case DbFilter.CHECKED:
-                sql_str = (
-                    f"SELECT id from {cls.table_pictures} "
-                    f"WHERE id=any(array{ids}) AND rotate_checked"
-                )
+                return f"{prefix}rotate_checked"
             case DbFilter.NOT_CHECKED:
-                sql_str = (
-                    f"SELECT id from {cls.table_pictures} "
-                    f"WHERE id=any(array{ids}) AND not rotate_checked"
-                )
-            case other:
-                sql_str = (
-                    f"SELECT id from {cls.table_pictures} " f"WHERE id=any(array{ids})"
-                )
-        cursor.execute(sql_str)
+                return f"not {prefix}rotate_checked"
+            case _:
+                return "TRUE"
+
+    @classmethod
+    @DbUtils.connect
+    def select_ids(
+        cls,
+        cursor,
+        folder_ids=None,
+        folder=None,
+        date_from=None,
+        date_to=None,
+        day_from=None,
+        day_to=None,
+        db_filter=DbFilter.ALL,
+        selection=None,
+        order_by=None,
+        limit=None,
+        offset=0,
+    ):
+        """get the ids of the pictures that meet all given criteria with a single
+        query, criteria that are None are not applied
+        :arguments:
+            folder_ids: list of folder ids, like the values of get_folders
+            folder: end of the folder, like 2019\\holiday, matches any base folder
+            date_from: file created on or after this date
+            date_to: file created before this date
+            day_from: day of the picture, or of the file modified date if it is
+                      unknown, on or after this day
+            day_to: day of the picture before this day
+            db_filter: DbFilter
+            selection: name of a stored selection
+            order_by: key of sort_orders, default the order of the selection or id
+            limit, offset: return a page of limit ids starting at offset
+        :returns:
+            list of picture ids
+        """
+        conditions = [cls.db_filter_condition(db_filter, "p")]
+        params = []
+        join_selection = ""
+        if selection is not None:
+            join_selection = (
+                f"JOIN {cls.table_selections} AS s "
+                f"ON s.picture_id = p.id AND s.name = %s "
+            )
+            params.append(selection)
+
+        if folder_ids is not None:
+            conditions.append("f.folder_id = ANY(%s)")
+            params.append(list(folder_ids))
+
+        if folder is not None:
+            folder = (
+                folder.lower()
+                .replace("\\", "\\\\")
+                .replace("%", "\\%")
+                .replace("_", "\\_")
+            )
+            conditions.append("lower(fo.path) LIKE %s")
+            params.append(f"%{folder}\\\\")
+
+        if date_from is not None:
+            conditions.append("f.file_created >= %s")
+            params.append(date_from)
+
+        if date_to is not None:
+            conditions.append("f.file_created < %s")
+            params.append(date_to)
+
+        join_days = ""
+        if day_from is not None or day_to is not None or order_by == "day":
+            join_days = f"JOIN {cls.table_picture_days} AS d ON d.picture_id = p.id "
+
+        if day_from is not None:
+            conditions.append("d.day >= %s")
+            params.append(day_from)
+
+        if day_to is not None:
+            conditions.append("d.day < %s")
+            params.append(day_to)
+
+        if order_by is None:
+            order_by = "selection" if selection is not None else "id"
+
+        sql_str = (
+            f"SELECT p.id FROM {cls.table_pictures} AS p "
+            f"JOIN {cls.table_files} AS f ON f.picture_id = p.id "
+            f"LEFT JOIN {cls.table_folders} AS fo ON fo.id = f.folder_id "
+            f"{join_selection}"
+            f"{join_days}"
+            f"WHERE {' AND '.join(conditions)} "
+            f"ORDER BY {cls.sort_orders[order_by]} NULLS LAST, p.id"
+        )
+        if limit is not None:
+            sql_str += " LIMIT %s OFFSET %s"
+            params += [limit, offset]
+
+        cursor.execute(sql_str, params)
+        return [val[0] for val in cursor.fetchall()]
+
+    @classmethod
+    def get_ids_by_folder(cls, folder):
+        """get the ids of pictures where folder matches the end of the file path."""
+        return cls.select_ids(folder=folder)
+
+    @classmethod
+    def get_ids_by_date(cls, date_select):
+        """get the ids of pictures where the file created date is on or after
+        date_select
+        """
+        return cls.select_ids(date_from=date_select)
+
+    @classmethod
+    def ids_condition(cls, column, picture_ids=None, selection=None):
+        """sql condition and its parameters for column being one of picture_ids,
+        or one of the ids of the named selection if selection is given
+        """
+        if selection is not None:
+            return (
+                f"{column} IN (SELECT picture_id FROM {cls.table_selections} "
+                f"WHERE name = %s)",
+                (selection,),
+            )
+
+        return f"{column} = ANY(%s)", (list(picture_ids or []),)
+
+    @classmethod
+    @DbUtils.connect
+    def save_selection(cls, name, picture_ids, cursor):
+        """store picture_ids in their order as the selection name, replacing a
+        selection with the same name. Ids that are not in the pictures table are
+        left out.
+        :returns:
+            number of pictures in the selection: integer
+        """
+        sql_string = f"DELETE FROM {cls.table_selections} WHERE name = %s;"
+        cursor.execute(sql_string, (name,))
+        sql_string = (
+            f"INSERT INTO {cls.table_selections} (name, position, picture_id) "
+            f"SELECT %s, min(selected.position), selected.id "
+            f"FROM unnest(%s::integer[]) WITH ORDINALITY AS selected(id, position) "
+            f"JOIN {cls.table_pictures} ON {cls.table_pictures}.id = selected.id "
+            f"GROUP BY selected.id;"
+        )
+        cursor.execute(sql_string, (name, list(picture_ids)))
+        return cursor.rowcount
+
+    @classmethod
+    @DbUtils.connect
+    def save_selection_where(cls, name, condition, cursor, params=None):
+        """store the pictures that meet the sql condition on the pictures table
+        as the selection name, ordered by id. Parameters in condition are taken
+        from params, a literal % is written as %%. For example:
+            save_selection_where(
+                'to_check', "gps_latitude ->> 'ref' in ('N', 'S') and not rotate_checked"
+            )
+        :returns:
+            number of pictures in the selection: integer
+        """
+        sql_string = f"DELETE FROM {cls.table_selections} WHERE name = %s;"
+        cursor.execute(sql_string, (name,))
+        sql_string = (
+            f"INSERT INTO {cls.table_selections} (name, position, picture_id) "
+            f"SELECT %s, row_number() OVER (ORDER BY id), id "
+            f"FROM {cls.table_pictures} WHERE {condition};"
+        )
+        cursor.execute(sql_string, (name, *(params or ())))
+        return cursor.rowcount
+
+    @classmethod
+    @DbUtils.connect
+    def load_selection(cls, name, cursor):
+        """ids of the selection name in the order they were stored"""
+        sql_string = (
+            f"SELECT picture_id FROM {cls.table_selections} "
+            f"WHERE name = %s ORDER BY position;"
+        )
+        cursor.execute(sql_string, (name,))
+        return [val[0] for val in cursor.fetchall()]
+
+    @classmethod
+    @DbUtils.connect
+    def delete_selection(cls, name, cursor):
+        sql_string = f"DELETE FROM {cls.table_selections} WHERE name = %s;"
+        cursor.execute(sql_string, (name,))
+
+    @classmethod
+    @DbUtils.connect
+    def get_selections(cls, cursor):
+        """:returns: list of (name, number of pictures)"""
+        sql_string = (
+            f"SELECT name, count(*) FROM {cls.table_selections} "
+            f"GROUP BY name ORDER BY name;"
+        )
+        cursor.execute(sql_string)
+        return cursor.fetchall()
+
+    @classmethod
+    @DbUtils.connect
+    def filter_ids(cls, ids, cursor, db_filter=DbFilter.ALL, selection=None):
+        """filter ids, or the ids of the named selection in their stored order,
+        on value of db_filter.
+        """
+        if selection is not None:
+            condition, params = "TRUE", ()
+
+        else:
+            condition, params = cls.ids_condition("id", ids)
+
+        condition += f" AND {cls.db_filter_condition(db_filter)}"
+        if selection is not None:
+            sql_str = (
+                f"SELECT id FROM {cls.table_pictures} "
+                f"JOIN {cls.table_selections} ON picture_id = id AND name = %s "
+                f"WHERE {condition} ORDER BY position"
+            )
+            params = (selection,)
+
+        else:
+            sql_str = f"SELECT id FROM {cls.table_pictures} WHERE {condition}"
+
+        cursor.execute(sql_str, params)
         return [val[0] for val in cursor.fetchall()]
 
     @classmethod
     @DbUtils.connect
-    def set_rotate_check(cls, pic_ids, cursor, set_value=True):
-        """set rotate_check to True or False"""
+    def set_rotate_check(cls, pic_ids, cursor, set_value=True, selection=None):
+        """set rotate_check to True or False for pic_ids or the named selection"""
+        condition, params = cls.ids_condition("id", pic_ids, selection)
         sql_str = (
-            f"UPDATE {cls.table_pictures} set rotate_checked = {set_value} "
-            f"where id=any(array{pic_ids}) "
+            f"UPDATE {cls.table_pictures} SET rotate_checked = %s "
+            f"WHERE {condition} RETURNING id"
         )
-        cursor.execute(sql_str)
+        cursor.execute(sql_str, (set_value, *params))
+        picture_ids = [val[0] for val in cursor.fetchall()]
+        DbUtils.after_commit(lambda: picture_cache.invalidate(picture_ids))
+        folder_ids = cls.get_picture_folder_ids(cursor, picture_ids)
+        cls.update_folder_counts(cursor, folder_ids)
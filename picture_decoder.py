@@ -0,0 +1,187 @@
+""" supervised pool of worker processes to decode picture files
+
+    Decoding large HEIC files with pillow_heif takes a lot of memory and may hang
+    or crash the interpreter. The DecodePool runs the decoding in separate worker
+    processes, so a hung or crashed decode only fails that file:
+        - a task that does not finish within the timeout kills its worker
+        - a worker that crashes is replaced by a new one
+        - on posix the address space of a worker is limited to memory_limit
+        - a worker is recycled after max_tasks tasks or when its memory use
+          exceeds half the memory_limit
+    Workers are started when first needed. The pool can be used from several
+    threads at the same time, each task takes an idle worker.
+"""
+import multiprocessing
+import queue
+import psutil
+from picture_exif import Exif
+
+try:
+    import resource
+
+except ImportError:
+    resource = None
+
+MB = 1024 * 1024
+
+
+class DecodeError(Exception):
+    pass
+
+
+def decode_worker(connection, memory_limit):
+    """main loop of a worker process, tasks are (filename, file_stat) tuples and
+    the result is sent back as (pic_meta, file_meta), error
+    """
+    if resource and memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    while True:
+        try:
+            task = connection.recv()
+
+        except EOFError:
+            break
+
+        if task is None:
+            break
+
+        filename, file_stat = task
+        try:
+            result = Exif.distill_serialized_picfile_meta_data(filename, file_stat)
+            connection.send((result, None))
+
+        except Exception as error:  # pylint: disable=broad-except
+            connection.send((None, repr(error)))
+
+
+class DecodeWorker:
+    def __init__(self, memory_limit):
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=decode_worker, args=(child_connection, memory_limit), daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+        self.tasks = 0
+        self.broken = False
+
+    def run(self, filename, file_stat, timeout):
+        self.tasks += 1
+        try:
+            self.connection.send((filename, file_stat))
+
+        except OSError:
+            # the worker died while it was idle
+            self.broken = True
+            self.process.join(1)
+            raise DecodeError(
+                f"decode worker died with exit code {self.process.exitcode}"
+            )
+
+        if not self.connection.poll(timeout):
+            self.broken = True
+            raise DecodeError(f"decode timed out after {timeout} seconds")
+
+        try:
+            result, error = self.connection.recv()
+
+        except (EOFError, OSError):
+            self.broken = True
+            self.process.join(1)
+            raise DecodeError(
+                f"decode worker crashed with exit code {self.process.exitcode}"
+            )
+
+        if error:
+            raise DecodeError(error)
+
+        return result
+
+    def memory(self):
+        try:
+            return psutil.Process(self.process.pid).memory_info().rss
+
+        except psutil.Error:
+            return 0
+
+    def stop(self, kill=False):
+        if not kill:
+            try:
+                self.connection.send(None)
+                self.process.join(5)
+
+            except OSError:
+                pass
+
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+        self.connection.close()
+
+
+class DecodePool:
+    """pool of decode worker processes
+    :arguments:
+        workers: number of worker processes: integer
+        timeout: maximum time for a single decode in seconds
+        max_tasks: number of tasks after which a worker is recycled: integer
+        memory_limit: memory limit of a worker in MB: integer
+    """
+
+    def __init__(self, workers=4, timeout=120, max_tasks=200, memory_limit=4096):
+        self.timeout = timeout
+        self.max_tasks = max_tasks
+        self.memory_limit = memory_limit * MB if memory_limit else None
+        self.idle_workers = queue.Queue()
+        for _ in range(workers):
+            self.idle_workers.put(None)
+
+    def decode(self, filename, file_stat=None):
+        """decode the file in a worker process
+        :returns:
+            pic_meta: PictureMetaDataSerialized
+            file_meta: FileMetaDataSerialized
+        :raises:
+            DecodeError if the decode failed, timed out or crashed the worker
+        """
+        worker = self.idle_workers.get()
+        try:
+            if worker and not worker.process.is_alive():
+                worker.stop(kill=True)
+                worker = None
+
+            if worker is None:
+                worker = DecodeWorker(self.memory_limit)
+
+            try:
+                return worker.run(filename, file_stat, self.timeout)
+
+            except DecodeError:
+                if worker.broken:
+                    worker.stop(kill=True)
+                    worker = None
+
+                raise
+
+        finally:
+            if worker and (
+                worker.tasks >= self.max_tasks
+                or (self.memory_limit and worker.memory() > self.memory_limit / 2)
+            ):
+                worker.stop()
+                worker = None
+
+            self.idle_workers.put(worker)
+
+    def close(self):
+        while True:
+            try:
+                worker = self.idle_workers.get_nowait()
+
+            except queue.Empty:
+                break
+
+            if worker:
+                worker.stop()
@@ -1,19 +1,147 @@
 import os
 import io
 import hashlib
+import struct
 from dataclasses import dataclass
 import datetime
 import json
+import zlib
+from decouple import config
 from PIL import Image, ImageShow
 from pillow_heif import register_heif_opener
 import piexif
 
+try:
+    import zstandard
+
+except ImportError:
+    zstandard = None
+
 register_heif_opener()
-# note: the MD5 signature is based on the thumbnail made with the
-# size below. So changing the size will make check on signature invalid
+# note: the signature of a picture does not depend on this size, see SIGNATURES
 DATABASE_PICTURE_SIZE = (600, 600)
 
 
+@dataclass
+class ThumbnailSettings:
+    """encoding of the thumbnails stored in the database, subsampling is the
+    JPEG chroma subsampling (0: 4:4:4, 1: 4:2:2, 2: 4:2:0)
+    """
+
+    codec: str = "JPEG"
+    quality: int = 75
+    subsampling: int = 2
+    optimize: bool = False
+    progressive: bool = False
+
+    @property
+    def name(self):
+        """name recorded with each thumbnail, it includes every setting that
+        changes the encoding, like jpeg-75-s2-o0-p0 or webp-75
+        """
+        if self.codec == "WEBP":
+            return f"webp-{self.quality}"
+
+        return (
+            f"jpeg-{self.quality}-s{self.subsampling}"
+            f"-o{int(self.optimize)}-p{int(self.progressive)}"
+        )
+
+    def save_options(self):
+        if self.codec == "WEBP":
+            return {"format": "WEBP", "quality": self.quality, "method": 6}
+
+        return {
+            "format": "JPEG",
+            "quality": self.quality,
+            "subsampling": self.subsampling,
+            "optimize": self.optimize,
+            "progressive": self.progressive,
+        }
+
+
+# thumbnail encoding used by all methods that store a thumbnail: THUMBNAIL_CODEC is
+# JPEG or WEBP, the other settings as in ThumbnailSettings
+THUMBNAIL_SETTINGS = ThumbnailSettings(
+    codec=config("THUMBNAIL_CODEC", default="JPEG").upper(),
+    quality=config("THUMBNAIL_QUALITY", default=75, cast=int),
+    subsampling=config("THUMBNAIL_SUBSAMPLING", default=2, cast=int),
+    optimize=config("THUMBNAIL_OPTIMIZE", default=False, cast=bool),
+    progressive=config("THUMBNAIL_PROGRESSIVE", default=False, cast=bool),
+)
+
+# storage of the exif block: EXIF_CODEC is zlib, zstd or none, EXIF_MAKERNOTE is
+# keep, archive (stored in a separate table) or drop
+EXIF_CODEC = config("EXIF_CODEC", default="zlib").lower()
+EXIF_MAKERNOTE = config("EXIF_MAKERNOTE", default="archive").lower()
+MAKERNOTE_TAG = 37500
+EXIF_IFD_TAG = 0x8769
+GPS_IFD_TAG = 0x8825
+INTEROP_IFD_TAG = 0xA005
+
+# tags read by the fast exif extractor, tag number: name
+EXIF_0TH_TAGS = {271: "Make", 272: "Model", 306: "DateTime"}
+EXIF_GPS_IFD_POINTER = 34853
+EXIF_GPS_TAGS = {
+    1: "GPSLatitudeRef",
+    2: "GPSLatitude",
+    3: "GPSLongitudeRef",
+    4: "GPSLongitude",
+    5: "GPSAltitudeRef",
+    6: "GPSAltitude",
+    16: "GPSImgDirectionRef",
+    17: "GPSImgDirection",
+}
+# tiff value type: (struct format, size)
+TIFF_TYPES = {
+    1: ("B", 1),
+    2: ("s", 1),
+    3: ("H", 2),
+    4: ("L", 4),
+    5: ("LL", 8),
+    7: ("B", 1),
+    9: ("l", 4),
+    10: ("ll", 8),
+}
+
+
+def signature_v1(thumbnail):
+    """md5 of the JPEG, Pillow default settings, of the 600x600 thumbnail"""
+    img_bytes = io.BytesIO()
+    if thumbnail.mode in ("RGBA", "P"):
+        thumbnail = thumbnail.convert("RGB")
+
+    thumbnail.save(img_bytes, format="JPEG")
+    return hashlib.md5(img_bytes.getvalue()).hexdigest()
+
+
+def signature_v2(thumbnail):
+    """md5 of the RGB pixel data of the 256x256 thumbnail, this does not depend
+    on the JPEG encoder
+    """
+    return hashlib.md5(thumbnail.convert("RGB").tobytes()).hexdigest()
+
+
+# registry of signature algorithms, version: (thumbnail size, function)
+# an algorithm must never be changed once in use, add a new version instead
+SIGNATURES = {
+    1: ((600, 600), signature_v1),
+    2: ((256, 256), signature_v2),
+}
+SIGNATURE_VERSION = config("SIGNATURE_VERSION", default=1, cast=int)
+
+
+def file_signature(filename, version=SIGNATURE_VERSION):
+    """signature of a picture file, returns None if the file can not be read"""
+    try:
+        with Image.open(filename) as im:
+            return Exif.picture_signature(im, version)
+
+    except OSError as e:
+        print(f"file {filename}, exception: {e}")
+        return None
+
+
 @dataclass
 class PictureMetaDataSerialized:
     date_picture: str
@@ -26,6 +154,11 @@ class PictureMetaDataSerialized:
     gps_img_direction: str
     thumbnail: str
     exif: str
+    exif_raw: bytes
+    exif_codec: str
+    makernote: bytes
+    signature_version: int
+    thumbnail_codec: str
 
 
 @dataclass
@@ -118,19 +251,99 @@ class Exif:
     @classmethod
     def get_exif_dict(cls, im, file):
         if im_info := im.info.get("exif"):
-            try:
-                return cls.exif_to_tag(piexif.load(im_info))
+            return cls.exif_raw_to_dict(im_info, file)
+
+        return {}
 
-            except Exception as e:
-                print(f"file: {file}, exception: {e}")
+    @classmethod
+    def exif_raw_to_dict(cls, exif_raw, file=None):
+        """materialise the full exif tag dict from the raw exif block"""
+        try:
+            return cls.exif_to_tag(piexif.load(bytes(exif_raw)))
+
+        except Exception as e:
+            print(f"file: {file}, exception: {e}")
 
         return {}
 
+    @classmethod
+    def get_exif_tags(cls, exif_raw, file=None):
+        """fast extractor that only reads the tags required for the picture meta
+        data (Make, Model, DateTime and the GPS tags in EXIF_GPS_TAGS) from the raw
+        exif block. Values have the same form as in the dict of get_exif_dict.
+        """
+        if not exif_raw:
+            return {}
+
+        tiff = exif_raw[6:] if exif_raw[:4] == b"Exif" else exif_raw
+        try:
+            endian = {b"II": "<", b"MM": ">"}[tiff[:2]]
+            ifd_0th = struct.unpack(endian + "L", tiff[4:8])[0]
+            tags_0th = cls.read_ifd(
+                tiff, endian, ifd_0th, {**EXIF_0TH_TAGS, EXIF_GPS_IFD_POINTER: "GPS"}
+            )
+            gps_pointer = tags_0th.pop("GPS", None)
+            tags_gps = (
+                cls.read_ifd(tiff, endian, gps_pointer, EXIF_GPS_TAGS)
+                if gps_pointer
+                else {}
+            )
+
+        except (KeyError, IndexError, ValueError, struct.error) as e:
+            print(f"file: {file}, exception: {e}")
+            return {}
+
+        return {"0th": tags_0th, "GPS": tags_gps}
+
+    @classmethod
+    def read_ifd(cls, tiff, endian, offset, tags):
+        """read the tags from the ifd at offset in the tiff block"""
+        values = {}
+        number_entries = struct.unpack(endian + "H", tiff[offset : offset + 2])[0]
+        for i in range(number_entries):
+            entry = offset + 2 + 12 * i
+            tag, value_type, count = struct.unpack(
+                endian + "HHL", tiff[entry : entry + 8]
+            )
+            if tag not in tags or value_type not in TIFF_TYPES:
+                continue
+
+            value_format, size = TIFF_TYPES[value_type]
+            if size * count > 4:
+                value_offset = struct.unpack(endian + "L", tiff[entry + 8 : entry + 12])[
+                    0
+                ]
+
+            else:
+                value_offset = entry + 8
+
+            if value_type == 2:
+                # ascii without the terminating null, as piexif
+                value = tiff[value_offset : value_offset + count - 1].decode(cls.codec)
+
+            else:
+                numbers = struct.unpack(
+                    endian + value_format * count,
+                    tiff[value_offset : value_offset + size * count],
+                )
+                if len(value_format) == 2:
+                    # rationals as (numerator, denominator)
+                    numbers = tuple(zip(numbers[::2], numbers[1::2]))
+
+                value = numbers[0] if count == 1 else numbers
+
+            values[tags[tag]] = value
+
+        return values
+
     @classmethod
     def distill_serialized_picfile_meta_data(
-        cls, filename: str
+        cls, filename: str, file_stat: os.stat_result = None
     ) -> tuple[PictureMetaDataSerialized, FileMetaDataSerialized]:
-        pic_meta = PictureMetaDataSerialized(*[None] * 10)
+        """file_stat can be given if already known, for example from a directory
+        entry, to avoid another os.stat on the file
+        """
+        pic_meta = PictureMetaDataSerialized(*[None] * 15)
         file_meta = FileMetaDataSerialized(*[None] * 5)
 
         valid_name = filename[-4:].lower() in [".jpg", ".png"] or filename[
@@ -146,7 +359,9 @@ class Exif:
             return pic_meta, file_meta
 
         # file meta data attributes
-        file_stat = os.stat(filename)
+        if file_stat is None:
+            file_stat = os.stat(filename)
+
         file_meta.file_name = os.path.basename(filename)
         file_meta.file_path = os.path.abspath(filename).replace(file_meta.file_name, "")
         file_meta.file_modified = datetime.datetime.fromtimestamp(file_stat.st_mtime)
@@ -158,8 +373,10 @@ class Exif:
             file_meta.file_created = file_meta.file_modified
         file_meta.file_size = file_stat.st_size
 
-        # picture meta data attributes from exif
-        exif_dict = cls.get_exif_dict(im, filename)
+        # picture meta data attributes from exif, only the required tags are read
+        # the full exif is kept as the raw exif block
+        exif_raw = im.info.get("exif")
+        exif_dict = cls.get_exif_tags(exif_raw, filename)
 
         if exif_dict:
             pic_meta.camera_make = exif_dict.get("0th").get("Make")
@@ -204,13 +421,162 @@ class Exif:
         except OSError as e:
             print(f"file {filename}, exception: {e}")
 
+        # the signature reuses the thumbnail if it has the same size, otherwise
+        # the thumbnail for the signature is made from the file
+        pic_meta.signature_version = SIGNATURE_VERSION
+        if SIGNATURES[SIGNATURE_VERSION][0] == DATABASE_PICTURE_SIZE:
+            pic_meta.md5_signature = cls.picture_signature(im)
+
+        else:
+            pic_meta.md5_signature = file_signature(filename)
+
         picture_bytes = cls.get_image_bytes(im)
         pic_meta.thumbnail = json.dumps(picture_bytes.decode(cls.codec))
-        pic_meta.md5_signature = hashlib.md5(picture_bytes).hexdigest()
-        pic_meta.exif = cls.serialize_exif(exif_dict)
+        pic_meta.thumbnail_codec = THUMBNAIL_SETTINGS.name
+        (
+            pic_meta.exif_raw,
+            pic_meta.exif_codec,
+            pic_meta.makernote,
+        ) = cls.pack_exif(exif_raw)
 
         return pic_meta, file_meta
 
+    @staticmethod
+    def compress(data, codec):
+        if codec == "zlib":
+            return zlib.compress(data, 9)
+
+        if codec == "zstd":
+            return zstandard.ZstdCompressor(level=19).compress(data)
+
+        return data
+
+    @staticmethod
+    def decompress(data, codec):
+        data = bytes(data)
+        if codec == "zlib":
+            return zlib.decompress(data)
+
+        if codec == "zstd":
+            return zstandard.ZstdDecompressor().decompress(data)
+
+        return data
+
+    @staticmethod
+    def exif_tags(exif_raw):
+        """numbers of the tags in the exif block per IFD, the IFD of the
+        embedded thumbnail is left out
+        :returns:
+            dict {ifd name: set of tag numbers}
+        """
+        exif = Image.Exif()
+        exif.load(exif_raw)
+        exif_ifd = exif.get_ifd(EXIF_IFD_TAG)
+        return {
+            "0th": set(exif),
+            "Exif": set(exif_ifd),
+            "GPS": set(exif.get_ifd(GPS_IFD_TAG)),
+            "Interop": (
+                set(exif.get_ifd(INTEROP_IFD_TAG))
+                if INTEROP_IFD_TAG in exif_ifd
+                else set()
+            ),
+        }
+
+    @classmethod
+    def strip_exif(cls, exif_raw):
+        """remove the MakerNote and the embedded thumbnail from the exif block.
+        piexif only writes the tags it knows, if the stripped block would lose
+        any other tag the original block is returned.
+        :returns:
+            stripped exif block: bytes
+            makernote: bytes or None if the block is not stripped
+        """
+        exif_dict = piexif.load(exif_raw)
+        makernote = exif_dict["Exif"].pop(MAKERNOTE_TAG, None)
+        exif_dict["thumbnail"] = None
+        exif_dict["1st"] = {}
+        stripped_exif = piexif.dump(exif_dict)
+
+        original_tags = cls.exif_tags(exif_raw)
+        original_tags["Exif"].discard(MAKERNOTE_TAG)
+        stripped_tags = cls.exif_tags(stripped_exif)
+        if any(
+            tags - stripped_tags.get(name, set())
+            for name, tags in original_tags.items()
+        ):
+            return exif_raw, None
+
+        return stripped_exif, makernote
+
+    @classmethod
+    def strip_exif_dict(cls, exif_tag_dict):
+        """as strip_exif for an exif tag dict (exif stored as json)
+        :returns:
+            stripped exif tag dict: dict
+            makernote: bytes or None
+        """
+        makernote = exif_tag_dict.get("Exif", {}).pop("MakerNote", None)
+        if isinstance(makernote, str):
+            makernote = makernote.encode(cls.codec)
+
+        exif_tag_dict["thumbnail"] = None
+        exif_tag_dict["1st"] = {}
+        return exif_tag_dict, makernote
+
+    @classmethod
+    def pack_exif(cls, exif_raw, codec=EXIF_CODEC, makernote=EXIF_MAKERNOTE):
+        """prepare the raw exif block for storage, the MakerNote is removed unless
+        makernote is 'keep' or removing it would lose other tags, and the exif
+        block is compressed with codec
+        :returns:
+            exif payload: bytes
+            codec: string or None if not compressed
+            makernote: compressed makernote to archive or None
+        """
+        if not exif_raw:
+            return None, None, None
+
+        if codec == "zstd" and zstandard is None:
+            codec = "zlib"
+
+        if codec not in ["zlib", "zstd"]:
+            codec = None
+
+        archived_makernote = None
+        if makernote != "keep":
+            try:
+                exif_raw, makernote_bytes = cls.strip_exif(exif_raw)
+                if makernote == "archive" and makernote_bytes:
+                    archived_makernote = cls.compress(makernote_bytes, codec)
+
+            except Exception as e:  # pylint: disable=broad-except
+                print(f"unable to strip exif, exception: {e}")
+
+        return cls.compress(exif_raw, codec), codec, archived_makernote
+
+    @classmethod
+    def unpack_exif(cls, exif_payload, codec):
+        """raw exif block from the stored exif payload"""
+        if not exif_payload:
+            return None
+
+        return cls.decompress(exif_payload, codec)
+
+    @staticmethod
+    def picture_signature(im, version=SIGNATURE_VERSION):
+        """signature of the picture with the algorithm of version, im is a newly
+        opened image or its thumbnail of the size of the algorithm
+        """
+        size, signature = SIGNATURES[version]
+        try:
+            im.thumbnail(size, Image.Resampling.LANCZOS)
+
+        except OSError as e:
+            print(f"signature thumbnail, exception: {e}")
+
+        return signature(im)
+
     @staticmethod
     def serialize_exif(exif_tag_dict):
         try:
@@ -350,6 +716,21 @@ class Exif:
 
         return pic_meta
 
+    @staticmethod
+    def get_thumbnail_image(thumbnail):
+        """decode a thumbnail as stored in the database, it already has the
+        database picture size
+        """
+        try:
+            im = Image.open(io.BytesIO(thumbnail.encode(Exif.codec)))
+            im.load()
+
+        except Exception as e:  # pylint: disable=broad-except
+            print(f"unable to decode thumbnail, exception: {e}")
+            im = None
+
+        return im
+
     @staticmethod
     def get_pil_image(file_name):
         try:
@@ -382,11 +763,32 @@ class Exif:
         Image.fromarray(image_array).show()
 
     @staticmethod
-    def get_image_bytes(image):
+    def get_image_bytes(image, settings=THUMBNAIL_SETTINGS):
+        """encode the image as thumbnail with settings"""
         img_bytes = io.BytesIO()
 
         if image.mode in ("RGBA", "P"):
             image = image.convert("RGB")
 
-        image.save(img_bytes, format="JPEG")
+        image.save(img_bytes, **settings.save_options())
         return img_bytes.getvalue()
+
+    @staticmethod
+    def thumbnail_hash(thumbnail):
+        """content hash of a serialized thumbnail, pictures with identical
+        thumbnails share a single copy in the database
+        """
+        return hashlib.md5(thumbnail.encode()).hexdigest()
+
+    @staticmethod
+    def rotate_image(image, rotate):
+        """rotate the image clockwise by rotate degrees, a multiple of 90"""
+        transpose = {
+            90: Image.Transpose.ROTATE_270,
+            180: Image.Transpose.ROTATE_180,
+            270: Image.Transpose.ROTATE_90,
+        }.get(rotate % 360)
+        if transpose is None:
+            return image
+
+        return image.transpose(transpose)
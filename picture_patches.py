@@ -2,11 +2,26 @@ import os
 import io
 import datetime
 import json
-import hashlib
 import shutil
+import time
 import numpy as np
-from picture_exif import Exif
-from picture_db import DbUtils, PictureDb, progress_message_generator
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+from psycopg2.extras import execute_values
+from picture_exif import (
+    Exif,
+    EXIF_MAKERNOTE,
+    SIGNATURE_VERSION,
+    THUMBNAIL_SETTINGS,
+    file_signature,
+)
+from picture_db import (
+    DbUtils,
+    PictureDb,
+    picture_cache,
+    progress_message_generator,
+    scanner,
+)
 from Utils.plogger import Logger
 
 logger = Logger.getlogger()
@@ -35,12 +50,30 @@ class PictureDbPatches(PictureDb):
 
     @classmethod
     @DbUtils.connect
-    def delete_ids(cls, deleted_ids, cursor):
-        if deleted_ids:
-            sql_string = (
-                f"DELETE FROM {cls.table_pictures} WHERE id=any(array{deleted_ids});"
-            )
-            cursor.execute(sql_string)
+    def delete_ids(cls, deleted_ids, cursor, selection=None):
+        """delete the pictures, given by deleted_ids or the named selection, and
+        the thumbnails no other picture refers to
+        """
+        if not deleted_ids and selection is None:
+            return
+
+        folder_ids = cls.get_picture_folder_ids(cursor, deleted_ids, selection)
+        condition, params = cls.ids_condition("picture_id", deleted_ids, selection)
+        sql_string = (
+            f"SELECT DISTINCT thumbnail_hash FROM {cls.table_payloads} "
+            f"WHERE {condition} AND thumbnail_hash IS NOT NULL;"
+        )
+        cursor.execute(sql_string, params)
+        thumbnail_hashes = [val[0] for val in cursor.fetchall()]
+
+        condition, params = cls.ids_condition("id", deleted_ids, selection)
+        sql_string = f"DELETE FROM {cls.table_pictures} WHERE {condition} RETURNING id;"
+        cursor.execute(sql_string, params)
+        picture_ids = [val[0] for val in cursor.fetchall()]
+        DbUtils.after_commit(lambda: picture_cache.invalidate(picture_ids))
+        cls.update_folder_counts(cursor, folder_ids)
+        if thumbnail_hashes:
+            cls.remove_unused_thumbnails(cursor, thumbnail_hashes)
 
     @classmethod
     @DbUtils.connect
@@ -85,115 +118,121 @@ class PictureDbPatches(PictureDb):
             c_time = datetime.datetime.now()
             f.write(f"===> Remove duplicates with method '{method}': {c_time}\n")
 
+        # the duplicates are read a batch at a time by a server side cursor
         sql_string = (
-            f"SELECT {method} FROM {cls.table_pictures} WHERE {method} IN "
-            f"(SELECT {method} FROM {cls.table_pictures} GROUP BY {method} "
-            f"HAVING count(*) > 1) ORDER BY id;"
+            f"SELECT {method} FROM {cls.table_pictures} "
+            f"WHERE {method} IS NOT NULL GROUP BY {method} "
+            f"HAVING count(*) > 1 ORDER BY min(id);"
         )
-        cursor.execute(sql_string)
-        list_duplicates = {item[0] for item in cursor.fetchall()}
-
-        for item in list_duplicates:
-            sql_string = (
-                f"SELECT id, thumbnail "
-                f"FROM {cls.table_pictures} WHERE {method}='{item}';"
-            )
-            cursor.execute(sql_string)
-
-            pic_selection = []
-            choices = []
-            for i, pic_tuple in enumerate(cursor.fetchall()):
+        with DbUtils.server_cursor(cursor, "duplicates") as duplicates:
+            duplicates.execute(sql_string)
+            for (item,) in duplicates:
                 sql_string = (
-                    f"SELECT file_path, file_name "
-                    f"FROM {cls.table_files} WHERE picture_id={pic_tuple[0]};"
+                    f"SELECT p.id, t.thumbnail, p.rotate FROM {cls.table_pictures} p "
+                    f"JOIN {cls.table_payloads} pl ON pl.picture_id = p.id "
+                    f"JOIN {cls.table_thumbnails} t ON t.content_hash = pl.thumbnail_hash "
+                    f"WHERE p.{method} = %s;"
                 )
-                cursor.execute(sql_string)
-                file_path, file_name = cursor.fetchone()
+                cursor.execute(sql_string, (item,))
 
-                if not cls.review_required(accepted_review_date, pic_tuple[0]):
-                    print(
-                        f"no review required for: "
-                        f"{pic_tuple[0]}, {file_path}, {file_name}"
+                pic_selection = []
+                choices = []
+                for i, pic_tuple in enumerate(cursor.fetchall()):
+                    sql_string = (
+                        f"SELECT fo.path, f.file_name FROM {cls.table_files} f "
+                        f"LEFT JOIN {cls.table_folders} fo ON fo.id = f.folder_id "
+                        f"WHERE f.picture_id={pic_tuple[0]};"
                     )
-                    continue
-                else:
-                    pass
-
-                choices.append(i + 1)
-                pic_selection.append(
-                    {
-                        "index": i + 1,
-                        "id": pic_tuple[0],
-                        "file_path": file_path,
-                        "file_name": file_name,
-                        "thumbnail": io.BytesIO(pic_tuple[1].encode(exif.codec)),
-                    }
-                )
+                    cursor.execute(sql_string)
+                    file_path, file_name = cursor.fetchone()
 
-            if not pic_selection:
-                continue
+                    if not cls.review_required(accepted_review_date, pic_tuple[0]):
+                        print(
+                            f"no review required for: "
+                            f"{pic_tuple[0]}, {file_path}, {file_name}"
+                        )
+                        continue
+                    else:
+                        pass
 
-            print("-" * 80)
-            pic_arrays = []
-            for pic in pic_selection:
-                height, width = (200, 200)
-                array_padded = np.ones((height, width, 3), dtype=np.uint8) * 200
+                    choices.append(i + 1)
+                    pic_selection.append(
+                        {
+                            "index": i + 1,
+                            "id": pic_tuple[0],
+                            "file_path": file_path,
+                            "file_name": file_name,
+                            "thumbnail": io.BytesIO(pic_tuple[1].encode(exif.codec)),
+                            "rotate": pic_tuple[2],
+                        }
+                    )
 
-                print(
-                    f'[{pic.get("index")}] '
-                    f'[{os.path.join(pic.get("file_path"), pic.get("file_name"))}]'
-                )
-                if not (im := exif.get_pil_image(pic.get("thumbnail"))):
+                if not pic_selection:
                     continue
 
-                image_array = np.array(im)
-                height = min(image_array.shape[0], height)
-                width = min(image_array.shape[1], width)
-                array_padded[:height, :width, :] = image_array[:height, :width, :]
-                pic_arrays.append(array_padded)
+                print("-" * 80)
+                pic_arrays = []
+                for pic in pic_selection:
+                    height, width = (200, 200)
+                    array_padded = np.ones((height, width, 3), dtype=np.uint8) * 200
 
-            exif.show_image_array(np.hstack(pic_arrays))
+                    print(
+                        f'[{pic.get("index")}] '
+                        f'[{os.path.join(pic.get("file_path"), pic.get("file_name"))}]'
+                    )
+                    if not (im := exif.get_pil_image(pic.get("thumbnail"))):
+                        continue
 
-            # -1 skip removal, 0 quit method, 1..n pictures index to be removed
-            # in case of skip, update the reviews table
-            answer_delete = utils.get_answer(choices)
-            if answer_delete[0] == -1:
-                cls.update_reviews(pic_selection, reviewer_name)
+                    im = exif.rotate_image(im, pic.get("rotate"))
 
-            elif answer_delete[0] == 0:
-                return
+                    image_array = np.array(im)
+                    height = min(image_array.shape[0], height)
+                    width = min(image_array.shape[1], width)
+                    array_padded[:height, :width, :] = image_array[:height, :width, :]
+                    pic_arrays.append(array_padded)
 
-            else:
-                log_lines = []
-                deleted_ids = []
-                for pic in pic_selection:
-                    if pic.get("index") in answer_delete:
-                        deleted_ids.append(pic.get("id"))
-                        _from = os.path.join(pic.get("file_path"), pic.get("file_name"))
-                        _to = os.path.join(deleted_folder, pic.get("file_name"))
+                exif.show_image_array(np.hstack(pic_arrays))
 
-                        try:
-                            shutil.move(_from, _to)
-                            log_line = (
-                                f'file deleted, id: {pic.get("id")}, '
-                                f"file_name: {_from}"
-                            )
-                        except FileNotFoundError:
-                            log_line = (
-                                f'file not in folder, id: {pic.get("id")}, '
-                                f"file_name: {_from}"
-                            )
+                # -1 skip removal, 0 quit method, 1..n pictures index to be removed
+                # in case of skip, update the reviews table
+                answer_delete = utils.get_answer(choices)
+                if answer_delete[0] == -1:
+                    cls.update_reviews(pic_selection, reviewer_name)
 
-                        print(log_line)
-                        log_lines.append(log_line)
+                elif answer_delete[0] == 0:
+                    return
 
-                # call seperately to make sure change to db is committed on
-                # return of this function
-                cls.delete_ids(deleted_ids)
+                else:
+                    log_lines = []
+                    deleted_ids = []
+                    for pic in pic_selection:
+                        if pic.get("index") in answer_delete:
+                            deleted_ids.append(pic.get("id"))
+                            _from = os.path.join(pic.get("file_path"), pic.get("file_name"))
+                            _to = os.path.join(deleted_folder, pic.get("file_name"))
+
+                            try:
+                                shutil.move(_from, _to)
+                                log_line = (
+                                    f'file deleted, id: {pic.get("id")}, '
+                                    f"file_name: {_from}"
+                                )
+                            except FileNotFoundError:
+                                log_line = (
+                                    f'file not in folder, id: {pic.get("id")}, '
+                                    f"file_name: {_from}"
+                                )
+
+                            print(log_line)
+                            log_lines.append(log_line)
 
-                with open(log_file, "at") as f:
-                    for line in log_lines:
-                        f.write(line + "\n")
+                    # call seperately to make sure change to db is committed on
+                    # return of this function
+                    cls.delete_ids(deleted_ids)
+
+                    with open(log_file, "at") as f:
+                        for line in log_lines:
+                            f.write(line + "\n")
 
     @classmethod
     @DbUtils.connect
@@ -229,59 +268,68 @@ class PictureDbPatches(PictureDb):
 
         if end_id:
             sql_string = (
-                f"select id, file_path, file_name from {cls.table_files} "
-                f"where id between {start_id} and {end_id}"
+                f"select f.picture_id, fo.path, f.file_name from {cls.table_files} f "
+                f"left join {cls.table_folders} fo on fo.id = f.folder_id "
+                f"where f.picture_id between %s and %s order by f.picture_id"
             )
+            params = (start_id, end_id)
 
         else:
             sql_string = (
-                f"select id, file_path, file_name from {cls.table_files} "
-                f"where id >= {start_id}"
+                f"select f.picture_id, fo.path, f.file_name from {cls.table_files} f "
+                f"left join {cls.table_folders} fo on fo.id = f.folder_id "
+                f"where f.picture_id >= %s order by f.picture_id"
             )
+            params = (start_id,)
 
-        cursor.execute(sql_string)
+        def delete_batch(deleted_ids, log_lines):
+            cls.delete_ids(deleted_ids)
+            with open(log_file, "at") as f:
+                for line in log_lines:
+                    f.write(line + "\n")
 
+        # the files are read and deleted a batch of itersize at a time
         log_lines = []
         deleted_ids = []
-        for pic in cursor.fetchall():
-            print(pic)
-            _id = pic[0]
-            _file_path = pic[1]
-            _file_name = pic[2]
-            _from = os.path.join(_file_path, _file_name)
-            _to = os.path.join(deleted_folder, _file_name)
-
-            try:
-                shutil.move(_from, _to)
-                log_line = f"file deleted, id: {_id}, " f"file_name: {_from}"
+        progress_message = progress_message_generator("removing pictures")
+        with DbUtils.server_cursor(cursor, "remove_pics") as pictures:
+            pictures.execute(sql_string, params)
+            for pic in pictures:
+                next(progress_message)
+                _id = pic[0]
+                _file_path = pic[1]
+                _file_name = pic[2]
+                _from = os.path.join(_file_path, _file_name)
+                _to = os.path.join(deleted_folder, _file_name)
 
-            except FileNotFoundError:
-                log_line = f"file not in folder, id: {_id}, " f"file_name: {_from}"
+                try:
+                    shutil.move(_from, _to)
+                    log_line = f"file deleted, id: {_id}, " f"file_name: {_from}"
 
-            log_lines.append(log_line)
-            deleted_ids.append(_id)
+                except FileNotFoundError:
+                    log_line = f"file not in folder, id: {_id}, " f"file_name: {_from}"
 
-        cls.delete_ids(deleted_ids)
+                log_lines.append(log_line)
+                deleted_ids.append(_id)
+                if len(deleted_ids) >= pictures.itersize:
+                    delete_batch(deleted_ids, log_lines)
+                    log_lines = []
+                    deleted_ids = []
 
-        with open(log_file, "at") as f:
-            for line in log_lines:
-                f.write(line + "\n")
+        delete_batch(deleted_ids, log_lines)
+        print()
 
     @classmethod
-    @DbUtils.connect
-    def remove_from_locations_table(cls, cursor, picture_ids=None):
-        if not picture_ids:
-            return
+    def update_rotate_checked(cls, json_filename=None, selection=None):
+        """set the rotate_checked flag for the ids in json_filename or the
+        named selection
+        """
+        picture_ids = None
+        if json_filename is not None:
+            with open(json_filename) as json_file:
+                picture_ids = json.load(json_file)
 
-        sql_remove_locations = f"delete from {cls.table_locations} where picture_id=any(array{picture_ids})"
-        cursor.execute(sql_remove_locations)
-
-    @classmethod
-    @DbUtils.connect
-    def update_rotate_checked(cls, json_filename, cursor):
-        with open(json_filename) as json_file:
-            picture_ids = json.load(json_file)
-        cls.set_rotate_check(picture_ids, set_value=True)
+        cls.set_rotate_check(picture_ids, set_value=True, selection=selection)
 
     @classmethod
     @DbUtils.connect
@@ -290,52 +338,47 @@ class PictureDbPatches(PictureDb):
             f"update picture for {base_folder}"
         )
 
-        for foldername, _, filenames in os.walk(base_folder):
-            for filename in filenames:
-                sql_foldername = foldername.replace("'", "''")
-                sql_filename = filename.replace("'", "''")
-
-                sql_str = (
-                    f"SELECT picture_id FROM {cls.table_files} "
-                    f"WHERE file_path = '{sql_foldername}\\' AND "
-                    f"file_name = '{sql_filename}'"
-                )
-
-                cursor.execute(sql_str)
-                try:
-                    picture_id = cursor.fetchone()[0]
+        sql_str = (
+            f"SELECT f.picture_id FROM {cls.table_files} f "
+            f"JOIN {cls.table_folders} fo ON fo.id = f.folder_id "
+            f"WHERE fo.path = %s AND f.file_name = %s"
+        )
+        for entry in scanner.scan(base_folder):
+            cursor.execute(sql_str, (entry.folder + "\\", entry.name))
+            try:
+                picture_id = cursor.fetchone()[0]
 
-                except TypeError:
-                    logger.info(
-                        f"file {os.path.join(foldername, filename)} "
-                        f"not found in database"
-                    )
-                    continue
+            except TypeError:
+                logger.info(f"file {entry.path} not found in database")
+                continue
 
-                fn = os.path.join(foldername, filename)
-                if not (im := exif.get_pil_image(fn)):
-                    logger.info(f"unable to get pil_image for file {fn}")
-                    continue
+            if not (im := exif.get_pil_image(entry.path)):
+                logger.info(f"unable to get pil_image for file {entry.path}")
+                continue
 
-                cls.update_image(picture_id, im, 0)
-                next(progress_message)
+            cls.update_image(picture_id, im)
+            next(progress_message)
 
     @classmethod
     @DbUtils.connect
-    def update_image_md5(cls, picture_id, image, rotate, cursor):
-        """This method replaces the thumbnail and md5."""
+    def update_image_md5(cls, picture_id, image, rotate, md5_signature, cursor):
+        """This method replaces the thumbnail and md5 of the current signature
+        version.
+        """
         picture_bytes = exif.get_image_bytes(image)
         thumbnail = json.dumps(picture_bytes.decode(exif.codec))
-        md5_signature = hashlib.md5(picture_bytes).hexdigest()
 
+        cls.update_thumbnail(cursor, picture_id, thumbnail)
         sql_str = (
             f"UPDATE {cls.table_pictures} "
-            f"SET thumbnail = (%s), "
-            f"md5_signature = (%s), "
+            f"SET md5_signature = (%s), "
+            f"signature_version = (%s), "
             f"rotate = (%s) "
             f"WHERE id= (%s) "
         )
-        cursor.execute(sql_str, (thumbnail, md5_signature, rotate, picture_id))
+        cursor.execute(
+            sql_str, (md5_signature, SIGNATURE_VERSION, rotate, picture_id)
+        )
 
     @classmethod
     @DbUtils.connect
@@ -349,11 +392,12 @@ class PictureDbPatches(PictureDb):
 
         for picture_id in id_list:
             sql_str = (
-                f"SELECT file_path, file_name FROM {cls.table_files} "
-                f"WHERE picture_id = {picture_id} "
+                f"SELECT fo.path, f.file_name FROM {cls.table_files} f "
+                f"LEFT JOIN {cls.table_folders} fo ON fo.id = f.folder_id "
+                f"WHERE f.picture_id = %s "
             )
 
-            cursor.execute(sql_str)
+            cursor.execute(sql_str, (picture_id,))
             result = cursor.fetchone()
 
             try:
@@ -367,7 +411,7 @@ class PictureDbPatches(PictureDb):
                 logger.info(f"unable to get pil_image for file {filename_abs}")
                 continue
 
-            cls.update_image_md5(picture_id, im, 0)
+            cls.update_image_md5(picture_id, im, 0, file_signature(filename_abs))
             next(progress_message)
 
     @classmethod
@@ -378,15 +422,830 @@ class PictureDbPatches(PictureDb):
             f"SELECT id, longitude, latitude, geolocation_info FROM {cls.table_locations} "
             f"where id >= %s and id < %s order by id;"
         )
-        cursor.execute(sql_str, (start_id, end_id))
+        sql_update = (
+            f"UPDATE {cls.table_locations} SET geolocation_info = %s WHERE id = %s;"
+        )
+        with DbUtils.server_cursor(cursor, "locations") as locations:
+            locations.execute(sql_str, (start_id, end_id))
+            for id, longitude, latitude, gl_info in locations:
+                if not gl_info:
+                    geolocation_info = cls.get_geolocation_info(longitude, latitude)
+                    if geolocation_info:
+                        print(f"index {id:6,} has been updated ")
+                        cursor.execute(sql_update, (geolocation_info, id))
+
+    @classmethod
+    @DbUtils.connect
+    def add_exif_raw_column(cls, cursor):
+        """patch to add the column for the raw exif block to the pictures table,
+        new pictures store their exif in this column instead of the exif json
+        """
+        sql_str = f"ALTER TABLE {cls.table_pictures} ADD COLUMN exif_raw BYTEA;"
+        cursor.execute(sql_str)
+        print(f"added column exif_raw to {cls.table_pictures}")
+
+    @classmethod
+    @DbUtils.connect
+    def add_exif_codec_column(cls, cursor):
+        """patch to add the exif_codec column to the pictures table and create the
+        table where MakerNotes are archived
+        """
+        sql_str = f"ALTER TABLE {cls.table_pictures} ADD COLUMN exif_codec VARCHAR(10);"
+        cursor.execute(sql_str)
+        print(f"added column exif_codec to {cls.table_pictures}")
+        cls.create_makernotes_table()
+
+    @classmethod
+    @DbUtils.connect
+    def exif_storage_report(cls, cursor):
+        """print the space taken by the exif in the database
+        :returns:
+            total size in bytes: integer
+        """
+        sql_str = (
+            f"SELECT count(*), coalesce(sum(pg_column_size(exif)), 0), "
+            f"coalesce(sum(pg_column_size(exif_raw)), 0), count(exif_codec) "
+            f"FROM {cls.table_payloads};"
+        )
+        cursor.execute(sql_str)
+        pictures, size_json, size_raw, compressed = cursor.fetchone()
+        sql_str = (
+            f"SELECT coalesce(sum(pg_column_size(makernote)), 0) "
+            f"FROM {cls.table_makernotes};"
+        )
+        cursor.execute(sql_str)
+        size_makernotes = cursor.fetchone()[0]
+        print(
+            f"exif of {pictures:,} pictures, {compressed:,} compressed: "
+            f"json {size_json / 1e6:,.1f} MB, raw {size_raw / 1e6:,.1f} MB, "
+            f"archived makernotes {size_makernotes / 1e6:,.1f} MB"
+        )
+        return size_json + size_raw
+
+    @classmethod
+    @DbUtils.connect
+    def compress_exif_batch(cls, start_id, batch_size, cursor):
+        """compress the exif of pictures with id > start_id in a single batch.
+        Exif stored as json is replaced by the raw exif block of the file if the
+        file is available, otherwise the MakerNote and thumbnail are stripped
+        from the json.
+        :returns:
+            last_id, rows updated, size before, size after: tuple or
+            None if there are no more pictures
+        """
+        sql_str = (
+            f"SELECT p.picture_id, p.exif, p.exif_raw, p.exif_codec, "
+            f"pg_column_size(p.exif), pg_column_size(p.exif_raw), "
+            f"fo.path, f.file_name "
+            f"FROM {cls.table_payloads} p "
+            f"LEFT JOIN {cls.table_files} f ON f.picture_id = p.picture_id "
+            f"LEFT JOIN {cls.table_folders} fo ON fo.id = f.folder_id "
+            f"WHERE p.picture_id > %s ORDER BY p.picture_id LIMIT %s;"
+        )
+        cursor.execute(sql_str, (start_id, batch_size))
         results = cursor.fetchall()
+        if not results:
+            return None
+
+        sql_update = (
+            f"UPDATE {cls.table_payloads} "
+            f"SET exif = %s, exif_raw = %s, exif_codec = %s WHERE picture_id = %s;"
+        )
+        sql_makernote = (
+            f"INSERT INTO {cls.table_makernotes} (picture_id, makernote, codec) "
+            f"VALUES (%s, %s, %s) ON CONFLICT (picture_id) DO NOTHING;"
+        )
+        updated_ids = []
+        size_before = 0
+        for (
+            picture_id,
+            exif_json,
+            exif_raw,
+            exif_codec,
+            size_json,
+            size_raw,
+            file_path,
+            file_name,
+        ) in results:
+            if exif_codec or not (exif_json or exif_raw):
+                continue
+
+            if not exif_raw and file_path and file_name:
+                try:
+                    with Image.open(os.path.join(file_path, file_name)) as im:
+                        exif_raw = im.info.get("exif")
+
+                except OSError:
+                    exif_raw = None
+
+            if exif_raw:
+                exif_json = None
+                exif_raw, exif_codec, makernote = exif.pack_exif(bytes(exif_raw))
+                makernote_codec = exif_codec
+
+            else:
+                exif_json, makernote = exif.strip_exif_dict(exif_json)
+                exif_json = json.dumps(exif_json)
+                makernote_codec = "zlib"
+                if makernote and EXIF_MAKERNOTE == "archive":
+                    makernote = exif.compress(makernote, makernote_codec)
+
+                else:
+                    makernote = None
+
+            cursor.execute(sql_update, (exif_json, exif_raw, exif_codec, picture_id))
+            if makernote:
+                cursor.execute(sql_makernote, (picture_id, makernote, makernote_codec))
+
+            updated_ids.append(picture_id)
+            size_before += (size_json or 0) + (size_raw or 0)
+
+        size_after = 0
+        if updated_ids:
+            sql_str = (
+                f"SELECT coalesce(sum(pg_column_size(exif)), 0) + "
+                f"coalesce(sum(pg_column_size(exif_raw)), 0) "
+                f"FROM {cls.table_payloads} WHERE picture_id = ANY(%s);"
+            )
+            cursor.execute(sql_str, (updated_ids,))
+            size_after = cursor.fetchone()[0]
+            DbUtils.after_commit(lambda: picture_cache.invalidate(updated_ids))
 
+        return results[-1][0], len(updated_ids), size_before, size_after
+
+    @classmethod
+    def compress_exif(cls, batch_size=500):
+        """patch to convert the exif of existing pictures to the compressed
+        storage. Every batch is committed separately, so rows are only locked
+        for a short time and the patch can be stopped and run again.
+        """
+        cls.exif_storage_report()
+        last_id = 0
+        total_rows, total_before, total_after = 0, 0, 0
+        while result := cls.compress_exif_batch(last_id, batch_size):
+            last_id, rows, size_before, size_after = result
+            total_rows += rows
+            total_before += size_before
+            total_after += size_after
+            print(
+                f"\rcompressed exif of {total_rows:,} pictures up to id {last_id}, "
+                f"saved {(total_before - total_after) / 1e6:,.1f} MB",
+                end="",
+            )
+
+        print()
+        cls.exif_storage_report()
+
+    @classmethod
+    @DbUtils.connect
+    def add_signature_version(cls, cursor):
+        """patch to add the signature_version column to the pictures table and
+        create the signatures table
+        """
         sql_str = (
-            f"UPDATE {cls.table_locations} SET geolocation_info = %s WHERE id = %s;"
+            f"ALTER TABLE {cls.table_pictures} "
+            f"ADD COLUMN signature_version INTEGER DEFAULT 1;"
         )
-        for id, longitude, latitude, gl_info in results:
-            if not gl_info:
-                geolocation_info = cls.get_geolocation_info(longitude, latitude)
-                if geolocation_info:
-                    print(f"index {id:6,} has been updated ")
-                    cursor.execute(sql_str, (geolocation_info, id))
+        cursor.execute(sql_str)
+        print(f"added column signature_version to {cls.table_pictures}")
+        cls.create_signatures_table()
+
+    @classmethod
+    @DbUtils.connect
+    def get_unsigned_pictures(cls, version, start_id, batch_size, cursor):
+        """get a batch of (picture_id, file name) of pictures with id > start_id
+        that do not yet have a signature of version
+        """
+        sql_str = (
+            f"SELECT p.id, fo.path, f.file_name FROM {cls.table_pictures} p "
+            f"JOIN {cls.table_files} f ON f.picture_id = p.id "
+            f"JOIN {cls.table_folders} fo ON fo.id = f.folder_id "
+            f"WHERE p.id > %s AND p.signature_version <> %s AND NOT EXISTS ("
+            f"SELECT 1 FROM {cls.table_signatures} s "
+            f"WHERE s.picture_id = p.id AND s.signature_version = %s) "
+            f"ORDER BY p.id LIMIT %s;"
+        )
+        cursor.execute(sql_str, (start_id, version, version, batch_size))
+        return [
+            (picture_id, os.path.join(file_path, file_name))
+            for picture_id, file_path, file_name in cursor.fetchall()
+        ]
+
+    @classmethod
+    @DbUtils.connect
+    def store_signatures(cls, version, signatures, cursor):
+        """store signatures [(picture_id, signature), ...] of version"""
+        sql_str = (
+            f"INSERT INTO {cls.table_signatures} "
+            f"(picture_id, signature_version, signature) VALUES %s "
+            f"ON CONFLICT (picture_id, signature_version) DO NOTHING;"
+        )
+        execute_values(
+            cursor,
+            sql_str,
+            [(picture_id, version, signature) for picture_id, signature in signatures],
+            page_size=len(signatures),
+        )
+
+    @classmethod
+    def resign_pictures(cls, version, workers=4, batch_size=200):
+        """job to compute signatures of version for all pictures from their files
+        in parallel worker processes. The signatures are stored in the signatures
+        table, so the signatures in the pictures table remain valid for matching
+        while the job runs. Each batch is committed, the job can be stopped and run
+        again. Use promote_signatures once it is complete.
+        """
+        last_id = 0
+        signed, missing = 0, 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            while pictures := cls.get_unsigned_pictures(version, last_id, batch_size):
+                last_id = pictures[-1][0]
+                picture_ids, filenames = zip(*pictures)
+                signatures = []
+                for picture_id, filename, signature in zip(
+                    picture_ids,
+                    filenames,
+                    pool.map(file_signature, filenames, [version] * len(filenames)),
+                ):
+                    if signature:
+                        signatures.append((picture_id, signature))
+
+                    else:
+                        logger.info(f"no signature for {picture_id}, file {filename}")
+                        missing += 1
+
+                if signatures:
+                    cls.store_signatures(version, signatures)
+
+                signed += len(signatures)
+                print(
+                    f"\rsigned {signed:,} pictures with version {version} up to id "
+                    f"{last_id}, {missing:,} files not found",
+                    end="",
+                )
+
+        print()
+
+    @classmethod
+    @DbUtils.connect
+    def promote_signatures(cls, version, cursor):
+        """make version the signature in the pictures table for all pictures that
+        have a signature of version, the replaced signatures are kept in the
+        signatures table
+        """
+        sql_str = (
+            f"INSERT INTO {cls.table_signatures} "
+            f"(picture_id, signature_version, signature) "
+            f"SELECT p.id, p.signature_version, p.md5_signature "
+            f"FROM {cls.table_pictures} p JOIN {cls.table_signatures} s "
+            f"ON s.picture_id = p.id AND s.signature_version = %s "
+            f"WHERE p.signature_version <> %s "
+            f"ON CONFLICT (picture_id, signature_version) DO NOTHING;"
+        )
+        cursor.execute(sql_str, (version, version))
+        sql_str = (
+            f"UPDATE {cls.table_pictures} p "
+            f"SET md5_signature = s.signature, signature_version = s.signature_version "
+            f"FROM {cls.table_signatures} s "
+            f"WHERE s.picture_id = p.id AND s.signature_version = %s "
+            f"AND p.signature_version <> %s RETURNING p.id;"
+        )
+        cursor.execute(sql_str, (version, version))
+        picture_ids = [val[0] for val in cursor.fetchall()]
+        DbUtils.after_commit(lambda: picture_cache.invalidate(picture_ids))
+        print(f"promoted signature version {version} for {len(picture_ids):,} pictures")
+
+    @classmethod
+    @DbUtils.connect
+    def add_thumbnail_codec_column(cls, cursor):
+        """patch to add the thumbnail_codec column to the pictures table, existing
+        thumbnails have the Pillow default JPEG encoding
+        """
+        sql_str = (
+            f"ALTER TABLE {cls.table_pictures} "
+            f"ADD COLUMN thumbnail_codec VARCHAR(20) DEFAULT 'jpeg-75-s2-o0-p0';"
+        )
+        cursor.execute(sql_str)
+        sql_str = (
+            f"ALTER TABLE {cls.table_pictures} ALTER COLUMN thumbnail_codec DROP DEFAULT;"
+        )
+        cursor.execute(sql_str)
+        print(f"added column thumbnail_codec to {cls.table_pictures}")
+
+    @classmethod
+    @DbUtils.connect
+    def thumbnail_report(cls, cursor, sample_size=200):
+        """print the size of the thumbnails table and for each thumbnail codec the
+        size of the thumbnails and the time to decode a sample of them
+        """
+        sql_str = f"SELECT pg_total_relation_size('{cls.table_thumbnails}');"
+        cursor.execute(sql_str)
+        print(
+            f"size table {cls.table_thumbnails}: {cursor.fetchone()[0] / 1e6:,.1f} MB"
+        )
+        sql_str = (
+            f"SELECT count(thumbnail_hash), count(DISTINCT thumbnail_hash) "
+            f"FROM {cls.table_payloads};"
+        )
+        cursor.execute(sql_str)
+        references, stored = cursor.fetchone()
+        print(f"{references:,} pictures share {stored:,} stored thumbnails")
+
+        sql_str = (
+            f"SELECT thumbnail_codec, count(*), sum(pg_column_size(thumbnail)) "
+            f"FROM {cls.table_thumbnails} GROUP BY thumbnail_codec ORDER BY 1;"
+        )
+        cursor.execute(sql_str)
+        for thumbnail_codec, count, size in cursor.fetchall():
+            sql_str = (
+                f"SELECT thumbnail FROM {cls.table_thumbnails} "
+                f"WHERE thumbnail_codec IS NOT DISTINCT FROM %s "
+                f"AND thumbnail IS NOT NULL LIMIT %s;"
+            )
+            cursor.execute(sql_str, (thumbnail_codec, sample_size))
+            thumbnails = [
+                io.BytesIO(val[0].encode(exif.codec)) for val in cursor.fetchall()
+            ]
+            start = time.perf_counter()
+            for thumbnail in thumbnails:
+                with Image.open(thumbnail) as im:
+                    im.load()
+
+            decode_time = (time.perf_counter() - start) / max(len(thumbnails), 1)
+            print(
+                f"{thumbnail_codec}: {count:,} thumbnails, {(size or 0) / 1e6:,.1f} MB, "
+                f"average {(size or 0) / max(count, 1) / 1e3:,.1f} kB, "
+                f"decode {decode_time * 1e3:.2f} ms"
+            )
+
+    @classmethod
+    @DbUtils.connect
+    def reencode_thumbnails_batch(cls, start_id, batch_size, cursor):
+        """re-encode the thumbnails with id > start_id that do not have the codec
+        of THUMBNAIL_SETTINGS. The thumbnail is made from the original file if
+        available, otherwise the stored thumbnail is re-encoded.
+        :returns:
+            last_id, number re-encoded: tuple or None if there are no more pictures
+        """
+        sql_str = (
+            f"SELECT p.id, t.thumbnail, fo.path, f.file_name "
+            f"FROM {cls.table_pictures} p "
+            f"JOIN {cls.table_payloads} pl ON pl.picture_id = p.id "
+            f"LEFT JOIN {cls.table_thumbnails} t ON t.content_hash = pl.thumbnail_hash "
+            f"LEFT JOIN {cls.table_files} f ON f.picture_id = p.id "
+            f"LEFT JOIN {cls.table_folders} fo ON fo.id = f.folder_id "
+            f"WHERE p.id > %s ORDER BY p.id LIMIT %s;"
+        )
+        cursor.execute(sql_str, (start_id, batch_size))
+        results = cursor.fetchall()
+        if not results:
+            return None
+
+        sql_ids = (
+            f"SELECT pl.picture_id FROM {cls.table_payloads} pl "
+            f"LEFT JOIN {cls.table_thumbnails} t ON t.content_hash = pl.thumbnail_hash "
+            f"WHERE pl.picture_id = ANY(%s) AND t.thumbnail_codec IS DISTINCT FROM %s;"
+        )
+        cursor.execute(sql_ids, ([val[0] for val in results], THUMBNAIL_SETTINGS.name))
+        reencode_ids = {val[0] for val in cursor.fetchall()}
+
+        count = 0
+        for picture_id, thumbnail, file_path, file_name in results:
+            if picture_id not in reencode_ids:
+                continue
+
+            # thumbnails are stored at rotation 0, like the picture in the file
+            im = None
+            if file_path and file_name:
+                filename = os.path.join(file_path, file_name)
+                if os.path.isfile(filename):
+                    im = exif.get_pil_image(filename)
+
+            if im is None and thumbnail:
+                im = exif.get_pil_image(io.BytesIO(thumbnail.encode(exif.codec)))
+
+            if im is None:
+                logger.info(f"unable to re-encode thumbnail for {picture_id}")
+                continue
+
+            picture_bytes = exif.get_image_bytes(im)
+            cls.update_thumbnail(
+                cursor, picture_id, json.dumps(picture_bytes.decode(exif.codec))
+            )
+            count += 1
+
+        return results[-1][0], count
+
+    @classmethod
+    def reencode_thumbnails(cls, batch_size=200):
+        """migration job to re-encode all thumbnails with THUMBNAIL_SETTINGS. Each
+        batch is committed, the job can be stopped and run again. The table size
+        and decode time are reported before and after.
+        """
+        cls.thumbnail_report()
+        last_id = 0
+        total = 0
+        while result := cls.reencode_thumbnails_batch(last_id, batch_size):
+            last_id, count = result
+            total += count
+            print(
+                f"\rre-encoded {total:,} thumbnails as {THUMBNAIL_SETTINGS.name} "
+                f"up to id {last_id}",
+                end="",
+            )
+
+        print()
+        cls.thumbnail_report()
+
+    @classmethod
+    @DbUtils.connect
+    def table_sizes_report(cls, cursor):
+        """print the size of the pictures, payloads and thumbnails tables"""
+        for table in [cls.table_pictures, cls.table_payloads, cls.table_thumbnails]:
+            sql_str = "SELECT pg_total_relation_size(to_regclass(%s));"
+            cursor.execute(sql_str, (table,))
+            size = cursor.fetchone()[0] or 0
+            print(f"size table {table}: {size / 1e6:,.1f} MB")
+
+    @classmethod
+    @DbUtils.connect
+    def copy_payloads_batch(cls, start_id, batch_size, cursor):
+        """copy the thumbnail and exif of pictures with id > start_id from the
+        pictures table to the thumbnails and payloads tables
+        :returns:
+            last_id: integer or None if there are no more pictures
+        """
+        sql_str = (
+            f"SELECT max(id) FROM (SELECT id FROM {cls.table_pictures} "
+            f"WHERE id > %s ORDER BY id LIMIT %s) batch;"
+        )
+        cursor.execute(sql_str, (start_id, batch_size))
+        if (last_id := cursor.fetchone()[0]) is None:
+            return None
+
+        cls.copy_thumbnails(cursor, cls.table_pictures, "id", start_id, last_id)
+        sql_str = (
+            f"INSERT INTO {cls.table_payloads} "
+            f"(picture_id, thumbnail_hash, exif, exif_raw, exif_codec) "
+            f"SELECT id, md5(thumbnail::text), exif, exif_raw, exif_codec "
+            f"FROM {cls.table_pictures} WHERE id > %s AND id <= %s "
+            f"ON CONFLICT (picture_id) DO NOTHING;"
+        )
+        cursor.execute(sql_str, (start_id, last_id))
+        return last_id
+
+    @classmethod
+    def copy_thumbnails(cls, cursor, table, id_column, start_id, last_id):
+        """copy the distinct thumbnails of the rows of table with start_id <
+        id_column <= last_id to the thumbnails table. The content hash md5 of the
+        json text is the same as Exif.thumbnail_hash.
+        """
+        sql_str = (
+            f"INSERT INTO {cls.table_thumbnails} "
+            f"(content_hash, thumbnail, thumbnail_codec) "
+            f"SELECT DISTINCT ON (md5(thumbnail::text)) md5(thumbnail::text), "
+            f"thumbnail, thumbnail_codec FROM {table} "
+            f"WHERE {id_column} > %s AND {id_column} <= %s AND thumbnail IS NOT NULL "
+            f"ON CONFLICT (content_hash) DO NOTHING;"
+        )
+        cursor.execute(sql_str, (start_id, last_id))
+
+    @classmethod
+    @DbUtils.connect
+    def drop_payload_columns(cls, cursor):
+        """drop the thumbnail and exif columns from the pictures table once all
+        pictures have their payload
+        """
+        sql_str = (
+            f"SELECT count(*) FROM {cls.table_pictures} p WHERE NOT EXISTS ("
+            f"SELECT 1 FROM {cls.table_payloads} pl WHERE pl.picture_id = p.id);"
+        )
+        cursor.execute(sql_str)
+        if missing := cursor.fetchone()[0]:
+            print(f"{missing:,} pictures without payload, columns are not dropped")
+            return False
+
+        sql_str = (
+            f"ALTER TABLE {cls.table_pictures} "
+            f"DROP COLUMN thumbnail, DROP COLUMN thumbnail_codec, DROP COLUMN exif, "
+            f"DROP COLUMN exif_raw, DROP COLUMN exif_codec;"
+        )
+        cursor.execute(sql_str)
+        print(f"dropped thumbnail and exif columns from {cls.table_pictures}")
+        return True
+
+    @classmethod
+    @DbUtils.connect
+    def vacuum_table(cls, table_name, cursor):
+        """rewrite the table to give back the space of dropped columns, VACUUM
+        can not run inside a transaction
+        """
+        cursor.connection.commit()
+        cursor.connection.autocommit = True
+        cursor.execute(f"VACUUM FULL ANALYZE {table_name};")
+        print(f"vacuumed table {table_name}")
+
+    @classmethod
+    def split_payloads(cls, batch_size=2000):
+        """migration to move the thumbnail and exif of existing pictures to the
+        payloads table. Every batch is committed, the migration can be stopped
+        and run again. The pictures table is rewritten at the end to release the
+        space of the dropped columns.
+        """
+        cls.table_sizes_report()
+        last_id = 0
+        while (result := cls.copy_payloads_batch(last_id, batch_size)) is not None:
+            last_id = result
+            print(f"\rcopied payloads up to id {last_id}", end="")
+
+        print()
+        if cls.drop_payload_columns():
+            cls.vacuum_table(cls.table_pictures)
+            cls.table_sizes_report()
+
+    @classmethod
+    @DbUtils.connect
+    def add_thumbnail_hash_column(cls, cursor):
+        """patch to create the thumbnails table and add the thumbnail_hash column
+        to a payloads table that still holds the thumbnails
+        """
+        cls.create_thumbnails_table()
+        sql_str = (
+            f"ALTER TABLE {cls.table_payloads} "
+            f"ADD COLUMN thumbnail_hash VARCHAR(32);"
+        )
+        cursor.execute(sql_str)
+        print(f"added column thumbnail_hash to {cls.table_payloads}")
+
+    @classmethod
+    @DbUtils.connect
+    def dedup_thumbnails_batch(cls, start_id, batch_size, cursor):
+        """move the thumbnails of payloads with picture_id > start_id to the
+        thumbnails table, a thumbnail that is already stored is not copied again
+        :returns:
+            last_id: integer or None if there are no more payloads
+        """
+        sql_str = (
+            f"SELECT max(picture_id) FROM (SELECT picture_id "
+            f"FROM {cls.table_payloads} WHERE picture_id > %s "
+            f"ORDER BY picture_id LIMIT %s) batch;"
+        )
+        cursor.execute(sql_str, (start_id, batch_size))
+        if (last_id := cursor.fetchone()[0]) is None:
+            return None
+
+        cls.copy_thumbnails(cursor, cls.table_payloads, "picture_id", start_id, last_id)
+        sql_str = (
+            f"UPDATE {cls.table_payloads} SET thumbnail_hash = md5(thumbnail::text) "
+            f"WHERE picture_id > %s AND picture_id <= %s AND thumbnail_hash IS NULL;"
+        )
+        cursor.execute(sql_str, (start_id, last_id))
+        return last_id
+
+    @classmethod
+    @DbUtils.connect
+    def drop_payload_thumbnail_columns(cls, cursor):
+        """drop the thumbnail columns from the payloads table and make the
+        thumbnail_hash refer to the thumbnails table
+        """
+        sql_str = (
+            f"SELECT count(*) FROM {cls.table_payloads} "
+            f"WHERE thumbnail IS NOT NULL AND thumbnail_hash IS NULL;"
+        )
+        cursor.execute(sql_str)
+        if missing := cursor.fetchone()[0]:
+            print(f"{missing:,} thumbnails not moved, columns are not dropped")
+            return False
+
+        sql_str = (
+            f"ALTER TABLE {cls.table_payloads} "
+            f"DROP COLUMN thumbnail, DROP COLUMN thumbnail_codec, "
+            f"ADD FOREIGN KEY (thumbnail_hash) "
+            f"REFERENCES {cls.table_thumbnails}(content_hash);"
+        )
+        cursor.execute(sql_str)
+        sql_str = (
+            f"CREATE INDEX {cls.table_payloads}_thumbnail_hash_idx "
+            f"ON {cls.table_payloads} (thumbnail_hash);"
+        )
+        cursor.execute(sql_str)
+        print(f"dropped thumbnail columns from {cls.table_payloads}")
+        return True
+
+    @classmethod
+    def dedup_thumbnails(cls, batch_size=2000):
+        """migration to store the thumbnails of a database with a payloads table
+        once per content hash. Every batch is committed, the migration can be
+        stopped and run again.
+        """
+        cls.table_sizes_report()
+        last_id = 0
+        while (result := cls.dedup_thumbnails_batch(last_id, batch_size)) is not None:
+            last_id = result
+            print(f"\rmoved thumbnails up to picture id {last_id}", end="")
+
+        print()
+        if cls.drop_payload_thumbnail_columns():
+            cls.vacuum_table(cls.table_payloads)
+            cls.table_sizes_report()
+
+    @classmethod
+    @DbUtils.connect
+    def add_thumbnail_normalized_column(cls, cursor):
+        """patch to mark the thumbnails that still have the rotation of the
+        picture applied, the column is dropped by normalize_thumbnails when all
+        thumbnails are at rotation 0
+        """
+        sql_str = (
+            f"ALTER TABLE {cls.table_payloads} "
+            f"ADD COLUMN thumbnail_normalized BOOLEAN DEFAULT FALSE;"
+        )
+        cursor.execute(sql_str)
+        print(f"added column thumbnail_normalized to {cls.table_payloads}")
+
+    @classmethod
+    @DbUtils.connect
+    def normalize_thumbnails_batch(cls, start_id, batch_size, cursor):
+        """store the thumbnails of pictures with id > start_id at rotation 0. The
+        thumbnail is made from the original file if available, otherwise the
+        stored thumbnail is rotated back.
+        :returns:
+            last_id, number normalized: tuple or None if there are no more pictures
+        """
+        sql_str = (
+            f"SELECT p.id, p.rotate, t.thumbnail, fo.path, f.file_name "
+            f"FROM {cls.table_payloads} pl "
+            f"JOIN {cls.table_pictures} p ON p.id = pl.picture_id "
+            f"LEFT JOIN {cls.table_thumbnails} t ON t.content_hash = pl.thumbnail_hash "
+            f"LEFT JOIN {cls.table_files} f ON f.picture_id = p.id "
+            f"LEFT JOIN {cls.table_folders} fo ON fo.id = f.folder_id "
+            f"WHERE pl.picture_id > %s AND NOT pl.thumbnail_normalized "
+            f"ORDER BY pl.picture_id LIMIT %s;"
+        )
+        cursor.execute(sql_str, (start_id, batch_size))
+        results = cursor.fetchall()
+        if not results:
+            return None
+
+        count = 0
+        for picture_id, rotate, thumbnail, file_path, file_name in results:
+            if rotate % 360 == 0:
+                continue
+
+            im = None
+            if file_path and file_name:
+                filename = os.path.join(file_path, file_name)
+                if os.path.isfile(filename):
+                    im = exif.get_pil_image(filename)
+
+            if im is None and thumbnail:
+                if im := exif.get_thumbnail_image(thumbnail):
+                    im = exif.rotate_image(im, -rotate % 360)
+
+            if im is None:
+                logger.info(f"unable to normalize thumbnail for {picture_id}")
+                continue
+
+            picture_bytes = exif.get_image_bytes(im)
+            cls.update_thumbnail(
+                cursor, picture_id, json.dumps(picture_bytes.decode(exif.codec))
+            )
+            count += 1
+
+        sql_str = (
+            f"UPDATE {cls.table_payloads} SET thumbnail_normalized = TRUE "
+            f"WHERE picture_id = ANY(%s);"
+        )
+        cursor.execute(sql_str, ([val[0] for val in results],))
+        return results[-1][0], count
+
+    @classmethod
+    @DbUtils.connect
+    def drop_thumbnail_normalized_column(cls, cursor):
+        sql_str = (
+            f"SELECT count(*) FROM {cls.table_payloads} WHERE NOT thumbnail_normalized;"
+        )
+        cursor.execute(sql_str)
+        if remaining := cursor.fetchone()[0]:
+            print(f"{remaining:,} thumbnails not normalized, column is not dropped")
+            return
+
+        sql_str = (
+            f"ALTER TABLE {cls.table_payloads} DROP COLUMN thumbnail_normalized;"
+        )
+        cursor.execute(sql_str)
+        print("all thumbnails normalized, dropped column thumbnail_normalized")
+
+    @classmethod
+    def normalize_thumbnails(cls, batch_size=200):
+        """one-off job to store the thumbnails of rotated pictures at rotation 0,
+        the rotation is then only applied when a picture is displayed. Each batch
+        is committed, the job can be stopped and run again.
+        """
+        last_id = 0
+        total = 0
+        while result := cls.normalize_thumbnails_batch(last_id, batch_size):
+            last_id, count = result
+            total += count
+            print(f"\rnormalized {total:,} thumbnails up to id {last_id}", end="")
+
+        print()
+        cls.drop_thumbnail_normalized_column()
+
+    @classmethod
+    @DbUtils.connect
+    def add_folder_id_column(cls, cursor):
+        """patch to add the column folder_id to the files table, the folders table
+        must exist (create_folders_table). The column file_path is dropped by
+        normalize_folders when all files refer to their folder.
+        """
+        sql_str = (
+            f"ALTER TABLE {cls.table_files} "
+            f"ADD COLUMN folder_id INTEGER REFERENCES {cls.table_folders}(id);"
+        )
+        cursor.execute(sql_str)
+        print(f"added column folder_id to {cls.table_files}")
+
+    @classmethod
+    @DbUtils.connect
+    def add_folder_counts_columns(cls, cursor):
+        """patch to add the columns pictures and unchecked to the folders table
+        and count the pictures of every folder
+        """
+        sql_str = (
+            f"ALTER TABLE {cls.table_folders} "
+            f"ADD COLUMN pictures INTEGER NOT NULL DEFAULT 0, "
+            f"ADD COLUMN unchecked INTEGER NOT NULL DEFAULT 0;"
+        )
+        cursor.execute(sql_str)
+        cls.update_folder_counts(cursor)
+        print(f"added columns pictures and unchecked to {cls.table_folders}")
+
+    @classmethod
+    @DbUtils.connect
+    def fill_folder_ids_batch(cls, start_id, batch_size, cursor):
+        """set the folder_id of the files with id > start_id from their file_path,
+        adding the folders that are not yet in the folders table
+        :returns:
+            last_id, number of files updated: tuple or None if there are no more files
+        """
+        sql_str = (
+            f"SELECT id, file_path FROM {cls.table_files} "
+            f"WHERE id > %s AND folder_id IS NULL ORDER BY id LIMIT %s;"
+        )
+        cursor.execute(sql_str, (start_id, batch_size))
+        results = cursor.fetchall()
+        if not results:
+            return None
+
+        folder_ids = cls.get_folder_ids(cursor, [file_path for _, file_path in results])
+        values = [
+            (file_id, folder_ids[file_path])
+            for file_id, file_path in results
+            if file_path
+        ]
+        if values:
+            sql_str = (
+                f"UPDATE {cls.table_files} f SET folder_id = v.folder_id "
+                f"FROM (VALUES %s) AS v(id, folder_id) WHERE f.id = v.id;"
+            )
+            execute_values(cursor, sql_str, values, page_size=len(values))
+            cls.update_folder_counts(cursor, folder_ids.values())
+
+        return results[-1][0], len(values)
+
+    @classmethod
+    @DbUtils.connect
+    def drop_file_path_column(cls, cursor):
+        sql_str = (
+            f"SELECT count(*) FROM {cls.table_files} "
+            f"WHERE folder_id IS NULL AND file_path IS NOT NULL;"
+        )
+        cursor.execute(sql_str)
+        if remaining := cursor.fetchone()[0]:
+            print(f"{remaining:,} files without folder_id, column is not dropped")
+            return False
+
+        sql_str = f"ALTER TABLE {cls.table_files} DROP COLUMN file_path;"
+        cursor.execute(sql_str)
+        print("all files refer to their folder, dropped column file_path")
+        return True
+
+    @classmethod
+    def normalize_folders(cls, batch_size=5000):
+        """migration to store the folders of the files once in the folders table,
+        the files refer to it by folder_id. Every batch is committed, the migration
+        can be stopped and run again. The files table is rewritten at the end to
+        release the space of the dropped column.
+        """
+        last_id = 0
+        total = 0
+        while result := cls.fill_folder_ids_batch(last_id, batch_size):
+            last_id, count = result
+            total += count
+            print(f"\rset folder of {total:,} files up to id {last_id}", end="")
+
+        print()
+        if cls.drop_file_path_column():
+            cls.create_files_indexes()
+            cls.vacuum_table(cls.table_files)
@@ -0,0 +1,238 @@
+""" bounded pipeline for ingesting pictures
+
+    The pipeline runs the stages of an ingest at the same time:
+        producer: directory entries from the scanner
+        decode: picture meta data and thumbnail from the file (cpu)
+        geocode: geolocation info for pictures with a location (i/o)
+        write: the calling thread, a single database writer
+    Stages are connected by bounded queues, so a slow stage holds up the stages
+    before it. The number of items in flight is limited, which bounds the memory
+    used regardless of the number of files. Items are returned to the writer in
+    the order of the producer, so an ingest checkpoint remains valid. When the
+    writer stops early the stages drop their items and all threads are joined.
+"""
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from picture_scanner import ScanEntry
+
+STOP = object()
+# seconds a blocked stage waits before it checks if the pipeline is stopped
+POLL_INTERVAL = 0.2
+
+
+def put_until_stopped(item_queue, item, stopped):
+    """put item on item_queue, give up when the event stopped is set
+    :returns:
+        True if the item is put: boolean
+    """
+    while not stopped.is_set():
+        try:
+            item_queue.put(item, timeout=POLL_INTERVAL)
+            return True
+
+        except queue.Full:
+            pass
+
+    return False
+
+
+def get_until_stopped(item_queue, stopped):
+    """get an item from item_queue, STOP when the event stopped is set"""
+    while not stopped.is_set():
+        try:
+            return item_queue.get(timeout=POLL_INTERVAL)
+
+        except queue.Empty:
+            pass
+
+    return STOP
+
+
+@dataclass
+class IngestItem:
+    seq: int
+    entry: ScanEntry
+    picture_id: int = None
+    pic_meta: object = None
+    file_meta: object = None
+    location: tuple = None
+    geolocation_info: str = None
+    error: Exception = None
+
+
+class PipelineStage:
+    """stage taking items from its queue by a number of worker threads, items
+    are processed by func and put on the queue of the next stage. Items that have
+    an error are passed on without processing. The workers end when the event
+    stopped is set.
+    """
+
+    def __init__(self, name, func, workers, queue_size, stopped):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stopped = stopped
+        self.output = None
+        self.processed = 0
+        self.started = None
+        self.threads = []
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def start(self, output):
+        self.output = output
+        self.started = time.monotonic()
+        self._running = self.workers
+        self.threads = [
+            threading.Thread(target=self.run, name=f"{self.name}_{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+    def run(self):
+        while (item := get_until_stopped(self.queue, self.stopped)) is not STOP:
+            if item.error is None:
+                try:
+                    self.func(item)
+
+                except Exception as error:  # pylint: disable=broad-except
+                    item.error = error
+
+            with self._lock:
+                self.processed += 1
+
+            if not put_until_stopped(self.output, item, self.stopped):
+                return
+
+        # hand the stop on to the other workers of this stage, the last worker
+        # stops the next stage
+        put_until_stopped(self.queue, STOP, self.stopped)
+        with self._lock:
+            self._running -= 1
+            last_worker = self._running == 0
+
+        if last_worker:
+            put_until_stopped(self.output, STOP, self.stopped)
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started if self.started else 0
+        return {
+            "stage": self.name,
+            "queue": self.queue.qsize(),
+            "processed": self.processed,
+            "rate": self.processed / elapsed if elapsed else 0.0,
+        }
+
+
+class IngestPipeline:
+    """run the entries through the decode and geocode stages
+    :arguments:
+        decode: function(item) setting the picture and file meta data
+        geocode: function(item) setting the geolocation info
+        decode_workers: number of decode threads: integer
+        geocode_workers: number of geocode threads: integer
+        queue_size: size of the queue of each stage: integer
+        max_in_flight: maximum number of items between producer and writer
+    """
+
+    def __init__(
+        self,
+        decode,
+        geocode,
+        decode_workers=4,
+        geocode_workers=1,
+        queue_size=32,
+        max_in_flight=256,
+    ):
+        self._stopped = threading.Event()
+        self.stages = [
+            PipelineStage("decode", decode, decode_workers, queue_size, self._stopped),
+            PipelineStage(
+                "geocode", geocode, geocode_workers, queue_size, self._stopped
+            ),
+        ]
+        self.write_queue = queue.Queue(maxsize=queue_size)
+        self.max_in_flight = max_in_flight
+        self.written = 0
+        self.started = None
+        self._in_flight = threading.Semaphore(max_in_flight)
+        self._producer = None
+        self._producer_error = None
+
+    def produce(self, entries):
+        first_queue = self.stages[0].queue
+        try:
+            for seq, entry in enumerate(entries):
+                while not self._in_flight.acquire(timeout=POLL_INTERVAL):
+                    if self._stopped.is_set():
+                        return
+
+                item = IngestItem(seq=seq, entry=entry)
+                if not put_until_stopped(first_queue, item, self._stopped):
+                    return
+
+        except Exception as error:  # pylint: disable=broad-except
+            self._producer_error = error
+
+        finally:
+            put_until_stopped(first_queue, STOP, self._stopped)
+
+    def run(self, entries):
+        """generator yielding the processed items in the order of entries"""
+        self.started = time.monotonic()
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.start(next_stage.queue)
+
+        self.stages[-1].start(self.write_queue)
+        self._producer = threading.Thread(
+            target=self.produce, args=(entries,), name="producer", daemon=True
+        )
+        self._producer.start()
+
+        reorder_buffer = {}
+        next_seq = 0
+        try:
+            while (item := self.write_queue.get()) is not STOP:
+                reorder_buffer[item.seq] = item
+                while next_seq in reorder_buffer:
+                    yield reorder_buffer.pop(next_seq)
+                    next_seq += 1
+                    self.written += 1
+                    self._in_flight.release()
+
+        finally:
+            # also when the writer closes the generator early, the stages
+            # blocked on a full queue see the event and end
+            self._stopped.set()
+            self._producer.join()
+            for stage in self.stages:
+                stage.join()
+
+        if self._producer_error:
+            raise self._producer_error
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started if self.started else 0
+        return [stage.stats() for stage in self.stages] + [
+            {
+                "stage": "write",
+                "queue": self.write_queue.qsize(),
+                "processed": self.written,
+                "rate": self.written / elapsed if elapsed else 0.0,
+            }
+        ]
+
+    def report(self):
+        return " | ".join(
+            f"{stats['stage']}: {stats['processed']} "
+            f"({stats['rate']:.1f}/s, queue {stats['queue']})"
+            for stats in self.stats()
+        )
@@ -0,0 +1,154 @@
+""" concurrent directory scanner based on os.scandir
+
+    Listing a folder and getting the stat of its files on a network share costs
+    a round trip for every call. The FolderScanner lists folders ahead of the
+    consumer in a bounded thread pool and returns the stat results it obtained
+    from the directory entries, so no separate os.stat is needed per file.
+    Entries are yielded in a deterministic order: per folder the files sorted by
+    name, followed by its subfolders sorted by name (depth first). This allows a
+    scan to be resumed after a given file, skipping the folders before it without
+    listing them.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+
+@dataclass
+class ScanEntry:
+    folder: str
+    name: str
+    path: str
+    stat: os.stat_result
+
+
+def order_key(base_folder, path, is_folder=False):
+    """key of a path relative to base_folder in the order of the scan, files in
+    a folder (0, name) come before its subfolders (1, name)
+    """
+    relative_path = os.path.relpath(path, base_folder)
+    parts = [] if relative_path == os.curdir else relative_path.split(os.sep)
+    if is_folder:
+        return tuple((1, part) for part in parts)
+
+    return tuple((1, part) for part in parts[:-1]) + ((0, parts[-1]),)
+
+
+class FolderScanner:
+    """walk a folder tree concurrently and stream the file entries
+    :arguments:
+        max_workers: number of threads listing folders: integer
+        lookahead: maximum number of folder listings held ahead of the consumer
+        suffixes: only yield files with these (lower case) suffixes, all files
+                  if None
+    """
+
+    def __init__(self, max_workers=8, lookahead=32, suffixes=None):
+        self.max_workers = max_workers
+        self.lookahead = lookahead
+        self.suffixes = tuple(suffixes) if suffixes else None
+
+    def list_folder(self, folder):
+        """list a single folder
+        :returns:
+            files: list of ScanEntry sorted by name
+            subfolders: list of folder paths sorted by name
+        """
+        files = []
+        subfolders = []
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subfolders.append(entry.path)
+
+                        elif entry.is_file():
+                            if self.suffixes and not entry.name.lower().endswith(
+                                self.suffixes
+                            ):
+                                continue
+
+                            files.append(
+                                ScanEntry(
+                                    folder=folder,
+                                    name=entry.name,
+                                    path=entry.path,
+                                    stat=entry.stat(),
+                                )
+                            )
+
+                    except OSError as error:
+                        print(f"unable to scan {entry.path}, error: {error}")
+
+        except OSError as error:
+            print(f"unable to scan folder {folder}, error: {error}")
+
+        files.sort(key=lambda file_entry: file_entry.name)
+        subfolders.sort()
+        return files, subfolders
+
+    def scan(self, base_folder, start_after=None):
+        """generator yielding a ScanEntry for every file under base_folder
+        :arguments:
+            base_folder: folder to scan
+            start_after: path of a file, only files that come after this file in
+                         the scan order are yielded
+        """
+        base_folder = os.fspath(base_folder)
+        start_key = None
+        if start_after:
+            start_key = order_key(base_folder, os.fspath(start_after))
+
+        def on_start_path(folder):
+            """the folder contains start_after"""
+            folder_key = order_key(base_folder, folder, is_folder=True)
+            return folder_key == start_key[: len(folder_key)]
+
+        def before_start(folder):
+            """the folder and its subfolders come before start_after"""
+            folder_key = order_key(base_folder, folder, is_folder=True)
+            return folder_key < start_key[: len(folder_key)]
+
+        stack = [base_folder]
+        futures = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            try:
+                while stack:
+                    # list the folders next in line before they are needed
+                    for folder in reversed(stack[-self.lookahead :]):
+                        if len(futures) >= self.lookahead:
+                            break
+
+                        if folder not in futures:
+                            futures[folder] = pool.submit(self.list_folder, folder)
+
+                    folder = stack.pop()
+                    if future := futures.pop(folder, None):
+                        files, subfolders = future.result()
+
+                    else:
+                        files, subfolders = self.list_folder(folder)
+
+                    if start_key:
+                        if on_start_path(folder):
+                            files = [
+                                file_entry
+                                for file_entry in files
+                                if order_key(base_folder, file_entry.path) > start_key
+                            ]
+
+                        # skipped folders never reach the stack, so they are
+                        # not listed ahead either
+                        subfolders = [
+                            subfolder
+                            for subfolder in subfolders
+                            if not before_start(subfolder)
+                        ]
+
+                    yield from files
+                    stack.extend(reversed(subfolders))
+
+            finally:
+                for future in futures.values():
+                    future.cancel()
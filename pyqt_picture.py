@@ -1,9 +1,10 @@
 """
     This script interactively displays pictures from the picture_db database by typing:
-    >>>python pyqt_picture.py [db_filter] [json_file]
+    >>>python pyqt_picture.py [db_filter] [json_file | selection]
     >>>
     whereby db_filter and json_file are optional. json_file is a json file containing a
-    list of picture ids, like [100, 101, 102]
+    list of picture ids, like [100, 101, 102]. If there is no such file the argument is
+    the name of a selection stored in the database by PictureDb.save_selection.
     db_filter can have the values:
         ALL, no filter applied
         NOGPS, pictures that have no coordinates
@@ -11,14 +12,16 @@
         NOT_CHECKED, pictures where rotate flag is false
     The default filter is ALL.
     Interactively pictures can be selected by the folder a pictures was originally stored
-    or by the creation date.
+    or by the date of the picture.
 """
 
 import sys
+import copy
+import datetime
 import json
-import io
-from pathlib import PureWindowsPath
-from PIL import Image
+import queue
+import threading
+from collections import OrderedDict
 from PyQt6.QtWidgets import (
     QWidget,
     QHBoxLayout,
@@ -27,16 +30,30 @@ from PyQt6.QtWidgets import (
     QLabel,
     QApplication,
     QPushButton,
-    QComboBox,
     QLineEdit,
     QCalendarWidget,
     QDialog,
     QFrame,
+    QListView,
+    QTreeWidget,
+    QTreeWidgetItem,
+    QAbstractItemView,
 )
-from PyQt6.QtCore import Qt, QDate
-from PyQt6.QtGui import QImage, QPixmap, QShortcut
+from PyQt6.QtCore import (
+    Qt,
+    QDate,
+    QObject,
+    QRunnable,
+    QThreadPool,
+    QTimer,
+    QSize,
+    QAbstractListModel,
+    QModelIndex,
+    pyqtSignal,
+)
+from PyQt6.QtGui import QColor, QFont, QImage, QPixmap, QShortcut, QTextCharFormat
 from picture_exif import Exif
-from picture_db import PictureDb, DbFilter
+from picture_db import PictureDb, DbFilter, DbUtils, picture_cache
 
 anticlockwise_symbol = "\u21b6"
 clockwise_symbol = "\u21b7"
@@ -44,74 +61,110 @@ right_arrow_symbol = "\u25B6"
 left_arrow_symbol = "\u25C0"
 dialogue_rel_position = (10, 285)
 date_widget_size = (400, 250)
-folder_widget_size = (520, 192)
+day_highlight_color = "#cce5ff"
+folder_widget_size = (520, 400)
+prefetch_count = 5
+prefetch_workers = 3
+write_chunk_size = 50
+tile_size = 160
+tile_cache_size = 1000
+tile_batch_size = 50
+tile_workers = 2
+checked_symbol = "\u2713"
 exif = Exif()
 
 
+def read_ids_argument(argument):
+    """argument is a json file with a list of ids or, if there is no such file,
+    the name of a selection stored in the database
+    :returns:
+        (ids, None), ([], selection) or ([], None) for an invalid json file
+    """
+    try:
+        with open(argument, "r") as jsonfile:
+            ids = json.load(jsonfile)
+
+        if not isinstance(ids, list):
+            raise ValueError
+
+        return ids, None
+
+    except FileNotFoundError:
+        return [], argument
+
+    except (ValueError, json.decoder.JSONDecodeError):
+        return [], None
+
+
 def parse_argv(argv):
-    """arguments: [DbFilter] [json file with list]
+    """arguments: [DbFilter] [json file with list | selection name]
     no argument or more then 2 arguments return:
-        (default_db_filter, [])
+        (default_db_filter, [], None)
     one argument returns:
-        (default_db_filter, []), (db_filter, []) or (default_db_filter, [n1..nn])
+        (db_filter, [], None), (default_db_filter, [n1..nn], None) or
+        (default_db_filter, [], selection)
     two arguments return:
-        (defaukt_db_filter, []), (db_filter, [n1..nn]), (db_filter, []) or (default_db_filter, [n1..nn])
+        (db_filter, [n1..nn], None) or (db_filter, [], selection), whereby an
+        invalid db_filter gives the default_db_filter
     """
     default_db_filter = DbFilter.ALL
-    default = (default_db_filter, [])
+    default = (default_db_filter, [], None)
 
-    if not argv or len(argv) < 2:
+    if not argv or len(argv) < 2 or len(argv) > 3:
         return default
 
-    elif len(argv) == 2:
-        try:
-            with open(argv[1], "r") as jsonfile:
-                ids = json.load(jsonfile)
-
-            if isinstance(ids, list):
-                return (default_db_filter, ids)
-
-        except (FileNotFoundError, json.decoder.JSONDecodeError):
-            try:
-                return (DbFilter[argv[1].upper()], [])
-
-            except KeyError:
-                return default
+    arguments = argv[1:]
+    db_filter = default_db_filter
+    if len(arguments) == 2 or arguments[0].upper() in DbFilter.__members__:
+        db_filter = DbFilter.__members__.get(arguments[0].upper(), default_db_filter)
+        arguments = arguments[1:]
 
-    elif len(argv) == 3:
-        try:
-            with open(argv[2], "r") as jsonfile:
-                ids = json.load(jsonfile)
+    if not arguments:
+        return (db_filter, [], None)
 
-            if not isinstance(ids, list):
-                raise ValueError
+    ids, selection = read_ids_argument(arguments[0])
+    return (db_filter, ids, selection)
 
-        except (ValueError, FileNotFoundError, json.decoder.JSONDecodeError):
-            ids = []
 
-        try:
-            return (DbFilter[argv[1].upper()], ids)
+qimage_formats = {
+    "RGB": QImage.Format.Format_RGB888,
+    "RGBA": QImage.Format.Format_RGBA8888,
+    "L": QImage.Format.Format_Grayscale8,
+}
 
-        except KeyError:
-            return (default_db_filter, ids)
 
-    else:
-        return default
+def pil2qimage(pil_image):
+    """wrap the pixels of the PIL image in a QImage without encoding them,
+    modes other than RGB, RGBA and L are converted first.
+    :returns:
+        qimg, data: the QImage uses data, which has to stay alive as long as
+        qimg is used
+    """
+    if pil_image.mode not in qimage_formats:
+        has_alpha = "A" in pil_image.getbands() or "transparency" in pil_image.info
+        pil_image = pil_image.convert("RGBA" if has_alpha else "RGB")
+
+    data = pil_image.tobytes("raw", pil_image.mode)
+    width, height = pil_image.size
+    bytes_per_line = len(data) // height if height else 0
+    qimg = QImage(
+        data, width, height, bytes_per_line, qimage_formats[pil_image.mode]
+    )
+    return qimg, data
 
 
 def pil2pixmap(pil_image):
+    """convert the pixels of the PIL image to a QPixmap without encoding them"""
     if pil_image is None:
         return None
 
-    bytes_img = io.BytesIO()
     try:
-        pil_image.save(bytes_img, format="JPEG")
-    except:
-        return None
+        qimg, _data = pil2qimage(pil_image)
 
-    qimg = QImage()
-    qimg.loadFromData(bytes_img.getvalue())
+    except (OSError, ValueError):
+        return None
 
+    # fromImage copies the pixels, so data only has to stay alive until here
     return QPixmap.fromImage(qimg)
 
 
@@ -176,6 +229,30 @@ class DateDialog(QDialog):
         self.date_widget = QCalendarWidget(self)
         self.date_widget.setGeometry(5, 5, date_widget_size[0], date_widget_size[1])
         self.date_widget.clicked[QDate].connect(self.clicked)
+        self.date_widget.currentPageChanged.connect(self.page_changed)
+        self.picdb = parent.picdb
+        self.reader = parent.reader
+        self.page_changed(self.date_widget.yearShown(), self.date_widget.monthShown())
+
+    def page_changed(self, year, month):
+        """highlight the days that have pictures, the calendar also shows days
+        of the months before and after
+        """
+        day_from, day_to = self.picdb.day_range(year, month)
+        self.reader.submit(
+            f"get days {year}-{month:02}",
+            self.picdb.get_day_counts,
+            day_from - datetime.timedelta(days=7),
+            day_to + datetime.timedelta(days=14),
+            callback=self.show_day_counts,
+        )
+
+    def show_day_counts(self, day_counts):
+        text_format = QTextCharFormat()
+        text_format.setFontWeight(QFont.Weight.Bold)
+        text_format.setBackground(QColor(day_highlight_color))
+        for day in day_counts:
+            self.date_widget.setDateTextFormat(QDate(day), text_format)
 
     def clicked(self):
         self.accept()
@@ -186,7 +263,11 @@ class DateDialog(QDialog):
 
 
 class FolderDialog(QDialog):
-    def __init__(self, folders, parent):
+    """folder tree with the number of pictures and of pictures with rotation not
+    checked, subfolders are added when a folder is expanded
+    """
+
+    def __init__(self, tree, parent):
         super().__init__()
         self.setWindowTitle("Select folder ...")
         self.setGeometry(
@@ -195,24 +276,525 @@ class FolderDialog(QDialog):
             folder_widget_size[0] + 10,
             folder_widget_size[1] + 10,
         )
-        self.folder_widget = QComboBox(self)
-        self.folder_widget.setGeometry(5, 5, folder_widget_size[0], 20)
-        self.folder_widget.addItems(["Select folder"] + folders)
-        self.folder_widget.currentIndexChanged.connect(self.selected)
-
-    def selected(self):
+        self.selected_node = None
+        self.folder_widget = QTreeWidget(self)
+        self.folder_widget.setGeometry(5, 5, folder_widget_size[0], folder_widget_size[1])
+        self.folder_widget.setHeaderLabels(["Folder", "Pictures", "Not checked"])
+        self.folder_widget.setColumnWidth(0, folder_widget_size[0] - 180)
+        self.folder_widget.itemExpanded.connect(self.expanded)
+        self.folder_widget.itemDoubleClicked.connect(self.selected)
+
+        # skip the folders above the base folder
+        nodes = tree.roots
+        while len(nodes) == 1 and not nodes[0].pictures and nodes[0].children:
+            nodes = nodes[0].children
+
+        self.add_items(self.folder_widget.invisibleRootItem(), nodes)
+
+    def add_items(self, parent_item, nodes):
+        for node in nodes:
+            pictures, unchecked = node.totals()
+            item = QTreeWidgetItem([node.name, f"{pictures:,}", f"{unchecked:,}"])
+            item.setData(0, Qt.ItemDataRole.UserRole, node)
+            for column in [1, 2]:
+                item.setTextAlignment(column, Qt.AlignmentFlag.AlignRight)
+
+            if node.children:
+                item.setChildIndicatorPolicy(
+                    QTreeWidgetItem.ChildIndicatorPolicy.ShowIndicator
+                )
+
+            parent_item.addChild(item)
+
+    def expanded(self, item):
+        if item.childCount() == 0:
+            node = item.data(0, Qt.ItemDataRole.UserRole)
+            self.add_items(item, node.children)
+
+    def selected(self, item):
+        self.selected_node = item.data(0, Qt.ItemDataRole.UserRole)
         self.accept()
 
     @property
     def folder(self):
-        return self.folder_widget.currentText()
+        return self.selected_node
+
+
+class BulkEditDialog(QDialog):
+    """attributes to apply to a number of pictures, empty fields are not changed"""
+
+    def __init__(self, count, parent):
+        super().__init__()
+        self.setWindowTitle(f"Edit {count} pictures ...")
+        self.move(
+            parent.pos().x() + dialogue_rel_position[0],
+            parent.pos().y() + dialogue_rel_position[1],
+        )
+        formbox = QFormLayout()
+        self.e_make = QLineEdit()
+        self.e_model = QLineEdit()
+        self.e_lat_lon = QLineEdit()
+        self.e_date_offset = QLineEdit()
+        self.e_date_offset.setPlaceholderText("hours, like -1.5")
+        formbox.addRow("Camera make", self.e_make)
+        formbox.addRow("Camera model", self.e_model)
+        formbox.addRow("Latitude, Longitude", self.e_lat_lon)
+        formbox.addRow("Date offset", self.e_date_offset)
+        hbox_buttons = QHBoxLayout()
+        self.error_lbl = QLabel()
+        formbox.addRow(self.error_lbl)
+        ok_button = QPushButton("Apply")
+        ok_button.clicked.connect(self.apply)
+        cancel_button = QPushButton("Cancel")
+        cancel_button.clicked.connect(self.reject)
+        hbox_buttons.addWidget(ok_button)
+        hbox_buttons.addWidget(cancel_button)
+        formbox.addRow(hbox_buttons)
+        self.setLayout(formbox)
+
+    def apply(self):
+        """accept only if all fields filled in are valid"""
+        try:
+            self.attributes
+
+        except ValueError as error:
+            self.error_lbl.setText(str(error))
+            return
+
+        self.accept()
+
+    @property
+    def attributes(self):
+        """keyword arguments for PictureDb.bulk_update_attributes
+        :raises:
+            ValueError if the location or date offset is not valid
+        """
+        attributes = {}
+        if make := self.e_make.text().strip():
+            attributes["camera_make"] = make
+
+        if model := self.e_model.text().strip():
+            attributes["camera_model"] = model
+
+        if lat_lon := self.e_lat_lon.text().strip():
+            lat_lon_str, _ = exif.convert_gps(
+                *[json.loads(val) for val in exif.serialize_decimalgps(lat_lon)[:3]]
+            )
+            if not lat_lon_str:
+                raise ValueError(f"invalid location: {lat_lon}")
+
+            attributes["location"] = lat_lon
+
+        try:
+            if hours := float(self.e_date_offset.text() or 0):
+                attributes["date_offset"] = datetime.timedelta(hours=hours)
+
+        except ValueError:
+            raise ValueError(
+                f"invalid date offset: {self.e_date_offset.text()}"
+            ) from None
+
+        return attributes
+
+
+class LoadTask(QRunnable):
+    def __init__(self, loader, picture_id, generation):
+        super().__init__()
+        self.loader = loader
+        self.picture_id = picture_id
+        self.generation = generation
+
+    def run(self):
+        # skip tasks of a previous id_list that were already taken from the queue
+        if self.generation != self.loader.generation:
+            return
+
+        picture_meta = PictureDb.load_picture_meta(self.picture_id)
+        self.loader.loaded.emit(self.picture_id, self.generation, picture_meta)
+
+
+class PictureLoader(QObject):
+    """loads pictures in a thread pool, the loaded pictures are kept in the
+    picture cache of picture_db and signalled with loaded
+    """
+
+    loaded = pyqtSignal(int, int, object)
+
+    def __init__(self, workers=prefetch_workers):
+        super().__init__()
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(workers)
+        self.generation = 0
+        self.pending = set()
+
+    def request(self, picture_id, priority=0):
+        if picture_id in self.pending:
+            return
+
+        self.pending.add(picture_id)
+        self.pool.start(LoadTask(self, picture_id, self.generation), priority)
+
+    def prefetch(self, id_list, index, count=prefetch_count):
+        """load the count pictures before and after index, nearest first"""
+        for offset in range(1, count + 1):
+            for neighbour in (index + offset, index - offset):
+                picture_id = id_list[neighbour % len(id_list)]
+                if picture_id not in picture_cache:
+                    self.request(picture_id, priority=-offset)
+
+    def done(self, picture_id):
+        self.pending.discard(picture_id)
+
+    def cancel(self):
+        """cancel the tasks that have not started"""
+        self.generation += 1
+        self.pool.clear()
+        self.pending.clear()
+
+
+class DbTask:
+    def __init__(self, description, func, args, kwargs, callback):
+        self.description = description
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.callback = callback
+        self.error = None
+
+
+class DbWorker(QObject):
+    """runs database operations in order in a background thread. The callback
+    of a task is called with its result in the gui thread. Failed tasks are kept
+    in failed_tasks, so they are reported and can be retried.
+    """
+
+    task_finished = pyqtSignal(object, object)
+    task_failed = pyqtSignal(object, str)
+    changed = pyqtSignal()
+
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+        self.pending = 0
+        self.failed_tasks = []
+        self.tasks = queue.Queue()
+        self.task_finished.connect(self.finished)
+        self.task_failed.connect(self.failed)
+        threading.Thread(target=self.run, name=name, daemon=True).start()
+
+    def submit(self, description, func, *args, callback=None, **kwargs):
+        self.pending += 1
+        self.tasks.put(DbTask(description, func, args, kwargs, callback))
+        self.changed.emit()
+
+    def run(self):
+        while True:
+            task = self.tasks.get()
+            try:
+                with DbUtils.raise_errors():
+                    result = task.func(*task.args, **task.kwargs)
+
+                self.task_finished.emit(task, result)
+
+            except Exception as error:  # pylint: disable=broad-except
+                self.task_failed.emit(task, repr(error))
+
+            finally:
+                self.tasks.task_done()
+
+    def finished(self, task, result):
+        self.pending -= 1
+        if task.callback:
+            task.callback(result)
+
+        self.changed.emit()
+
+    def failed(self, task, error):
+        self.pending -= 1
+        task.error = error
+        self.failed_tasks.append(task)
+        print(f"{self.name} failed: {task.description}, error: {error}")
+        self.changed.emit()
+
+    def retry(self):
+        failed_tasks, self.failed_tasks = self.failed_tasks, []
+        for task in failed_tasks:
+            self.submit(
+                task.description,
+                task.func,
+                *task.args,
+                callback=task.callback,
+                **task.kwargs,
+            )
+
+        self.changed.emit()
+
+    def wait(self):
+        """wait until all submitted tasks are done"""
+        self.tasks.join()
+
+
+class TileTask(QRunnable):
+    def __init__(self, model, picture_ids, generation):
+        super().__init__()
+        self.model = model
+        self.picture_ids = picture_ids
+        self.generation = generation
+
+    def run(self):
+        tiles = []
+        if self.generation == self.model.generation:
+            for im, pic_meta, *_ in PictureDb.load_pictures_meta(self.picture_ids):
+                qimg = None
+                if im:
+                    im.thumbnail((tile_size, tile_size))
+                    im = exif.rotate_image(im, pic_meta.rotate)
+                    # copy, so the QImage owns its pixels when it leaves the thread
+                    try:
+                        qimg = pil2qimage(im)[0].copy()
+
+                    except (OSError, ValueError):
+                        pass
+
+                tiles.append((pic_meta.id, qimg, pic_meta.rotate_checked))
+
+            # pictures not in the database get the placeholder, so they are
+            # not requested again on every repaint
+            loaded_ids = {picture_id for picture_id, *_ in tiles}
+            tiles += [
+                (picture_id, None, False)
+                for picture_id in self.picture_ids
+                if picture_id not in loaded_ids
+            ]
+
+        self.model.tiles_loaded.emit(self.generation, self.picture_ids, tiles)
+
+
+class TileModel(QAbstractListModel):
+    """list model of the pictures in id_list, the tiles are loaded lazily in
+    batches in a thread pool when the view asks for them and kept in a cache of
+    tile_cache_size pixmaps
+    """
+
+    tiles_loaded = pyqtSignal(int, object, object)
+
+    def __init__(self, id_list=None):
+        super().__init__()
+        self.id_list = []
+        self.rows = {}
+        self.tiles = OrderedDict()
+        self.pending = set()
+        self.requested = []
+        self.generation = 0
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(tile_workers)
+        self.request_timer = QTimer(self)
+        self.request_timer.setSingleShot(True)
+        self.request_timer.setInterval(20)
+        self.request_timer.timeout.connect(self.load_requested)
+        self.tiles_loaded.connect(self.add_tiles)
+        self.placeholder = QPixmap(tile_size, tile_size)
+        self.placeholder.fill(QColor("lightgray"))
+        self.set_ids(id_list or [])
+
+    def set_ids(self, id_list):
+        self.beginResetModel()
+        self.generation += 1
+        self.pool.clear()
+        self.pending.clear()
+        self.requested.clear()
+        self.id_list = list(id_list)
+        self.rows = {picture_id: row for row, picture_id in enumerate(self.id_list)}
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.id_list)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+
+        picture_id = self.id_list[index.row()]
+        tile = self.tiles.get(picture_id)
+        if tile:
+            self.tiles.move_to_end(picture_id)
+
+        match role:
+            case Qt.ItemDataRole.DecorationRole:
+                if tile:
+                    return tile[0]
+
+                self.request(picture_id)
+                return self.placeholder
+
+            case Qt.ItemDataRole.DisplayRole:
+                checked = f" {checked_symbol}" if tile and tile[1] else ""
+                return f"{picture_id}{checked}"
+
+            case Qt.ItemDataRole.UserRole:
+                return picture_id
+
+        return None
+
+    def request(self, picture_id):
+        """collect the tiles asked for by the view and load them in batches"""
+        if picture_id in self.pending:
+            return
+
+        self.pending.add(picture_id)
+        self.requested.append(picture_id)
+        self.request_timer.start()
+
+    def load_requested(self):
+        for i in range(0, len(self.requested), tile_batch_size):
+            self.pool.start(
+                TileTask(
+                    self, self.requested[i : i + tile_batch_size], self.generation
+                )
+            )
+
+        self.requested = []
+
+    def add_tiles(self, generation, picture_ids, tiles):
+        if generation == self.generation:
+            self.pending.difference_update(picture_ids)
+
+        for picture_id, qimg, checked in tiles:
+            pixmap = QPixmap.fromImage(qimg) if qimg else self.placeholder
+            self.tiles[picture_id] = (pixmap, checked)
+            self.tiles.move_to_end(picture_id)
+            if (row := self.rows.get(picture_id)) is not None:
+                index = self.index(row)
+                self.dataChanged.emit(index, index)
+
+        while len(self.tiles) > tile_cache_size:
+            self.tiles.popitem(last=False)
+
+    def invalidate(self, picture_ids):
+        """reload the tiles of picture_ids"""
+        for picture_id in picture_ids:
+            self.tiles.pop(picture_id, None)
+            if (row := self.rows.get(picture_id)) is not None:
+                index = self.index(row)
+                self.dataChanged.emit(index, index)
+
+
+class GridView(QWidget):
+    """contact sheet of the pictures of the viewer. Only the visible tiles are
+    loaded. Selected pictures can be rotated and confirmed, a double click shows
+    the picture in the viewer.
+    """
+
+    def __init__(self, picture_show):
+        super().__init__()
+        self.picture_show = picture_show
+        self.model = TileModel(picture_show.id_list)
+        self.initUI()
+
+    def initUI(self):
+        vbox = QVBoxLayout()
+        self.view = QListView()
+        self.view.setViewMode(QListView.ViewMode.IconMode)
+        self.view.setResizeMode(QListView.ResizeMode.Adjust)
+        self.view.setMovement(QListView.Movement.Static)
+        self.view.setUniformItemSizes(True)
+        self.view.setIconSize(QSize(tile_size, tile_size))
+        self.view.setGridSize(QSize(tile_size + 16, tile_size + 32))
+        self.view.setSelectionMode(
+            QAbstractItemView.SelectionMode.ExtendedSelection
+        )
+        self.view.setModel(self.model)
+        self.view.doubleClicked.connect(self.show_picture)
+        vbox.addWidget(self.view)
+
+        hbox_buttons = QHBoxLayout()
+        hbox_buttons.setAlignment(Qt.AlignmentFlag.AlignLeft)
+        anticlockwise_button = QPushButton(anticlockwise_symbol)
+        anticlockwise_button.clicked.connect(lambda: self.rotate_selected(-90))
+        clockwise_button = QPushButton(clockwise_symbol)
+        clockwise_button.clicked.connect(lambda: self.rotate_selected(90))
+        confirm_button = QPushButton("Confirm selected")
+        confirm_button.clicked.connect(self.confirm_selected)
+        reset_button = QPushButton("Reset selected")
+        reset_button.clicked.connect(self.reset_selected)
+        edit_button = QPushButton("Edit selected")
+        edit_button.clicked.connect(self.edit_selected)
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.close)
+        for button in [
+            anticlockwise_button,
+            clockwise_button,
+            confirm_button,
+            reset_button,
+            edit_button,
+            close_button,
+        ]:
+            hbox_buttons.addWidget(button)
+
+        vbox.addLayout(hbox_buttons)
+        self.setLayout(vbox)
+        QShortcut(Qt.Key.Key_Space, self, lambda: self.rotate_selected(90))
+
+        self.resize(6 * (tile_size + 16) + 40, 4 * (tile_size + 32) + 60)
+        self.setWindowTitle("Pictures ... ")
+        self.show()
+
+    def selected_ids(self):
+        rows = sorted(
+            index.row() for index in self.view.selectionModel().selectedIndexes()
+        )
+        return [self.model.id_list[row] for row in rows]
+
+    def show_picture(self, index):
+        self.picture_show.show_index(index.row())
+
+    def rotate_selected(self, degrees):
+        if not (picture_ids := self.selected_ids()):
+            return
+
+        self.picture_show.writer.submit(
+            f"rotate {len(picture_ids)} pictures",
+            self.picture_show.picdb.rotate_pictures,
+            picture_ids,
+            degrees,
+            callback=lambda _: self.refresh(picture_ids),
+        )
+
+    def confirm_selected(self):
+        if picture_ids := self.selected_ids():
+            self.picture_show.submit_changes(
+                picture_ids, True, callback=self.refresh
+            )
+
+    def reset_selected(self):
+        if picture_ids := self.selected_ids():
+            self.picture_show.submit_changes(
+                picture_ids, False, callback=self.refresh
+            )
+
+    def edit_selected(self):
+        if picture_ids := self.selected_ids():
+            self.picture_show.bulk_edit(picture_ids, callback=self.refresh)
+
+    def refresh(self, picture_ids):
+        picture_cache.invalidate(picture_ids)
+        self.model.invalidate(picture_ids)
+        if self.picture_show.picture_id in picture_ids:
+            self.picture_show.select_pic(self.picture_show.picture_id)
 
 
 class PictureShow(QWidget):
     def __init__(self, argv):
         super().__init__()
-        self.db_filter, self.id_list = parse_argv(argv)
+        self.db_filter, self.id_list, self.selection = parse_argv(argv)
         self.picdb = PictureDb()
+        self.loader = PictureLoader()
+        self.loader.loaded.connect(self.picture_loaded)
+        self.writer = DbWorker("database write")
+        self.reader = DbWorker("database read")
+        self.picture_id = None
+        self.grid = None
+        self.image = None
         self.rotate = None
         self.index = None
         self.total = None
@@ -223,8 +805,10 @@ class PictureShow(QWidget):
         self.lat_lon_str = ""
         self.lat_lon_val = (None, None, None)
         self.initUI()
-        if self.id_list:
-            self.id_list = self.picdb.filter_ids(self.id_list, db_filter=self.db_filter)
+        if self.id_list or self.selection:
+            self.id_list = self.picdb.filter_ids(
+                self.id_list, db_filter=self.db_filter, selection=self.selection
+            )
             self.update_id_list()
             self.show_picture()
 
@@ -256,6 +840,18 @@ class PictureShow(QWidget):
         vbox_text_action.addWidget(QHLine())
         vbox_text_action.addLayout(formbox)
         vbox_text_action.addStretch()
+        hbox_status = QHBoxLayout()
+        self.status_lbl = QLabel()
+        self.retry_button = QPushButton("Retry")
+        self.retry_button.clicked.connect(self.writer.retry)
+        self.retry_button.setVisible(False)
+        hbox_status.addWidget(self.status_lbl)
+        hbox_status.addWidget(self.retry_button)
+        hbox_status.addStretch()
+        vbox_text_action.addLayout(hbox_status)
+        self.writer.changed.connect(self.show_status)
+        self.reader.changed.connect(self.show_status)
+        self.show_status()
 
         hbox_pic_action.addWidget(self.pic_lbl)
         hbox_pic_action.addLayout(vbox_text_action)
@@ -278,10 +874,15 @@ class PictureShow(QWidget):
         dateselect_button = QPushButton("Select date")
         dateselect_button.clicked.connect(self.cntr_dateselect)
 
+        grid_button = QPushButton("Grid")
+        grid_button.clicked.connect(self.cntr_grid)
+
         confirm_rotations_button = QPushButton("Confirm changes")
         confirm_rotations_button.clicked.connect(self.cntr_confirm_changes)
         reset_rotations_button = QPushButton("Reset")
         reset_rotations_button.clicked.connect(self.cntr_reset_changes)
+        bulk_edit_button = QPushButton("Bulk edit")
+        bulk_edit_button.clicked.connect(self.cntr_bulk_edit)
 
         # hbox_buttons.addStretch()
         hbox_buttons.setAlignment(Qt.AlignmentFlag.AlignLeft)
@@ -291,8 +892,10 @@ class PictureShow(QWidget):
         hbox_buttons.addWidget(clockwise_button)
         hbox_buttons.addWidget(prev_button)
         hbox_buttons.addWidget(next_button)
+        hbox_buttons.addWidget(grid_button)
         hbox_buttons.addWidget(confirm_rotations_button)
         hbox_buttons.addWidget(reset_rotations_button)
+        hbox_buttons.addWidget(bulk_edit_button)
         hbox_buttons.addWidget(save_button)
         hbox_buttons.addWidget(quit_button)
 
@@ -311,7 +914,12 @@ class PictureShow(QWidget):
         self.show()
 
     def show_picture(self):
-        pixmap = pil2pixmap(self.image)
+        if self.image is None:
+            print(self.id_list[self.index])
+            return
+
+        # the stored thumbnail is at rotation 0, the rotation is only displayed
+        pixmap = pil2pixmap(exif.rotate_image(self.image, self.rotate))
         if not pixmap:
             print(self.id_list[self.index])
             return
@@ -344,28 +952,44 @@ class PictureShow(QWidget):
         self.resize(self.sizeHint())
 
     def rotate_clockwise(self):
-        # note degrees are defined in counter clockwise direction !
+        # rotate is in degrees clockwise and stored on save
         if self.image:
-            self.image = self.image.rotate(
-                -90, expand=True, resample=Image.Resampling.BICUBIC
-            )
             self.rotate += 90
             self.rotate = self.rotate % 360
             self.pic_meta.rotate = self.rotate
             self.show_picture()
 
     def rotate_anticlockwise(self):
-        # note degrees are defined in counter clockwise direction !
         if self.image:
-            self.image = self.image.rotate(
-                +90, expand=True, resample=Image.Resampling.BICUBIC
-            )
             self.rotate -= 90
             self.rotate = self.rotate % 360
             self.pic_meta.rotate = self.rotate
             self.show_picture()
 
     def select_pic(self, picture_id):
+        """show the picture from the cache or load it in the background, the
+        neighbouring pictures in id_list are prefetched
+        """
+        self.picture_id = picture_id
+        if picture_meta := picture_cache.get(picture_id):
+            self.set_picture(picture_meta)
+
+        else:
+            self.loader.request(picture_id, priority=1)
+
+        if self.index is not None:
+            self.loader.prefetch(self.id_list, self.index)
+
+    def picture_loaded(self, picture_id, generation, picture_meta):
+        self.loader.done(picture_id)
+        if (
+            picture_meta
+            and picture_id == self.picture_id
+            and generation == self.loader.generation
+        ):
+            self.set_picture(picture_meta)
+
+    def set_picture(self, picture_meta):
         (
             self.image,
             self.pic_meta,
@@ -373,7 +997,7 @@ class PictureShow(QWidget):
             self.info_meta,
             self.lat_lon_str,
             self.lat_lon_val,
-        ) = self.picdb.load_picture_meta(picture_id)
+        ) = picture_meta
 
         if self.pic_meta:
             self.rotate = self.pic_meta.rotate
@@ -398,12 +1022,38 @@ class PictureShow(QWidget):
         self.select_pic(self.id_list[self.index])
 
     def cntr_save(self):
-        if self.index is None:
+        if self.index is None or not self.pic_meta or not self.pic_meta.dirty:
+            return
+
+        # the picture shown, which may lag behind index while it is loading
+        picture_id = self.pic_meta.id
+        self.writer.submit(
+            f"save picture {picture_id}",
+            self.picdb.store_attributes,
+            picture_id,
+            copy.copy(self.pic_meta),
+            callback=lambda _: picture_cache.invalidate([picture_id]),
+        )
+        # the task has its own copy of the changes, retried if it fails
+        self.pic_meta.dirty.clear()
+
+    def show_index(self, index):
+        if 0 <= index < len(self.id_list):
+            self.index = index
+            self.select_pic(self.id_list[self.index])
+
+    def cntr_grid(self):
+        if self.grid and self.grid.isVisible():
+            self.grid.activateWindow()
             return
 
-        self.picdb.store_attributes(self.id_list[self.index], self.image, self.pic_meta)
+        self.grid = GridView(self)
 
     def update_id_list(self):
+        self.loader.cancel()
+        if self.grid:
+            self.grid.model.set_ids(self.id_list)
+
         if self.id_list:
             self.index = 0
             self.total = len(self.id_list)
@@ -415,47 +1065,169 @@ class PictureShow(QWidget):
             self.select_pic(-1)
 
     def cntr_folderselect(self):
-        folder_dialog = FolderDialog(self.picdb.get_file_paths(), self)
-        if folder_dialog.exec():
-            folder = (
-                str(PureWindowsPath(folder_dialog.folder)).lower().replace("\\", "\\\\")
+        self.reader.submit(
+            "get folders", self.picdb.get_folder_tree, callback=self.select_folder
+        )
+
+    def select_folder(self, tree):
+        folder_dialog = FolderDialog(tree, self)
+        if folder_dialog.exec() and (node := folder_dialog.folder):
+            self.reader.submit(
+                f"select folder {node.name}",
+                self.picdb.select_ids,
+                folder_ids=node.folder_ids(),
+                db_filter=self.db_filter,
+                order_by="name",
+                callback=self.set_id_list,
             )
-            id_list = self.picdb.get_ids_by_folder(folder)
-            self.id_list = self.picdb.filter_ids(id_list, db_filter=self.db_filter)
-            self.update_id_list()
 
     def cntr_dateselect(self):
         date_dialog = DateDialog(self)
         if date_dialog.exec():
-            id_list = self.picdb.get_ids_by_date(date_dialog.date)
-            self.id_list = self.picdb.filter_ids(id_list, db_filter=self.db_filter)
-            self.update_id_list()
+            self.reader.submit(
+                f"select date {date_dialog.date}",
+                self.picdb.select_ids,
+                date_from=date_dialog.date,
+                db_filter=self.db_filter,
+                order_by="created",
+                callback=self.set_id_list,
+            )
+
+    def set_id_list(self, id_list):
+        self.id_list = id_list
+        self.update_id_list()
 
     def cntr_confirm_changes(self):
-        self.picdb.set_rotate_check(self.id_list, set_value=True)
-        self.picdb.populate_locations_table(picture_ids=self.id_list)
+        self.submit_changes(self.id_list, True)
 
     def cntr_reset_changes(self):
-        self.picdb.set_rotate_check(self.id_list, set_value=False)
-        self.picdb.remove_from_locations_table(picture_ids=self.id_list)
+        self.submit_changes(self.id_list, False)
+
+    def submit_changes(self, id_list, confirm, callback=None):
+        """confirm or reset the rotate check of the pictures in id_list, in
+        chunks so the progress shows and a failure only affects its chunk.
+        callback is called with the ids of each chunk when it is done.
+        """
+        action = "confirm" if confirm else "reset"
+        for i in range(0, len(id_list), write_chunk_size):
+            id_chunk = list(id_list[i : i + write_chunk_size])
+            self.writer.submit(
+                f"{action} pictures {id_chunk[0]} ... {id_chunk[-1]}",
+                self.confirm_changes if confirm else self.reset_changes,
+                id_chunk,
+                callback=(lambda _, ids=id_chunk: callback(ids)) if callback else None,
+            )
+
+    def confirm_changes(self, id_list):
+        """runs in the writer thread"""
+        self.picdb.set_rotate_check(id_list, set_value=True)
+        self.picdb.populate_locations_table(picture_ids=id_list)
+        picture_cache.invalidate(id_list)
+
+    def reset_changes(self, id_list):
+        """runs in the writer thread"""
+        self.picdb.set_rotate_check(id_list, set_value=False)
+        self.picdb.remove_from_locations_table(picture_ids=id_list)
+        picture_cache.invalidate(id_list)
+
+    def cntr_bulk_edit(self):
+        if self.id_list:
+            self.bulk_edit(self.id_list)
+
+    def bulk_edit(self, id_list, callback=None):
+        """apply the attributes of the bulk edit dialog to all pictures in id_list
+        in a single transaction
+        """
+        dialog = BulkEditDialog(len(id_list), self)
+        if not dialog.exec() or not (attributes := dialog.attributes):
+            return
+
+        id_list = list(id_list)
+
+        def bulk_edit_done(_):
+            if callback:
+                callback(id_list)
+                return
+
+            picture_cache.invalidate(id_list)
+            if self.grid:
+                self.grid.model.invalidate(id_list)
+
+            if self.picture_id in id_list:
+                self.select_pic(self.picture_id)
+
+        self.writer.submit(
+            f"edit {len(id_list)} pictures",
+            self.picdb.bulk_update_attributes,
+            id_list,
+            callback=bulk_edit_done,
+            **attributes,
+        )
+
+    def show_status(self):
+        status = []
+        if self.reader.pending:
+            status.append("loading ...")
+
+        if self.writer.pending:
+            status.append(f"saving, {self.writer.pending} pending ...")
+
+        if failed_tasks := self.writer.failed_tasks + self.reader.failed_tasks:
+            status.append(f"{len(failed_tasks)} failed")
+            self.status_lbl.setToolTip(
+                "\n".join(f"{task.description}: {task.error}" for task in failed_tasks)
+            )
+
+        else:
+            self.status_lbl.setToolTip("")
+
+        self.status_lbl.setText(", ".join(status) if status else "saved")
+        self.retry_button.setVisible(bool(self.writer.failed_tasks))
 
     def update_attributes(self):
-        if self.index is None:
+        """set the fields edited by the user, pic_meta tracks the changed fields
+        so only these are saved
+        """
+        if self.index is None or not self.pic_meta:
             return
 
-        self.pic_meta.camera_make = self.e_make.text()
-        self.pic_meta.camera_model = self.e_model.text()
-        self.pic_meta.date_picture = exif.format_date(self.e_pic_date.text())
-        (
-            self.pic_meta.gps_latitude,
-            self.pic_meta.gps_longitude,
-            self.pic_meta.gps_altitude,
-            self.pic_meta.gps_img_direction,
-        ) = exif.serialize_decimalgps(self.e_lat_lon.text())
+        if self.e_make.isModified():
+            self.pic_meta.camera_make = self.e_make.text()
+
+        if self.e_model.isModified():
+            self.pic_meta.camera_model = self.e_model.text()
+
+        if self.e_pic_date.isModified():
+            self.pic_meta.date_picture = exif.format_date(self.e_pic_date.text())
+
+        if self.e_lat_lon.isModified():
+            (
+                self.pic_meta.gps_latitude,
+                self.pic_meta.gps_longitude,
+                self.pic_meta.gps_altitude,
+                self.pic_meta.gps_img_direction,
+            ) = exif.serialize_decimalgps(self.e_lat_lon.text())
+
+        for line_edit in [self.e_make, self.e_model, self.e_pic_date, self.e_lat_lon]:
+            line_edit.setModified(False)
 
     def cntr_quit(self):
         self.close()
 
+    def closeEvent(self, event):
+        self.loader.cancel()
+        if self.grid:
+            self.grid.close()
+
+        if self.writer.pending:
+            print(f"waiting for {self.writer.pending} database writes ...")
+            self.writer.wait()
+
+        for task in self.writer.failed_tasks:
+            print(f"not saved: {task.description}, error: {task.error}")
+
+        event.accept()
+
 
 def main():
     app = QApplication([])